@@ -0,0 +1,62 @@
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "src", "tests"))
+from async_scenarios import summary_lines  # noqa: E402
+from async_steps import run_features  # noqa: E402
+
+
+def run_sync(test_path, markers=None):
+    """
+    Run the pytest-bdd scenarios with the sync fixtures and return (tests, passed, wall seconds).
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        junit = os.path.join(directory, "results.xml")
+        command = [sys.executable, "-m", "pytest", "-q", "-p", "no:cacheprovider",
+                   test_path, f"--junitxml={junit}"]
+        if markers:
+            command += ["-m", markers]
+        started = time.monotonic()
+        subprocess.run(command, cwd=ROOT)
+        wall = time.monotonic() - started
+        suite = ET.parse(junit).getroot().find("testsuite")
+        tests = int(suite.get("tests"))
+        not_passed = sum(int(suite.get(name)) for name in ("failures", "errors", "skipped"))
+    return tests, tests - not_passed, wall
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare scenario throughput of the sync pytest fixtures and the async runner")
+    parser.add_argument("-features", default=os.path.join(ROOT, "src", "features"),
+                        help="Feature file or directory")
+    parser.add_argument("-tests", default=os.path.join("src", "tests", "test_homepage_login.py"),
+                        help="pytest file binding the same scenarios for the sync run")
+    parser.add_argument("-concurrency", type=int, default=4,
+                        help="Scenarios the async runner runs at the same time")
+    parser.add_argument("-tags", nargs="*", default=None,
+                        help="Only run scenarios with one of these tags")
+    parser.add_argument("-skip_sync", action="store_true",
+                        help="Only run the async path")
+    args = parser.parse_args()
+
+    results, wall = asyncio.run(run_features([args.features], args.concurrency, args.tags))
+    print("async:")
+    for line in summary_lines(results, wall):
+        print(line)
+    async_throughput = len(results) / wall * 60
+
+    if not args.skip_sync:
+        tests, passed, sync_wall = run_sync(args.tests, " or ".join(args.tags or []) or None)
+        sync_throughput = tests / sync_wall * 60
+        print(f"sync: {tests} scenarios ({passed} passed) in {sync_wall:.1f}s: "
+              f"{sync_throughput:.1f} scenarios/min")
+        if sync_throughput:
+            print(f"async/sync throughput: {async_throughput / sync_throughput:.2f}x")
@@ -0,0 +1,58 @@
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "tests"))
+from playwright.sync_api import sync_playwright  # noqa: E402
+
+import browser_server  # noqa: E402
+
+
+def time_start(start, runs):
+    """
+    Seconds from asking for a browser to having a page open in a new context, per run.
+    """
+    seconds = []
+    for _ in range(runs):
+        started = time.monotonic()
+        browser = start()
+        context = browser.new_context()
+        context.new_page()
+        seconds.append(time.monotonic() - started)
+        context.close()
+        browser.close()
+    return seconds
+
+
+def print_times(name, seconds):
+    print(f"{name}: median {statistics.median(seconds) * 1000:.0f} ms, "
+          f"min {min(seconds) * 1000:.0f} ms, max {max(seconds) * 1000:.0f} ms ({len(seconds)} runs)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare launching Chromium with connecting to the persistent browser server")
+    parser.add_argument("-runs", type=int, default=10, help="Launches and connections to time")
+    args = parser.parse_args()
+
+    options = browser_server.launch_options()
+    # A server of its own, so the one of local runs is left alone
+    path = os.path.join(tempfile.mkdtemp(), "browser_server.json")
+    with sync_playwright() as playwright:
+        cold = time_start(lambda: playwright.chromium.launch(**options), args.runs)
+        started = time.monotonic()
+        browser_server.ensure_server(options, path)
+        server_start = time.monotonic() - started
+        try:
+            connected = time_start(
+                lambda: browser_server.connect(playwright.chromium, options, path), args.runs)
+        finally:
+            browser_server.stop_server(path)
+
+    print_times("launch", cold)
+    print(f"server start (once): {server_start * 1000:.0f} ms")
+    print_times("connect", connected)
+    print(f"saved per run: {(statistics.median(cold) - statistics.median(connected)) * 1000:.0f} ms")
@@ -0,0 +1,110 @@
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "src", "tests"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import http_client  # noqa: E402
+from fake_server import parse_latency  # noqa: E402
+from fake_services import FakeServices  # noqa: E402
+
+SENDER = dict(sender_email="service@dogcatstar.com", sender_name="汪喵星球")
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))]
+
+
+def bench_waits(count, delivery, wait, deliver):
+    """
+    Run `count` OTP waits at once, each code delivered after a sampled delay.
+    Returns the seconds from delivery to the wait returning.
+    """
+    rng = random.Random(0)
+    delays = [delivery(rng) for _ in range(count)]
+
+    def run(index):
+        delivered = {}
+
+        def send():
+            deliver(index)
+            delivered["at"] = time.monotonic()
+
+        timer = threading.Timer(delays[index], send)
+        timer.start()
+        wait(index)
+        timer.join()
+        return time.monotonic() - delivered["at"]
+
+    with ThreadPoolExecutor(max_workers=count) as executor:
+        return list(executor.map(run, range(count)))
+
+
+def print_latencies(name, latencies):
+    print(f"{name}: {len(latencies)} codes, delivery to code p50 "
+          f"{percentile(latencies, 50) * 1000:.0f} ms, p95 {percentile(latencies, 95) * 1000:.0f} ms, "
+          f"max {max(latencies) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the OTP waiters and the TestRail uploader against the local fakes")
+    parser.add_argument("-faults", default="latency=lognormal:80:300,rate=8,errors=0.02",
+                        help="Faults the fakes inject (see fake_server.Faults.from_spec)")
+    parser.add_argument("-waits", type=int, default=8,
+                        help="Concurrent email and SMS verification code waits")
+    parser.add_argument("-delivery", default="uniform:500:3000",
+                        help="Delay before each code is delivered, as a latency spec in ms")
+    parser.add_argument("-results", type=int, default=500,
+                        help="Results uploaded to the fake TestRail")
+    parser.add_argument("-chunk_size", type=int, default=100,
+                        help="Results per add_results_for_cases request")
+    args = parser.parse_args()
+
+    with FakeServices(args.faults) as services:
+        services.install()
+        from mailtm_waiter import wait_for_verification_code
+        from twilio_sms import wait_for_sms_code
+        import testrail
+
+        delivery = parse_latency(args.delivery)
+        inboxes = [services.mailtm.add_account(f"bench{index}@dogcat.fake", "secret")
+                   for index in range(args.waits)]
+        email = bench_waits(
+            args.waits, delivery,
+            lambda index: wait_for_verification_code(
+                {"Authorization": f"Bearer {inboxes[index]['token']}"}, SENDER, timeout=120),
+            lambda index: services.mailtm.deliver(
+                inboxes[index]["address"], SENDER["sender_email"], SENDER["sender_name"],
+                f"您的驗證碼為 {index:06d}"))
+        print_latencies("email", email)
+
+        phones = [{"region_code": "+886", "phone_number": f"9000{index:05d}"}
+                  for index in range(args.waits)]
+        requested_at = datetime.now(timezone.utc)
+        sms = bench_waits(
+            args.waits, delivery,
+            lambda index: wait_for_sms_code(phones[index], requested_at, timeout=120),
+            lambda index: services.twilio.send_sms(
+                f"+886{phones[index]['phone_number']}", f"您的驗證碼為 {index:06d}"))
+        print_latencies("sms", sms)
+
+        results = [{"case_id": index + 1, "status_id": 1, "comment": "Benchmark result",
+                    "test_name": f"test_login_caseid_{index + 1}"} for index in range(args.results)]
+        started = time.monotonic()
+        failed = testrail.upload_results_in_bulk(1, results, chunk_size=args.chunk_size)
+        print(f"testrail: {args.results} results in {time.monotonic() - started:.2f}s, "
+              f"{len(failed)} chunks failed")
+
+        print("external HTTP latency:")
+        for line in http_client.latency_summary_lines():
+            print(f"    {line}")
+        for line in services.summary_lines():
+            print(line)
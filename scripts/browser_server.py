@@ -0,0 +1,32 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "tests"))
+import browser_server  # noqa: E402
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Start, stop or check the Chromium server pytest --browser-server connects to")
+    parser.add_argument("action", choices=("start", "stop", "status"))
+    parser.add_argument("-path", default=browser_server.SERVER_PATH,
+                        help="File keeping the server's websocket endpoint")
+    parser.add_argument("-headed", action="store_true", help="Show the browser window")
+    args = parser.parse_args()
+
+    if args.action == "start":
+        state = browser_server.ensure_server(
+            browser_server.launch_options(headless=not args.headed), args.path)
+        print(f"Browser server {state['pid']} listening on {state['ws_endpoint']}")
+    elif args.action == "stop":
+        print("Stopped the browser server" if browser_server.stop_server(args.path)
+              else "No browser server was running")
+    else:
+        state = browser_server.load_state(args.path)
+        if not browser_server.is_healthy(state):
+            print("No browser server is running")
+            sys.exit(1)
+        print(f"Browser server {state['pid']} listening on {state['ws_endpoint']}, "
+              f"up {time.time() - state['started_at']:.0f}s")
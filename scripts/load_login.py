@@ -0,0 +1,48 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "src", "tests"))
+from load_mode import build_report, load_accounts, report_lines, run_load  # noqa: E402
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Load the login backend with the BDD login scenarios as virtual users")
+    parser.add_argument("-features", default=os.path.join(ROOT, "src", "features"),
+                        help="Feature file or directory")
+    parser.add_argument("-users", type=int, default=10,
+                        help="Concurrent virtual users")
+    parser.add_argument("-ramp_up", type=float, default=30,
+                        help="Seconds until every user has started")
+    parser.add_argument("-rate", type=float, default=None,
+                        help="Target iterations per second across all users (default: as fast as possible)")
+    parser.add_argument("-duration", type=float, default=300,
+                        help="Seconds to keep starting iterations")
+    parser.add_argument("-iterations", type=int, default=None,
+                        help="Iterations per user, instead of running for the whole duration")
+    parser.add_argument("-browsers", type=int, default=2,
+                        help="Chromium instances the users' contexts are spread over")
+    parser.add_argument("-tags", nargs="*", default=None,
+                        help="Only run scenarios with one of these tags")
+    parser.add_argument("-accounts", default=None,
+                        help="JSON list of account sets, one per user (see load_mode.load_accounts)")
+    parser.add_argument("-report", default=os.path.join("results", "load_report.json"),
+                        help="Where to write the JSON report")
+    args = parser.parse_args()
+
+    try:
+        records, wall = asyncio.run(run_load(
+            [args.features], args.users, args.ramp_up, args.rate, args.duration, args.iterations,
+            args.browsers, args.tags, load_accounts(args.accounts)))
+    except ValueError as e:
+        parser.error(str(e))
+    report = build_report(records, wall)
+    for line in report_lines(report):
+        print(line)
+    os.makedirs(os.path.dirname(args.report) or ".", exist_ok=True)
+    with open(args.report, "w") as f:
+        json.dump(dict(report, iterations_detail=records), f, ensure_ascii=False, indent=2)
@@ -1,22 +1,31 @@
 import argparse
+import hashlib
+import json
 import os
+import sys
+import threading
 import xml.etree.ElementTree as ET
-import requests
 import re
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
 
 from dotenv import load_dotenv
 
+sys.path.insert(0, os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), "..", "src", "tests"))
+import http_client  # noqa: E402
+
 # Load .env file
 load_dotenv(dotenv_path="configs/.env")
 
+DEFAULT_CHUNK_SIZE = 100
+DEFAULT_WORKERS = 4
+DEFAULT_LEDGER = os.path.join("results", ".testrail_ledger.jsonl")
 
-def add_result_for_test(run_id, case_id, status_id, comment=None):
+
+def testrail_settings():
     """
-    Update test result to TestRail
-    :param run_id: TestRail run ID
-    :param case_id: TestRail case ID
-    :param status_id: TestRail status ID (1: Passed, 5: Failed, 2: Blocked)
-    :param comment: test comment
+    TestRail API base URL and basic auth from the environment.
     """
     TESTRAIL_URL = os.getenv("TESTRAIL_URL")
     TESTRAIL_ACCOUNT = os.getenv("TESTRAIL_ACCOUNT")
@@ -25,62 +34,245 @@ def add_result_for_test(run_id, case_id, status_id, comment=None):
     if not TESTRAIL_URL or not TESTRAIL_ACCOUNT or not TESTRAIL_TOKEN:
         raise EnvironmentError(
             "TestRail environment variables are not set correctly.")
+    return TESTRAIL_URL, (TESTRAIL_ACCOUNT, TESTRAIL_TOKEN)
+
+
+def add_result_for_test(run_id, case_id, status_id, comment=None):
+    """
+    Update test result to TestRail
+    :param run_id: TestRail run ID
+    :param case_id: TestRail case ID
+    :param status_id: TestRail status ID (1: Passed, 5: Failed, 2: Blocked)
+    :param comment: test comment
+    """
+    TESTRAIL_URL, auth = testrail_settings()
 
     url = f"{TESTRAIL_URL}/add_result_for_case/{run_id}/{case_id}"
     headers = {"Content-Type": "application/json"}
-    auth = (TESTRAIL_ACCOUNT, TESTRAIL_TOKEN)
     payload = {
         "status_id": status_id,
         "comment": comment or "Test result uploaded via automation."
     }
 
-    response = requests.post(url, headers=headers, auth=auth, json=payload)
+    response = http_client.post(url, headers=headers, auth=auth, json=payload)
     if response.status_code == 200:
         print(
             f"Successfully added result for case_id {case_id} in run_id {run_id}.")
-    else:
-        print(
-            f"Failed to add result for case_id {case_id}: {response.status_code} - {response.text}")
+        return True
+    print(
+        f"Failed to add result for case_id {case_id}: {response.status_code} - {response.text}")
+    return False
 
 
-def parse_pytest_results(xml_file, run_id):
+def add_results_for_cases(run_id, results):
     """
-    analysis pytest generated JUnit XML and update result to TestRail
-    :param xml_file: pytest test result file (XML format)
+    Upload several results to TestRail in one add_results_for_cases request
     :param run_id: TestRail run ID
+    :param results: list of dicts with case_id, status_id and comment
+    :return: True when TestRail accepted the results
     """
-    tree = ET.parse(xml_file)
-    root = tree.getroot()
+    TESTRAIL_URL, auth = testrail_settings()
 
-    for testcase in root.iter("testcase"):
-        test_name = testcase.get("name")
-        if not test_name:
-            continue
+    url = f"{TESTRAIL_URL}/add_results_for_cases/{run_id}"
+    headers = {"Content-Type": "application/json"}
+    payload = {"results": [
+        {"case_id": result["case_id"], "status_id": result["status_id"],
+         "comment": result["comment"]}
+        for result in results
+    ]}
+
+    # 429 responses are retried by http_client after TestRail's Retry-After delay
+    response = http_client.post(url, headers=headers, auth=auth, json=payload)
+    if response.status_code == 200:
+        print(
+            f"Successfully added {len(results)} results in run_id {run_id}.")
+        return True
+    print(
+        f"Failed to add {len(results)} results in run_id {run_id}: {response.status_code} - {response.text}")
+    return False
 
+
+def build_result(test_name, failure_text=None, failed=False, case_id=None):
+    """
+    TestRail result of one pytest test, or None when the test has no case_id
+    :param test_name: pytest test name, e.g. test_login_caseid_1[param-id]
+    :param failure_text: failure details, if the test failed
+    :param failed: whether the test failed
+    :param case_id: TestRail case ID; parsed from the test name when not given
+    """
+    if case_id is None:
         # extract case_id
         # Split and process only before the parameterized part
         match = re.search(r"caseid_(\d+)", test_name.split("[")[0])
         if not match:
-            print(f"Skipping test without valid case_id: {test_name}")
-            continue
+            return None
         case_id = int(match.group(1))  # Extract case_id as an integer
-        login_info = test_name.split("[")[
-            1][:-1] if "[" in test_name else "No additional info"
+    login_info = test_name.split("[")[
+        1][:-1] if "[" in test_name else "No additional info"
 
-        # check test status
-        # Determine test status
-        if testcase.find("failure") is not None:
-            status_id = 5  # Failed
-            failure_details = testcase.find(
-                "failure").text or "No failure details provided."
-            comment = f"Test failed. {failure_details}\nLogin Info: {login_info}"
-        else:
-            status_id = 1  # Passed
-            comment = f"Test passed successfully.\nLogin Info: {login_info}"
+    # Determine test status
+    if failed:
+        status_id = 5  # Failed
+        failure_details = failure_text or "No failure details provided."
+        comment = f"Test failed. {failure_details}\nLogin Info: {login_info}"
+    else:
+        status_id = 1  # Passed
+        comment = f"Test passed successfully.\nLogin Info: {login_info}"
+    return {"case_id": case_id, "status_id": status_id,
+            "comment": comment, "test_name": test_name}
 
-        print('case_id: ', case_id, 'result: ',
-              status_id, 'comment: ', comment)
-        add_result_for_test(run_id, case_id, status_id, comment)
+
+def collect_results(xml_file):
+    """
+    Stream pytest generated JUnit XML and yield the TestRail results it contains.
+    Each testcase element is dropped once read, so memory stays flat for huge files.
+    :param xml_file: pytest test result file (XML format)
+    """
+    parents = []
+    for event, element in ET.iterparse(xml_file, events=("start", "end")):
+        if event == "start":
+            parents.append(element)
+            continue
+        parents.pop()
+        if element.tag != "testcase":
+            continue
+
+        test_name = element.get("name")
+        failure = element.find("failure")
+        result = build_result(
+            test_name,
+            failure.text if failure is not None else None,
+            failure is not None) if test_name else None
+        element.clear()
+        if parents:
+            parents[-1].remove(element)
+        if result is None:
+            if test_name:
+                print(f"Skipping test without valid case_id: {test_name}")
+            continue
+        yield result
+
+
+class UploadLedger:
+    """
+    Results already uploaded to TestRail, keyed by (run_id, case_id, test name, result hash).
+    Appended after every accepted upload so an interrupted sync resumes where it stopped.
+    """
+
+    def __init__(self, path=DEFAULT_LEDGER):
+        self.path = path
+        self.keys = set()
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path) as f:
+                self.keys = {json.loads(line)["key"] for line in f if line.strip()}
+
+    @staticmethod
+    def key(run_id, result):
+        result_hash = hashlib.sha256(
+            f"{result['status_id']}\n{result['comment']}".encode()).hexdigest()
+        return f"{run_id}:{result['case_id']}:{result['test_name']}:{result_hash}"
+
+    def __contains__(self, entry):
+        run_id, result = entry
+        return self.key(run_id, result) in self.keys
+
+    def record(self, run_id, results):
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a") as f:
+                for result in results:
+                    key = self.key(run_id, result)
+                    self.keys.add(key)
+                    f.write(json.dumps({"key": key}) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+
+def pending_results(run_id, results, ledger):
+    """
+    Drop the results the ledger says were already uploaded
+    """
+    skipped = 0
+    for result in results:
+        if ledger is not None and (run_id, result) in ledger:
+            skipped += 1
+            continue
+        yield result
+    if skipped:
+        print(f"Skipped {skipped} results already uploaded to run_id {run_id}.")
+
+
+def parse_pytest_results(xml_file, run_id, ledger=None):
+    """
+    analysis pytest generated JUnit XML and update result to TestRail
+    :param xml_file: pytest test result file (XML format)
+    :param run_id: TestRail run ID
+    :param ledger: UploadLedger of results already uploaded
+    """
+    for result in pending_results(run_id, collect_results(xml_file), ledger):
+        print('case_id: ', result["case_id"], 'result: ',
+              result["status_id"], 'comment: ', result["comment"])
+        if add_result_for_test(run_id, result["case_id"],
+                               result["status_id"], result["comment"]) and ledger is not None:
+            ledger.record(run_id, [result])
+
+
+def chunked(results, chunk_size):
+    results = iter(results)
+    while True:
+        chunk = list(islice(results, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def upload_results_in_bulk(run_id, results, chunk_size=DEFAULT_CHUNK_SIZE,
+                           workers=DEFAULT_WORKERS, dry_run=False, ledger=None):
+    """
+    Upload results through add_results_for_cases, several chunks at a time
+    :param run_id: TestRail run ID
+    :param results: results from collect_results
+    :param chunk_size: results per request
+    :param workers: chunks uploaded concurrently
+    :param dry_run: print the requests instead of sending them
+    :param ledger: UploadLedger; uploaded results are skipped and accepted ones recorded
+    :return: the chunks TestRail did not accept
+    """
+    chunks = chunked(pending_results(run_id, results, ledger), chunk_size)
+    if dry_run:
+        for chunk in chunks:
+            print(f"[dry run] POST add_results_for_cases/{run_id}")
+            print(json.dumps({"results": [
+                {key: result[key] for key in ("case_id", "status_id", "comment")}
+                for result in chunk]}, ensure_ascii=False, indent=2))
+        return []
+
+    failed_chunks = []
+
+    def finish(future, chunk):
+        try:
+            accepted = future.result()
+        except Exception as e:
+            print(f"Failed to upload chunk: {e}")
+            accepted = False
+        if not accepted:
+            failed_chunks.append(chunk)
+        elif ledger is not None:
+            ledger.record(run_id, chunk)
+
+    # Keep at most `workers` chunks in flight so the XML is only read as fast as it uploads
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        in_flight = {}
+        for chunk in chunks:
+            if len(in_flight) >= workers:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    finish(future, in_flight.pop(future))
+            in_flight[executor.submit(add_results_for_cases, run_id, chunk)] = chunk
+        for future in list(in_flight):
+            finish(future, in_flight.pop(future))
+    return failed_chunks
 
 
 if __name__ == "__main__":
@@ -88,6 +280,18 @@ if __name__ == "__main__":
         description="Upload pytest results to TestRail")
     parser.add_argument("-run_id", required=True, type=int,
                         help="TestRail Test Run ID")
+    parser.add_argument("-bulk", action="store_true",
+                        help="Upload with add_results_for_cases in concurrent chunks")
+    parser.add_argument("-chunk_size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="Results per add_results_for_cases request")
+    parser.add_argument("-workers", type=int, default=DEFAULT_WORKERS,
+                        help="Chunks uploaded at the same time")
+    parser.add_argument("-dry_run", action="store_true",
+                        help="Print the bulk requests without sending them")
+    parser.add_argument("-ledger", default=DEFAULT_LEDGER,
+                        help="File recording the results already uploaded")
+    parser.add_argument("-force", action="store_true",
+                        help="Upload every result, ignoring the ledger")
     args = parser.parse_args()
 
     # Step 1: get pytest xml result
@@ -99,4 +303,16 @@ if __name__ == "__main__":
     # os.system(f"pytest --junitxml={pytest_results_file}")
 
     # Step 2
-    parse_pytest_results(pytest_results_file, args.run_id)
+    ledger = None if args.force else UploadLedger(args.ledger)
+    if args.bulk or args.dry_run:
+        failed_chunks = upload_results_in_bulk(
+            args.run_id, collect_results(pytest_results_file),
+            args.chunk_size, args.workers, args.dry_run, ledger)
+        http_client.print_latency_summary()
+        if failed_chunks:
+            failed = sum(len(chunk) for chunk in failed_chunks)
+            print(f"{failed} results in {len(failed_chunks)} chunks were not uploaded.")
+            sys.exit(1)
+    else:
+        parse_pytest_results(pytest_results_file, args.run_id, ledger)
+        http_client.print_latency_summary()
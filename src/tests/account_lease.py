@@ -0,0 +1,84 @@
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+LEASE_DIR = os.path.join(tempfile.gettempdir(), "dogcat-account-leases")
+
+
+def worker_id():
+    """
+    The pytest-xdist worker running this process, or "main" when not distributed.
+    """
+    return os.environ.get("PYTEST_XDIST_WORKER", "main")
+
+
+class AccountLeases:
+    """
+    Cross-process leases on test identities (login accounts, inboxes, phone numbers).
+
+    A lease is an exclusive flock on a lock file per key, so two pytest
+    workers can never hold the same account at once. The kernel drops the
+    lock when its process dies, so a crashed worker's leases are free again
+    without anyone having to reclaim them. Everything held is released by
+    `release_all()`.
+    """
+
+    def __init__(self, lease_dir=LEASE_DIR, timeout=600, poll_interval=0.5):
+        self.lease_dir = lease_dir
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.held = {}
+        os.makedirs(self.lease_dir, exist_ok=True)
+
+    def _path(self, key):
+        digest = hashlib.sha1(key.encode()).hexdigest()
+        return os.path.join(self.lease_dir, f"{digest}.lease")
+
+    def _try_acquire(self, key):
+        # The lock file is never removed: unlinking it would let a worker
+        # lock a new file while another still holds the old one
+        f = open(self._path(key), "a+")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+            return False
+        # Who holds the lease, for whoever looks at the lock file
+        f.truncate(0)
+        json.dump({"key": key, "pid": os.getpid(), "worker": worker_id(),
+                   "acquired_at": time.time()}, f)
+        f.flush()
+        self.held[key] = f
+        return True
+
+    def acquire(self, key):
+        """
+        Block until this worker holds `key`. Re-acquiring a held key is a no-op.
+        """
+        if key in self.held:
+            return
+        deadline = time.monotonic() + self.timeout
+        while not self._try_acquire(key):
+            if time.monotonic() >= deadline:
+                raise TimeoutError(
+                    f"Account {key} is still leased by another worker after {self.timeout}s.")
+            time.sleep(self.poll_interval)
+
+    def try_acquire(self, key):
+        """
+        Lease `key` if it is free, without waiting.
+        """
+        return key in self.held or self._try_acquire(key)
+
+    def release(self, key):
+        f = self.held.pop(key, None)
+        if f:
+            fcntl.flock(f, fcntl.LOCK_UN)
+            f.close()
+
+    def release_all(self):
+        for key in list(self.held):
+            self.release(key)
@@ -0,0 +1,119 @@
+import asyncio
+import time
+
+import pytest
+from pytest_bdd import parsers
+from pytest_bdd.feature import get_features
+
+
+class StepRegistry:
+    """
+    Async step implementations, matched against feature steps like pytest-bdd steps.
+
+    A step is `async def step(state, **arguments)`, where `state` is the
+    scenario's dict of values (the async counterpart of its fixtures) and the
+    arguments come from the step parser. With `target` the returned value is
+    stored in `state[target]`, like `target_fixture`.
+    """
+
+    def __init__(self):
+        self.steps = []
+
+    def step(self, step_type, name, target=None):
+        parser = parsers.get_parser(name)
+
+        def decorator(func):
+            self.steps.append((step_type, parser, target, func))
+            return func
+        return decorator
+
+    def given(self, name, target=None):
+        return self.step("given", name, target)
+
+    def when(self, name, target=None):
+        return self.step("when", name, target)
+
+    def then(self, name, target=None):
+        return self.step("then", name, target)
+
+    def find(self, step_type, name):
+        for registered_type, parser, target, func in self.steps:
+            if registered_type == step_type and parser.is_matching(name):
+                return func, parser.parse_arguments(name) or {}, target
+        raise ValueError(f"No async step matches: {step_type} {name}")
+
+
+def load_scenarios(paths, tags=None):
+    """
+    The scenarios of the feature files under `paths`, with outlines expanded
+    per example. With `tags`, only scenarios carrying one of them are kept.
+    """
+    scenarios = []
+    for feature in get_features(paths):
+        for template in feature.scenarios.values():
+            contexts = [context for examples in template.examples
+                        for context in examples.as_contexts()] or [{}]
+            for context in contexts:
+                scenario = template.render(context)
+                if not tags or scenario.tags & set(tags):
+                    scenarios.append(scenario)
+    return scenarios
+
+
+async def run_scenario(scenario, registry, state):
+    """
+    Run the steps of one scenario in order. Returns its result record; a
+    failing step ends the scenario and its error is kept in the record.
+    """
+    result = dict(feature=scenario.feature.rel_filename, scenario=scenario.name,
+                  passed=False, error=None, steps=[])
+    started = time.monotonic()
+    try:
+        for step in scenario.steps:
+            func, arguments, target = registry.find(step.type, step.name)
+            step_started = time.monotonic()
+            try:
+                value = await func(state, **arguments)
+            finally:
+                result["steps"].append(dict(step=f"{step.type} {step.name}",
+                                            seconds=time.monotonic() - step_started))
+            if target:
+                state[target] = value
+        result["passed"] = True
+    except (Exception, pytest.fail.Exception) as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["seconds"] = time.monotonic() - started
+    return result
+
+
+async def run_scenarios(scenarios, registry, open_state, close_state, concurrency=4):
+    """
+    Run scenarios concurrently in the current event loop, at most `concurrency` at a time.
+
+    `open_state(scenario)` prepares a scenario's state (e.g. its browser
+    context and page) and `close_state(state)` cleans it up. While one
+    scenario awaits a page or an OTP, the others keep running.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(scenario):
+        async with semaphore:
+            state = await open_state(scenario)
+            try:
+                return await run_scenario(scenario, registry, state)
+            finally:
+                await close_state(state)
+
+    return await asyncio.gather(*(run(scenario) for scenario in scenarios))
+
+
+def summary_lines(results, wall):
+    passed = sum(1 for result in results if result["passed"])
+    busy = sum(result["seconds"] for result in results)
+    lines = [f"{len(results)} scenarios ({passed} passed) in {wall:.1f}s: "
+             f"{len(results) / wall * 60 if wall else 0:.1f} scenarios/min, "
+             f"{busy / wall if wall else 0:.1f} running on average"]
+    for result in results:
+        status = "passed" if result["passed"] else f"failed: {result['error']}"
+        lines.append(f"    {result['seconds']:6.1f}s  {result['scenario']} ({status})")
+    return lines
@@ -0,0 +1,373 @@
+import asyncio
+import time
+
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError, async_playwright
+from pytest_bdd import parsers
+
+import browser_server
+import http_client
+import login_page
+import waits
+from account_lease import AccountLeases
+from async_scenarios import StepRegistry, load_scenarios, run_scenarios
+from mailtm_pool import MailtmPool
+from mailtm_waiter import wait_for_verification_code
+from network_filter import NetworkFilter
+from twilio_sms import wait_for_sms_code
+from web_perf import COLLECT_JS, OBSERVE_JS, WebPerfCollector, check_budget, is_login_api
+
+# The login steps of conftest.py for the async Playwright API. The blocking
+# mail.tm/Twilio waits run in worker threads and account leases are polled on
+# the event loop, so while one scenario waits for its code or account the
+# other scenarios keep driving their pages.
+STEPS = StepRegistry()
+
+STEP_TIMEOUT = waits.STEP_TIMEOUT
+
+
+async def open_state(browser, mailtm_pool, lease_timeout=600, otp_timeout=300, accounts=None):
+    """
+    A fresh context and page per scenario, configured like the sync `context` fixture.
+    `accounts` replaces the accounts of the Given steps, keyed by their target
+    ("user", "mail_account", "phone_info"), e.g. a virtual user's own accounts.
+    """
+    context = await browser.new_context(permissions=['geolocation'])
+    context.set_default_timeout(10000)
+    request_filter = NetworkFilter()
+    pattern = request_filter.pattern()
+    if pattern:
+        await context.route(pattern, request_filter.handle_async)
+    page = await context.new_page()
+    web_perf = WebPerfCollector()
+    await page.add_init_script(f"({OBSERVE_JS})()")
+    page.on("requestfinished", web_perf.record_request)
+    return dict(
+        context=context,
+        page=page,
+        web_perf=web_perf,
+        request_filter=request_filter,
+        leases=AccountLeases(timeout=lease_timeout),
+        mailtm_pool=mailtm_pool,
+        accounts=accounts or {},
+        otp_timeout=otp_timeout,
+        otp_request={"requested_at": None},
+        mailtm_headers={"Authorization": None},
+    )
+
+
+async def close_state(state):
+    await state["context"].close()
+    # Unlocking the lease files is quick, and doing it here rather than in a
+    # worker thread frees the accounts even when every thread is busy
+    state["leases"].release_all()
+
+
+async def lease(state, key):
+    """
+    Lease `key` like AccountLeases.acquire, but poll on the event loop, so
+    scenarios queued for a taken account do not each hold a worker thread.
+    """
+    leases = state["leases"]
+    deadline = time.monotonic() + leases.timeout
+    while not leases.try_acquire(key):
+        if time.monotonic() >= deadline:
+            raise TimeoutError(
+                f"Account {key} is still leased by another worker after {leases.timeout}s.")
+        await asyncio.sleep(leases.poll_interval)
+
+
+def account_for(state, target, account):
+    """
+    The account of a Given step, unless the state assigns its own for `target`.
+    """
+    return state["accounts"].get(target, account)
+
+
+async def wait_for_url_change(page, previous_url):
+    await page.wait_for_url(lambda url: url != previous_url, timeout=STEP_TIMEOUT)
+    await page.wait_for_load_state("domcontentloaded", timeout=STEP_TIMEOUT)
+
+
+@STEPS.given(parsers.parse("I am in {url} page"), target="url")
+async def given_url(state, url):
+    return url
+
+
+@STEPS.given(parsers.parse("I have login type {login_type}"), target="login_type")
+async def given_login_type(state, login_type):
+    return login_type
+
+
+@STEPS.given(parsers.parse("I have homepage account: {email}, {password}"), target="user")
+async def given_user(state, email, password):
+    user = account_for(state, "user", dict(email=email, password=password))
+    await lease(state, f"homepage:{user['email']}")
+    return user
+
+
+@STEPS.given(parsers.parse("I have line account: {email}, {password}"), target="user")
+async def given_line_user(state, email, password):
+    user = account_for(state, "user", dict(email=email, password=password))
+    await lease(state, f"line:{user['email']}")
+    return user
+
+
+@STEPS.given(parsers.parse("I have facebook account: {email}, {password}"), target="user")
+async def given_facebook_user(state, email, password):
+    user = account_for(state, "user", dict(email=email, password=password))
+    await lease(state, f"facebook:{user['email']}")
+    return user
+
+
+@STEPS.given(parsers.parse('I have sender info {sender_email}, {sender_name}'),
+             target="sender_info")
+async def given_sender_info(state, sender_email, sender_name):
+    return dict(sender_email=sender_email, sender_name=sender_name)
+
+
+@STEPS.given(parsers.parse("I have tm mail account info {email}, {password}"),
+             target="mail_account")
+async def given_mail_account(state, email, password):
+    mail_account = account_for(state, "mail_account", dict(email=email, password=password))
+    await lease(state, f"mailtm:{mail_account['email']}")
+    return mail_account
+
+
+@STEPS.given(parsers.parse("I have phone number {region_code} {phone_number}"),
+             target="phone_info")
+async def given_phone_number(state, region_code, phone_number):
+    phone_info = account_for(state, "phone_info", {
+        "region_code": region_code.strip(), "phone_number": phone_number.strip()})
+    await lease(state, f"phone:{phone_info['region_code']}{phone_info['phone_number']}")
+    return phone_info
+
+
+@STEPS.when("I go to page")
+async def navigate_to_home(state):
+    page = state["page"]
+    await page.goto(state["url"])
+    # Like waits.wait_for_dom_settled, a page that keeps mutating is given up on
+    await page.evaluate(waits.OBSERVE_MUTATIONS_JS)
+    try:
+        await page.wait_for_function(waits.DOM_QUIET_JS, arg=waits.DOM_QUIET_MS,
+                                     timeout=STEP_TIMEOUT)
+    except PlaywrightTimeoutError:
+        pass
+
+
+@STEPS.when("I click homepage confirm modal")
+async def click_homepage_confirm_modal(state):
+    page = state["page"]
+    confirm_button = login_page.confirm_modal_button(page)
+    if await confirm_button.is_visible():
+        await confirm_button.click()
+        await confirm_button.wait_for(state="hidden", timeout=STEP_TIMEOUT)
+        await page.wait_for_load_state("domcontentloaded", timeout=STEP_TIMEOUT)
+
+
+@STEPS.when("I click login icon")
+async def click_login_icon(state):
+    page = state["page"]
+    with state["web_perf"].measure("login modal"):
+        await login_page.user_menu(page).click()
+        await login_page.first_login_option(page).wait_for(timeout=STEP_TIMEOUT)
+
+
+@STEPS.when(parsers.parse("I choose login type {login_type}"))
+async def choose_login_type(state, login_type):
+    page = state["page"]
+    previous_url = page.url
+    await login_page.login_type_button(page, login_type).click()
+    if login_page.leaves_site(login_type):
+        await wait_for_url_change(page, previous_url)
+    else:
+        await login_page.login_input(page).wait_for(timeout=STEP_TIMEOUT)
+
+
+@STEPS.when('I generate mailtm account', target="generated_mail_account")
+async def mailtm_generate_account(state):
+    return await asyncio.to_thread(state["mailtm_pool"].lease, state["leases"])
+
+
+@STEPS.when('I login the mail tm')
+async def mailtm_login(state):
+    mail_account = state.get("generated_mail_account") or state["mail_account"]
+    state["mailtm_headers"]["Authorization"] = await asyncio.to_thread(
+        state["mailtm_pool"].authorization, mail_account['email'], mail_account['password'])
+
+
+@STEPS.when("I choose region")
+async def select_mobile_number_region(state):
+    page = state["page"]
+    await login_page.region_button(page).click()
+    await login_page.region_option(page).click()
+
+
+async def submit_login_input(page, otp_request, value):
+    field = login_page.login_input(page)
+    await field.click()
+    await field.fill(value)
+    otp_request["requested_at"] = http_client.now()
+    await field.press("Enter")
+
+
+@STEPS.when("I fill the email")
+async def fill_email(state):
+    await submit_login_input(state["page"], state["otp_request"], state["user"]['email'])
+
+
+@STEPS.when("I fill the phone number")
+async def fill_phone_number(state):
+    await submit_login_input(state["page"], state["otp_request"],
+                             state["phone_info"]['phone_number'])
+
+
+@STEPS.when("I fill the line account email and password")
+async def fill_line_account_info(state):
+    page, user = state["page"], state["user"]
+    await login_page.line_email(page).fill(user['email'])
+    await login_page.line_password(page).fill(user['password'])
+    previous_url = page.url
+    await login_page.line_login_button(page).click()
+    await wait_for_url_change(page, previous_url)
+
+
+@STEPS.when("I fill the facebook account email and password")
+async def fill_facebook_account_info(state):
+    page, user = state["page"], state["user"]
+    await login_page.facebook_email(page).fill(user['email'])
+    await login_page.facebook_password(page).fill(user['password'])
+    previous_url = page.url
+    await login_page.facebook_login_button(page).click()
+    await wait_for_url_change(page, previous_url)
+
+
+@STEPS.when(parsers.parse("I grant the facebook permission with {username}"))
+async def grant_facebook_permission(state, username):
+    page = state["page"]
+    previous_url = page.url
+    await login_page.facebook_continue_as(page, username).click()
+    await wait_for_url_change(page, previous_url)
+
+
+@STEPS.when("I choose login with password")
+async def choose_login_email_with_password(state):
+    page = state["page"]
+    await login_page.password_login_button(page).click()
+    await login_page.password_prompt(page).first.wait_for(timeout=STEP_TIMEOUT)
+
+
+@STEPS.when("I fill the password")
+async def fill_password(state):
+    page = state["page"]
+    await login_page.password_prompt(page).locator("div").first.click()
+    await login_page.login_input(page).fill(state["user"]['password'])
+    confirm_button = login_page.confirm_button(page)
+    async with page.expect_response(lambda response: is_login_api(response.request),
+                                    timeout=STEP_TIMEOUT):
+        await confirm_button.click()
+    await confirm_button.wait_for(state="hidden", timeout=STEP_TIMEOUT)
+
+
+@STEPS.when("I check the verification code in the email", target="verification_code")
+async def check_verification_code(state):
+    requested_at = state["otp_request"]["requested_at"]
+    return await asyncio.to_thread(
+        wait_for_verification_code, state["mailtm_headers"], state["sender_info"],
+        timeout=state["otp_timeout"], since=requested_at and requested_at - http_client.CLOCK_SKEW)
+
+
+@STEPS.when("I check the verification code in the mobile message box",
+            target="verification_code")
+async def check_mobile_verification_code(state):
+    return await asyncio.to_thread(
+        wait_for_sms_code, state["phone_info"], state["otp_request"]["requested_at"],
+        timeout=state["otp_timeout"])
+
+
+@STEPS.when("I send the verification code in the page")
+async def send_verification_code(state):
+    page, verification_code = state["page"], state["verification_code"]
+    inputs = login_page.otp_inputs(page)
+    await inputs.first.wait_for(timeout=STEP_TIMEOUT)
+    input_elements = await inputs.all()
+    if len(input_elements) != 6 or len(verification_code) != 6:
+        raise ValueError(
+            "Verification code must be 6 digits and there must be 6 input boxes.")
+    for index, digit in enumerate(verification_code):
+        await input_elements[index].fill(digit)
+    await inputs.first.wait_for(state="hidden", timeout=STEP_TIMEOUT)
+
+
+@STEPS.when(parsers.parse('I wait for {minutes:d} minutes'))
+async def wait_for_minutes(state, minutes):
+    await asyncio.sleep(minutes * 60)
+
+
+@STEPS.then("I can see the member center")
+async def check_my_account(state):
+    page = state["page"]
+    await login_page.user_menu(page).click()
+    await login_page.member_center_link(page).wait_for(timeout=5000)
+
+
+@STEPS.then('I logout')
+async def logout_homepage(state):
+    page = state["page"]
+    await login_page.user_menu(page).click()
+    logout_link = login_page.logout_link(page)
+    await logout_link.wait_for(timeout=STEP_TIMEOUT)
+    await logout_link.click()
+
+
+async def collect_web_perf(state):
+    page, web_perf = state["page"], state["web_perf"]
+    await page.evaluate(OBSERVE_JS)
+    web_perf.update(await page.evaluate(COLLECT_JS))
+    return web_perf
+
+
+@STEPS.then(parsers.parse("the login modal is interactive within {budget:d} ms"))
+async def check_login_modal_budget(state, budget):
+    check_budget("login modal interactive time (ms)",
+                 state["web_perf"].measurements.get("login modal"), budget)
+
+
+@STEPS.then(parsers.parse("the {metric} is within {budget:d} ms"))
+async def check_page_metric_budget(state, metric, budget):
+    web_perf = await collect_web_perf(state)
+    check_budget(f"{metric} (ms)", web_perf.metric(metric), budget)
+
+
+@STEPS.then(parsers.parse("the layout shift score is below {budget:f}"))
+async def check_layout_shift_budget(state, budget):
+    web_perf = await collect_web_perf(state)
+    check_budget("layout shift score", web_perf.metrics["cls"], budget)
+
+
+@STEPS.then(parsers.parse("the login API requests finish within {budget:d} ms"))
+async def check_login_api_budget(state, budget):
+    slowest = state["web_perf"].slowest_api_request()
+    assert slowest, "No login API request was captured."
+    check_budget(f"{slowest['method']} {slowest['url']} (ms)", slowest["duration"], budget)
+
+
+async def run_features(paths, concurrency=4, tags=None, headless=True, otp_timeout=300):
+    """
+    Run the scenarios of the feature files under `paths` concurrently on one
+    Chromium. Returns the scenario results and the wall time in seconds.
+    """
+    scenarios = load_scenarios(paths, tags)
+    mailtm_pool = MailtmPool()
+    started = time.monotonic()
+    async with async_playwright() as playwright:
+        browser = await playwright.chromium.launch(
+            **browser_server.launch_options(headless=headless))
+        try:
+            results = await run_scenarios(
+                scenarios, STEPS,
+                lambda scenario: open_state(browser, mailtm_pool, otp_timeout=otp_timeout),
+                close_state, concurrency)
+        finally:
+            await browser.close()
+    return results, time.monotonic() - started
@@ -0,0 +1,90 @@
+import hashlib
+import os
+import time
+
+import login_page
+import waits
+
+STATE_DIR = ".auth"
+DEFAULT_TTL = 3600
+
+
+def member_center_visible(page):
+    """
+    Open the user menu and report whether the "會員中心" link is shown, i.e. the session is logged in.
+    """
+    login_page.user_menu(page).click()
+    return waits.is_shown_within(login_page.member_center_link(page), timeout=5000)
+
+
+class StorageStateCache:
+    """
+    Playwright storage states saved on disk per (login type, account).
+
+    A state is reused until it is older than `ttl` seconds or fails the
+    member center check, after which the caller logs in again and saves it.
+    """
+
+    def __init__(self, state_dir=STATE_DIR, ttl=DEFAULT_TTL):
+        self.state_dir = state_dir
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def path_for(self, login_type, account):
+        digest = hashlib.sha1(f"{login_type}:{account}".encode()).hexdigest()
+        return os.path.join(self.state_dir, f"{digest}.json")
+
+    def load(self, login_type, account):
+        """
+        Return the path of a fresh saved state, or None when it is missing or expired.
+        """
+        path = self.path_for(login_type, account)
+        if not os.path.exists(path):
+            return None
+        if time.time() - os.path.getmtime(path) > self.ttl:
+            self.invalidate(login_type, account)
+            return None
+        return path
+
+    def save(self, context, login_type, account):
+        os.makedirs(self.state_dir, mode=0o700, exist_ok=True)
+        path = self.path_for(login_type, account)
+        context.storage_state(path=path)
+        # The state holds session cookies
+        os.chmod(path, 0o600)
+        return path
+
+    def invalidate(self, login_type, account):
+        try:
+            os.remove(self.path_for(login_type, account))
+        except FileNotFoundError:
+            pass
+
+    def open_page(self, browser, new_context, url, login_type, account, login):
+        """
+        Return a logged-in page on `url`.
+
+        `new_context(**kwargs)` creates a configured context from `browser`.
+        When no valid state is cached, `login(page)` performs the UI login on a
+        fresh context and the resulting state is saved for the next scenario.
+        """
+        state = self.load(login_type, account)
+        if state:
+            context = new_context(storage_state=state)
+            page = context.new_page()
+            page.goto(url)
+            if member_center_visible(page):
+                self.hits += 1
+                print(f"Reused saved login for {login_type} {account}")
+                return page
+            print(f"Saved login for {login_type} {account} expired, logging in again")
+            context.close()
+            self.invalidate(login_type, account)
+
+        self.misses += 1
+        context = new_context()
+        page = context.new_page()
+        login(page)
+        self.save(context, login_type, account)
+        return page
@@ -0,0 +1,166 @@
+import fcntl
+import hashlib
+import json
+import os
+import signal
+import socket
+import subprocess
+import time
+from urllib.parse import urlsplit
+
+from playwright.sync_api import Error as PlaywrightError
+
+SERVER_PATH = os.path.join(".cache", "browser_server.json")
+LAUNCH_TIMEOUT = 30
+CONNECT_TIMEOUT = 10000
+
+CHROMIUM_ARGS = [
+    '--autoplay-policy=no-user-gesture-required',
+    '--disable-web-security',
+    '--enable-media-source'
+]
+
+# Playwright's Python package has no launchServer(); its bundled Node driver
+# does. The server runs until SIGTERM and closes Chromium on the way out.
+SERVER_JS = """
+const { chromium } = require(process.argv[1]);
+chromium.launchServer(JSON.parse(process.argv[2])).then(server => {
+    console.log(JSON.stringify({ wsEndpoint: server.wsEndpoint() }));
+    const close = () => server.close().then(() => process.exit(0));
+    process.on('SIGTERM', close);
+    process.on('SIGINT', close);
+}, error => {
+    console.error(error);
+    process.exit(1);
+});
+"""
+
+
+def launch_options(headless=True):
+    return dict(headless=headless, args=CHROMIUM_ARGS)
+
+
+def options_digest(options):
+    return hashlib.sha1(json.dumps(options, sort_keys=True).encode()).hexdigest()
+
+
+def _driver():
+    from playwright._impl._driver import compute_driver_executable
+
+    node, cli = compute_driver_executable()
+    return node, os.path.join(os.path.dirname(cli), "index.js")
+
+
+def load_state(path=SERVER_PATH):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def is_healthy(state):
+    """
+    Whether the server of `state` still runs and accepts connections.
+    """
+    if not state:
+        return False
+    try:
+        os.kill(state["pid"], 0)
+    except (ProcessLookupError, PermissionError):
+        return False
+    endpoint = urlsplit(state["ws_endpoint"])
+    try:
+        with socket.create_connection((endpoint.hostname, endpoint.port), timeout=2):
+            return True
+    except OSError:
+        return False
+
+
+def stop_server(path=SERVER_PATH):
+    """
+    Stop the server recorded in `path`, if any. Returns whether one was running.
+    """
+    state = load_state(path)
+    if state is None:
+        return False
+    running = True
+    try:
+        os.kill(state["pid"], signal.SIGTERM)
+    except ProcessLookupError:
+        running = False
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    return running
+
+
+def launch_server(options, path=SERVER_PATH, timeout=LAUNCH_TIMEOUT):
+    """
+    Start a Chromium server that outlives this process and record its
+    websocket endpoint in `path`. Returns the recorded state.
+    """
+    node, index_js = _driver()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    log_path = f"{os.path.splitext(path)[0]}.log"
+    with open(log_path, "w") as log:
+        process = subprocess.Popen(
+            [node, "-e", SERVER_JS, index_js, json.dumps(options)],
+            stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT,
+            start_new_session=True)
+    deadline = time.monotonic() + timeout
+    while True:
+        with open(log_path) as log:
+            for line in log:
+                if line.startswith("{"):
+                    state = dict(ws_endpoint=json.loads(line)["wsEndpoint"], pid=process.pid,
+                                 options=options_digest(options), started_at=time.time())
+                    with open(path, "w") as f:
+                        json.dump(state, f, indent=4)
+                    return state
+        if process.poll() is not None or time.monotonic() >= deadline:
+            process.kill()
+            with open(log_path) as log:
+                raise RuntimeError(f"The browser server did not start: {log.read()[-2000:]}")
+        time.sleep(0.05)
+
+
+def ensure_server(options, path=SERVER_PATH):
+    """
+    The state of a healthy server launched with `options`, launching one when
+    the recorded server died or runs with other options. pytest-xdist workers
+    take turns on a lock file next to `path`, so only one of them launches it;
+    the kernel drops the lock of a worker that dies.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(f"{path}.lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        state = load_state(path)
+        healthy = is_healthy(state)
+        if healthy and state["options"] == options_digest(options):
+            return state
+        if state is not None:
+            print("Relaunching the browser server with new options" if healthy
+                  else "The browser server is not running, relaunching it")
+            stop_server(path)
+        return launch_server(options, path)
+
+
+def connect(browser_type, options, path=SERVER_PATH):
+    """
+    Connect to the persistent server, launching it when needed and once more
+    when the recorded server fails to accept the connection.
+
+    A connected browser only sees the contexts it creates, and the server
+    closes them when this process disconnects, so runs sharing the server
+    start from a clean slate.
+    """
+    state = ensure_server(options, path)
+    try:
+        return browser_type.connect(state["ws_endpoint"], timeout=CONNECT_TIMEOUT)
+    except PlaywrightError as e:
+        print(f"Could not connect to the browser server, relaunching it: {e}")
+        stop_server(path)
+        state = ensure_server(options, path)
+        return browser_type.connect(state["ws_endpoint"], timeout=CONNECT_TIMEOUT)
@@ -1,20 +1,241 @@
-from twilio.rest import Client
 import pytest
-from playwright.sync_api import Page, expect, sync_playwright
+from playwright.sync_api import Error as PlaywrightError, Page, expect, sync_playwright
 from pytest_bdd import given, parsers, scenario, then, when
-import requests
-from requests.exceptions import RequestException
-import json
-from datetime import datetime, timedelta
-import pytz
-import time
-from mailtm import get_mailtm_domains, login_to_mailtm
-import re
+import http_client
+from account_lease import AccountLeases, worker_id
+from auth_state import StorageStateCache
+import network_filter
+import context_pool
+import mailtm_pool
+import waits
+from step_timing import StepTimingPlugin
+import failure_capture
+import sharding
+import login_page
+import browser_server
+import result_cache
+from mailtm import login_to_mailtm
+from web_perf import WebPerfCollector, check_budget, is_login_api
 import os
-from dotenv import load_dotenv
 
-# Load .env file
-load_dotenv(dotenv_path="configs/.env")
+# The mail.tm/Twilio clients, the recorder and dotenv are imported where they
+# are used, so collecting or running UI-only scenarios does not load them.
+
+
+def pytest_addoption(parser):
+    parser.addoption("--otp-timeout", type=float, default=300,
+                     help="Seconds to wait for a verification code to arrive.")
+    parser.addoption("--account-lease-timeout", type=float, default=600,
+                     help="Seconds to wait for an account leased by another worker.")
+    parser.addoption("--auth-state-ttl", type=float, default=3600,
+                     help="Seconds a saved login (storage state) is reused before logging in again.")
+    parser.addoption("--auth-state-dir", default=".auth",
+                     help="Directory for saved logins.")
+    parser.addoption("--timing-dir", default="results",
+                     help="Directory for the step timeline and flame graph files.")
+    parser.addoption("--timing-baseline", default=None,
+                     help="Step timeline JSON of a baseline run to compare step p50/p95 against.")
+    parser.addoption("--timing-threshold", type=float, default=0.2,
+                     help="Relative slowdown of a step's p50/p95 that counts as a regression.")
+    parser.addoption("--timing-fail-on-regression", action="store_true",
+                     help="Fail the run when a step regressed against the baseline.")
+    parser.addoption("--failure-capture", choices=failure_capture.MODES, default="off",
+                     help="What is kept in memory and written out when a scenario fails (default: off).")
+    parser.addoption("--failure-capture-window", type=int, default=5,
+                     help="Steps whose screenshots/trace chunks are kept for a failure.")
+    parser.addoption("--failure-capture-dir", default=failure_capture.CAPTURE_DIR,
+                     help="Directory for the captures of failed scenarios.")
+    parser.addoption("--shard", default=None,
+                     help="Run the i-th of N shards of similar duration, e.g. 2/4.")
+    parser.addoption("--durations-store", default=sharding.DURATIONS_PATH,
+                     help="File keeping the test durations learned from JUnit XML.")
+    parser.addoption("--durations-from", action="append", default=[],
+                     help="Also learn test durations from this JUnit XML file, e.g. of other shards.")
+    parser.addoption("--durations-digest", default=None,
+                     help="Digest the durations must have for --shard, as shown in the header of every node.")
+    parser.addoption("--result-cache", action="store_true",
+                     help="Skip scenarios that passed before with the same feature, steps and deploy version.")
+    parser.addoption("--max-cache-age", type=float, default=result_cache.DEFAULT_MAX_AGE,
+                     help="Seconds a cached pass is trusted before the scenario runs against the site again.")
+    parser.addoption("--result-cache-path", default=result_cache.CACHE_PATH,
+                     help="File keeping the fingerprints and outcomes of scenarios.")
+    parser.addoption("--deploy-version", default=None,
+                     help="Version of the site under test, part of the fingerprint (default: $DEPLOY_VERSION).")
+    parser.addoption("--circuit-breaker-threshold", type=int, default=http_client.BREAKER_THRESHOLD,
+                     help="Consecutive failed calls to mail.tm/Twilio that fast-fail the next ones (0 turns it off).")
+    parser.addoption("--circuit-breaker-cooldown", type=float, default=http_client.BREAKER_COOLDOWN,
+                     help="Seconds an open circuit fast-fails calls before one is let through.")
+    parser.addoption("--testrail-run-id", type=int, default=None,
+                     help="Upload results to this TestRail run while the tests run.")
+    parser.addoption("--testrail-chunk-size", type=int, default=50,
+                     help="Results per live TestRail upload.")
+    parser.addoption("--testrail-flush-interval", type=float, default=5.0,
+                     help="Seconds a result may wait before it is uploaded.")
+    parser.addoption("--no-network-filter", action="store_true",
+                     help="Load every resource of the pages under test.")
+    parser.addoption("--block-resource-types", default=None,
+                     help="Comma separated resource types to block (default: image,media,font).")
+    parser.addoption("--block-domain", action="append", default=[],
+                     help="Also block requests to this domain and its subdomains.")
+    parser.addoption("--allow-domain", action="append", default=[],
+                     help="Never block requests to this domain and its subdomains.")
+    parser.addoption("--browser-server", action="store_true",
+                     help="Connect to a Chromium server kept running across runs, launching it if needed.")
+    parser.addoption("--browser-server-path", default=browser_server.SERVER_PATH,
+                     help="File keeping the browser server's websocket endpoint.")
+    parser.addoption("--context-pool-size", type=int, default=0,
+                     help="Browser contexts kept ready for the next scenarios (default 0: off).")
+    parser.addoption("--mailtm-pool-size", type=int, default=0,
+                     help="mail.tm inboxes to create ahead of the run for scenarios that lease one.")
+    parser.addoption("--mailtm-pool-path", default=mailtm_pool.POOL_PATH,
+                     help="File keeping mail.tm inboxes, tokens and domains across runs.")
+    parser.addoption("--fake-services", action="store_true",
+                     help="Send the mail.tm, Twilio and TestRail calls to local fakes.")
+    parser.addoption("--fake-faults", default=None,
+                     help="Faults the fakes inject, e.g. latency=lognormal:80:300,rate=8,errors=0.02.")
+    parser.addoption("--record-har", action="store_true",
+                     help="Record each scenario's browser traffic and mail.tm/Twilio calls.")
+    parser.addoption("--replay-har", action="store_true",
+                     help="Replay each scenario from its recording instead of the network.")
+    parser.addoption("--recording-dir", default="recordings",
+                     help="Directory for the recordings.")
+    parser.addoption("--har-not-found", choices=("abort", "fallback"), default="abort",
+                     help="What replay does with a browser request that was not recorded.")
+
+
+def recording_mode(config):
+    if config.getoption("record_har") and config.getoption("replay_har"):
+        raise pytest.UsageError("--record-har and --replay-har cannot be combined.")
+    if config.getoption("record_har"):
+        return "record"
+    if config.getoption("replay_har"):
+        return "replay"
+    return None
+
+
+def pytest_configure(config):
+    from dotenv import load_dotenv
+
+    # Load .env file
+    load_dotenv(dotenv_path="configs/.env")
+    recording_mode(config)
+    http_client.configure_circuit_breakers(config.getoption("circuit_breaker_threshold"),
+                                           config.getoption("circuit_breaker_cooldown"))
+    start_fake_services(config)
+    config.pluginmanager.register(StepTimingPlugin(config), "step_timing")
+    config.pluginmanager.register(failure_capture.FailureCapturePlugin(config), "failure_capture")
+    config.pluginmanager.register(sharding.ShardingPlugin(config), "sharding")
+    if config.getoption("result_cache"):
+        config.pluginmanager.register(result_cache.ResultCachePlugin(config), "result_cache")
+    run_id = config.getoption("testrail_run_id")
+    # Only the controller reports under pytest-xdist, from the reports workers send back
+    if run_id and not hasattr(config, "workerinput"):
+        from testrail_reporter import TestRailReporter, testrail
+        config.pluginmanager.register(TestRailReporter(
+            run_id,
+            chunk_size=config.getoption("testrail_chunk_size"),
+            flush_interval=config.getoption("testrail_flush_interval"),
+            ledger=testrail.UploadLedger()), "testrail_reporter")
+
+
+def start_fake_services(config):
+    """
+    With --fake-services the controller starts the fakes; pytest-xdist workers
+    inherit their URLs through the environment.
+    """
+    if hasattr(config, "workerinput"):
+        if config.getoption("fake_services"):
+            import fake_services
+            fake_services.point_at_fakes()
+        return
+    if not config.getoption("fake_services"):
+        return
+    import fake_services
+
+    services = fake_services.FakeServices(config.getoption("fake_faults")).start()
+    services.install()
+    config.pluginmanager.register(services, "fake_services")
+    config.add_cleanup(services.stop)
+
+
+def pytest_terminal_summary(terminalreporter):
+    if http_client.get_metrics():
+        terminalreporter.section("external HTTP latency")
+        for line in http_client.latency_summary_lines():
+            terminalreporter.write_line(line)
+        http_client.write_latency_summary(os.path.join(
+            terminalreporter.config.getoption("timing_dir"), "http_latency.json"))
+    budgets = [budget for budget in waits.finished_budgets() if budget.records]
+    if budgets:
+        terminalreporter.section("sleep budget")
+        for budget in budgets:
+            terminalreporter.write_line(
+                f"{budget.name}: waited {budget.total:.1f}s of {budget.wall:.1f}s "
+                f"({budget.total / budget.wall:.0%})")
+            for step, seconds in sorted(budget.by_step().items(), key=lambda item: -item[1]):
+                terminalreporter.write_line(f"    {seconds:6.2f}s  {step}")
+    pools = [pool for pool in context_pool.pools if pool.hits + pool.misses]
+    if pools:
+        terminalreporter.section("context pool")
+        for pool in pools:
+            terminalreporter.write_line(pool.summary_line())
+    account_pools = [pool for pool in mailtm_pool.pools if pool.token_hits + pool.logins]
+    if account_pools:
+        terminalreporter.section("mail.tm pool")
+        for pool in account_pools:
+            terminalreporter.write_line(pool.summary_line())
+    services = terminalreporter.config.pluginmanager.get_plugin("fake_services")
+    if services is not None:
+        terminalreporter.section("fake services")
+        for line in services.summary_lines():
+            terminalreporter.write_line(line)
+    stats = network_filter.session_stats
+    if stats.total_requests:
+        terminalreporter.section("network filter")
+        terminalreporter.write_line(
+            f"blocked {stats.total_requests} requests, saved {stats.total_bytes / 1024:.0f} KiB "
+            f"({stats.unknown_sizes} of unknown size)")
+        for reason, count in stats.requests.most_common():
+            terminalreporter.write_line(
+                f"    {count:5d}  {stats.bytes[reason] / 1024:8.0f} KiB  {reason}")
+
+
+def pytest_collection_modifyitems(items):
+    for item in items:
+        marker = item.get_closest_marker("case_id")
+        if marker and marker.args:
+            item.user_properties.append(("case_id", marker.args[0]))
+
+
+def pytest_runtest_logfinish(nodeid, location):
+    # After the scenario's teardown and report, so replacing the contexts it
+    # used does not count towards its time
+    context_pool.refill_pools()
+
+
+def pytest_bdd_before_step(request, feature, scenario, step, step_func):
+    waits.set_current_step(step.name)
+
+
+# Fixtures torn down after the step do not inherit its deadline
+def pytest_bdd_after_step(request, feature, scenario, step, step_func, step_func_args):
+    waits.set_current_step(None)
+
+
+def pytest_bdd_step_error(request, feature, scenario, step, step_func, step_func_args, exception):
+    waits.set_current_step(None)
+
+
+@pytest.fixture(autouse=True)
+def sleep_budget(request):
+    """
+    Record how long the scenario spends waiting and attach the total to the JUnit report.
+    """
+    budget = waits.start_budget(request.node.nodeid)
+    yield budget
+    waits.finish_budget()
+    if budget.records:
+        request.node.user_properties.append(("wait_seconds", f"{budget.total:.3f}"))
 
 
 @pytest.fixture(scope="session")
@@ -24,70 +245,284 @@ def playwright():
 
 
 @pytest.fixture(scope="session")
-def browser():
-    with sync_playwright() as p:
-        browser = p.chromium.launch(
-            headless=True,
-            args=[
-                '--autoplay-policy=no-user-gesture-required',
-                '--disable-web-security',
-                '--enable-media-source'
-            ]
-        )
-        yield browser
-        browser.close()
+def browser(request, playwright):
+    """
+    Chromium launched for this run, or with --browser-server a connection to
+    the long-lived server, launched by the first run that needs it.
+    """
+    options = browser_server.launch_options()
+    if request.config.getoption("browser_server"):
+        browser = browser_server.connect(
+            playwright.chromium, options, request.config.getoption("browser_server_path"))
+    else:
+        browser = playwright.chromium.launch(**options)
+    yield browser
+    # Disconnecting leaves the server running
+    browser.close()
+
+
+# Session scope is per worker under pytest-xdist, so every worker has its own browser:
+# its own Chromium, or its own connection to the --browser-server one. Each scenario
+# gets a fresh context and page.
+def new_scenario_context(browser, request_filter=None, recording=None, **kwargs):
+    if recording is not None:
+        kwargs.update(recording.context_options())
+    context = browser.new_context(permissions=['geolocation'], **kwargs)
+    context.set_default_timeout(10000)
+    # Routes registered last run first, so the filter sees requests before the replay
+    if recording is not None:
+        recording.install(context)
+    if request_filter is not None:
+        request_filter.install(context)
+    return context
+
+
+@pytest.fixture
+def scenario_recording(request):
+    """
+    Record or replay the scenario's traffic with --record-har / --replay-har, None otherwise.
+    """
+    mode = recording_mode(request.config)
+    if mode is None:
+        yield None
+        return
+    from recording import ScenarioRecording, recording_name
+
+    recording = ScenarioRecording(
+        request.config.getoption("recording_dir"), recording_name(request.node.nodeid),
+        mode, request.config.getoption("har_not_found"))
+    http_client.use_cassette(recording.cassette)
+    yield recording
+    http_client.use_cassette(None)
+    recording.close()
+    if recording.replayer is not None and recording.replayer.misses:
+        print(f"{len(recording.replayer.misses)} requests were not in the recording of "
+              f"{recording.name}:")
+        for miss in recording.replayer.misses:
+            print(f"    {miss}")
 
 
 @pytest.fixture(scope="session")
-def context(browser):
-    context = browser.new_context(permissions=['geolocation'])
-    context.set_default_timeout(10000)
-    yield context
-    context.close()
+def network_size_cache():
+    cache = network_filter.SizeCache()
+    yield cache
+    cache.save()
+
+
+@pytest.fixture
+def request_filter(request, network_size_cache):
+    """
+    Blocks images, media, fonts and analytics tags of the scenario's pages.
+    Use @pytest.mark.network_filter(allow=[...], deny=[...], resource_types=[...], enabled=...)
+    to change that for one scenario.
+    """
+    request_filter = network_filter.filter_from_options(
+        request.config, request.node.get_closest_marker("network_filter"), network_size_cache)
+    yield request_filter
+    stats = request_filter.stats
+    network_filter.session_stats.merge(stats)
+    if stats.total_requests:
+        request.node.user_properties.append(("blocked_requests", stats.total_requests))
+        request.node.user_properties.append(("blocked_bytes", stats.total_bytes))
 
 
 @pytest.fixture(scope="session")
-def page(context):
-    page = context.new_page()
+def browser_context_pool(request, browser, network_size_cache):
+    """
+    Contexts with the command line's network filter, created ahead of the scenarios.
+    None when the pool is turned off or the scenarios are recorded or replayed.
+    """
+    size = request.config.getoption("context_pool_size")
+    if size <= 0 or recording_mode(request.config):
+        yield None
+        return
+    pool_filter = network_filter.filter_from_options(
+        request.config, size_cache=network_size_cache)
+
+    def create(pooled):
+        return pool_filter.install(new_scenario_context(browser), pooled.route)
+
+    pool = context_pool.ContextPool(create, size, pool_filter.rules())
+    # Filled after each scenario: the first one creates its context on demand
+    # instead of waiting for the whole pool
+    context_pool.pools.append(pool)
+    yield pool
+    pool.close()
+
+
+@pytest.fixture
+def context(browser, browser_context_pool, request_filter, scenario_recording):
+    pool = browser_context_pool
+    # A scenario with its own filter rules needs a context routed for them
+    if pool is None or not pool.serves(request_filter):
+        context = new_scenario_context(browser, request_filter, scenario_recording)
+        yield context
+        context.close()
+        return
+    context = pool.checkout(request_filter)
+    yield context
+    pool.checkin(context)
+
+
+@pytest.fixture
+def page(request, context):
+    # Pooled contexts come with a page
+    page = context.pages[0] if context.pages else context.new_page()
+    request.config.pluginmanager.get_plugin("failure_capture").watch(request.node, page)
     yield page
     page.close()
 
 
-# Fixture to store headers globally after login
+@pytest.fixture
+def web_perf(request, page):
+    """
+    Web performance of the scenario's page. Request it before the page is
+    opened; what was collected is attached to the JUnit report.
+    """
+    collector = WebPerfCollector()
+    collector.install(page)
+    yield collector
+    if not collector.metrics and not page.is_closed() and page.url != "about:blank":
+        try:
+            collector.collect(page)
+        except PlaywrightError as e:
+            print(f"Could not collect web performance metrics: {e}")
+    request.node.user_properties.extend(collector.properties())
+
+
 @pytest.fixture(scope="session")
+def mailtm_account_pool(request):
+    """
+    mail.tm inboxes and tokens shared across runs and workers, renewed in the background.
+    """
+    pool = mailtm_pool.MailtmPool(request.config.getoption("mailtm_pool_path"),
+                                  lease_timeout=request.config.getoption("account_lease_timeout"))
+    size = request.config.getoption("mailtm_pool_size")
+    if size:
+        pool.provision(size)
+    pool.start_refresher()
+    mailtm_pool.pools.append(pool)
+    yield pool
+    pool.stop()
+
+
+# Headers of the inbox the current scenario logged in to
+@pytest.fixture
 def mailtm_headers():
     return {"Authorization": None}
 
 
+@pytest.fixture
+def account_leases(request):
+    """
+    Leases held by the current scenario, so no other worker uses the same account.
+    """
+    leases = AccountLeases(
+        timeout=request.config.getoption("account_lease_timeout"))
+    yield leases
+    leases.release_all()
+
+
+@pytest.fixture(scope="session")
+def auth_state_cache(request):
+    # Recorded scenarios always log in, so a replay sends the same requests
+    ttl = 0 if recording_mode(request.config) else request.config.getoption("auth_state_ttl")
+    return StorageStateCache(
+        state_dir=request.config.getoption("auth_state_dir"), ttl=ttl)
+
+
+def login_with_email_password(page, url, user):
+    open_home(page, url)
+    click_homepage_confirm_modal(page)
+    open_login_modal(page)
+    choose_login_type(page, "電子信箱")
+    fill_email(page, user, {"requested_at": None})
+    choose_login_email_with_password(page)
+    fill_password(page, user)
+
+
+def login_with_line(page, url, user):
+    open_home(page, url)
+    click_homepage_confirm_modal(page)
+    open_login_modal(page)
+    choose_login_type(page, "LINE")
+    fill_line_account_info(page, user)
+
+
+# UI login flows that can be replayed without a verification code,
+# with the lease prefix their accounts use in the Given steps
+LOGIN_FLOWS = {
+    "電子信箱": ("homepage", login_with_email_password),
+    "LINE": ("line", login_with_line),
+}
+
+
+@given(parsers.parse("I am logged in to {url} with {login_type} account: {email}, {password}"),
+       target_fixture="page")
+def given_logged_in_page(request, browser, auth_state_cache, account_leases, request_filter,
+                         scenario_recording, url, login_type, email, password):
+    """
+    Start a scenario in the member area, reusing the saved login of the account when still valid.
+    """
+    if login_type not in LOGIN_FLOWS:
+        raise ValueError(f"No replayable login flow for login_type: {login_type}")
+    lease_prefix, login = LOGIN_FLOWS[login_type]
+    account_leases.acquire(f"{lease_prefix}:{email}")
+    user = dict(email=email, password=password)
+    page = auth_state_cache.open_page(
+        browser,
+        lambda **kwargs: new_scenario_context(
+            browser, request_filter, scenario_recording, **kwargs),
+        url, login_type, email,
+        lambda page: login(page, url, user))
+    request.addfinalizer(page.context.close)
+    return page
+
+
 @given(parsers.parse("I have login type {login_type}"), target_fixture="login_type")
 def given_login_type(login_type) -> None:
     return login_type
 
 
+# When the current scenario asked the site to send a verification code
 @pytest.fixture
-def verification_code(request, login_type, mailtm_headers):
+def otp_request():
+    return {"requested_at": None}
+
+
+@pytest.fixture
+def verification_code(request, login_type, mailtm_headers, otp_request):
     """
     Unified fixture to fetch the verification code based on the login type.
+    Only codes sent after the scenario requested one are accepted.
     """
     print(f"Debug: login_type: {login_type}")
 
     if login_type == "電子信箱":
+        from mailtm_waiter import wait_for_verification_code
+
         sender_info = request.getfixturevalue("sender_info")
         if not mailtm_headers or not sender_info:
             raise ValueError(
                 "Missing mailtm_headers or sender_info for email verification.")
-        verification_code = check_verification_code_in_5_minutes(
-            mailtm_headers, sender_info)
+        verification_code = wait_for_verification_code(
+            mailtm_headers, sender_info,
+            timeout=request.config.getoption("otp_timeout"),
+            since=otp_request["requested_at"]
+            and otp_request["requested_at"] - http_client.CLOCK_SKEW)
         return verification_code
 
     elif login_type == "手機驗證":
         # Dynamically get the `phone_info` fixture
+        from twilio_sms import wait_for_sms_code
+
         phone_info = request.getfixturevalue("phone_info")
         if not phone_info:
             raise ValueError("Missing phone_info for mobile verification.")
         print(f"Debug: phone_info: {phone_info}")
-        verification_code = check_phone_verification_code_in_5_minutes(
-            phone_info)
+        verification_code = wait_for_sms_code(
+            phone_info, otp_request["requested_at"],
+            timeout=request.config.getoption("otp_timeout"))
         return verification_code
     else:
         raise ValueError(f"Invalid login_type: {login_type}")
@@ -98,21 +533,21 @@ def given_url(url) -> None:
     return url
 
 
-BASE_URL = "https://api.mail.tm"
-
-
 @given(parsers.parse("I have homepage account: {email}, {password}"), target_fixture="user")
-def given_user(email, password):
+def given_user(email, password, account_leases):
+    account_leases.acquire(f"homepage:{email}")
     return dict(email=email, password=password)
 
 
 @given(parsers.parse("I have line account: {email}, {password}"), target_fixture="user")
-def given_line_user(email, password):
+def given_line_user(email, password, account_leases):
+    account_leases.acquire(f"line:{email}")
     return dict(email=email, password=password)
 
 
 @given(parsers.parse("I have facebook account: {email}, {password}"), target_fixture="user")
-def given_facebook_user(email, password):
+def given_facebook_user(email, password, account_leases):
+    account_leases.acquire(f"facebook:{email}")
     return dict(email=email, password=password)
 
 
@@ -122,16 +557,18 @@ def given_sender_info(sender_email, sender_name):
 
 
 @given(parsers.parse("I have tm mail account info {email}, {password}"), target_fixture="mail_account")
-def given_mail_account(email, password):
+def given_mail_account(email, password, account_leases):
+    account_leases.acquire(f"mailtm:{email}")
     return dict(email=email, password=password)
 
 
 @given(parsers.parse("I have phone number {region_code} {phone_number}"), target_fixture="phone_info")
-def given_phone_number(region_code=None, phone_number=None):
+def given_phone_number(account_leases, region_code=None, phone_number=None):
     if not region_code or not phone_number:
         raise ValueError(
             "Invalid phone_info format. Ensure it contains region_code and phone_number."
         )
+    account_leases.acquire(f"phone:{region_code.strip()}{phone_number.strip()}")
     phone_info = {
         "region_code": region_code.strip(),
         "phone_number": phone_number.strip()
@@ -140,78 +577,109 @@ def given_phone_number(region_code=None, phone_number=None):
     return phone_info
 
 
-@when("I go to page")
-def navigate_to_home(url, page):
+def open_home(page, url):
     page.goto(url)
-    page.wait_for_timeout(1000)
+    # The confirm modal is rendered by scripts after load
+    waits.wait_for_dom_settled(page)
+
+
+# Requests web_perf so its observers are installed before the page loads
+@when("I go to page")
+def navigate_to_home(url, page, web_perf):
+    open_home(page, url)
 
 
 @when("I click homepage confirm modal")
 def click_homepage_confirm_modal(page: Page):
-    if page.get_by_role("button", name="確定前往").is_visible():
-        page.get_by_role("button", name="確定前往").click()
-        page.wait_for_timeout(3000)
+    confirm_button = login_page.confirm_modal_button(page)
+    if confirm_button.is_visible():
+        confirm_button.click()
+        waits.wait_for_locator(confirm_button, "hidden")
+        waits.wait_for_load(page)
+
+
+def open_login_modal(page: Page):
+    login_page.user_menu(page).click()
+    login_button = login_page.first_login_option(page)
+    waits.wait_for_locator(login_button)
+    expect(login_button).to_be_enabled()
 
 
 @when("I click login icon")
-def click_login_icon(page: Page):
-    page.get_by_role("link", name="User").click()
-    page.wait_for_timeout(1000)
+def click_login_icon(page: Page, web_perf):
+    with web_perf.measure("login modal"):
+        open_login_modal(page)
 
 
 @when(parsers.parse("I choose login type {login_type}"))
 def choose_login_type(page: Page, login_type):
     print(f"Attempting to log in using {login_type}")  # Debug print
-    if login_type == "電子信箱":
-        button_selector = f'role=button[name="使用 {login_type} 登入"]'
+    previous_url = page.url
+    login_page.login_type_button(page, login_type).click()
+    if login_page.leaves_site(login_type):
+        waits.wait_for_url_change(page, previous_url)
+        waits.wait_for_load(page)
     else:
-        button_selector = f'role=button[name="使用 {login_type}登入"]'
-    page.click(button_selector)
-    page.wait_for_timeout(3000)
+        waits.wait_for_locator(login_page.login_input(page))
     print(f"Clicked on login button for {login_type}")  # Debug print
 
 
-@when('I generate mailtm account')
-def mailtm_generate_account(request):
-    version = request.config.getoption("deploy_version")
-    print(version)
-    domains = get_mailtm_domains()
-    email_address = f"{version}@{domains[0]}"
-    print(email_address)
+@when('I generate mailtm account', target_fixture="generated_mail_account")
+def mailtm_generate_account(mailtm_account_pool, account_leases):
+    """
+    Step: Lease an inbox of the mail.tm pool, creating one when all are in use.
+    """
+    mail_account = mailtm_account_pool.lease(account_leases)
+    print(f"Worker {worker_id()} leased mail.tm inbox {mail_account['email']}")
+    return mail_account
+
+
+def scenario_mail_account(request):
+    """
+    The inbox leased by "I generate mailtm account", else the one given by
+    "I have tm mail account info".
+    """
+    try:
+        return request.getfixturevalue("generated_mail_account")
+    except pytest.FixtureLookupError:
+        return request.getfixturevalue("mail_account")
 
 
 @when('I login the mail tm')
-def mailtm_login(mail_account, mailtm_headers):
+def mailtm_login(request, mailtm_headers, mailtm_account_pool, scenario_recording):
     """
-    Step: Log in to mail.tm using the login_to_mailtm function.
+    Step: Log in to mail.tm, reusing the pool's token of the inbox while it is fresh.
     """
-    login_to_mailtm(mail_account['email'],
-                    mail_account['password'], mailtm_headers)
+    mail_account = scenario_mail_account(request)
+    address = mail_account['email']
+    # A recorded scenario logs in itself, so it replays without the scenarios before it
+    if scenario_recording is not None:
+        login_to_mailtm(address, mail_account['password'], mailtm_headers)
+        return
+    mailtm_headers["Authorization"] = mailtm_account_pool.authorization(
+        address, mail_account['password'])
 
 
 @when(parsers.parse("I choose region"))
 def select_mobile_number_region(page: Page):
-    # Wait for the element using the XPath selector
-    button = page.locator(
-        'xpath=//*[@id="theme-provider"]/div/div/div/div[1]/div/div[1]')
+    button = login_page.region_button(page)
     # Ensure the element is visible before clicking
     button.wait_for(state="visible", timeout=10000)
-    # Click the button
     button.click()
-    page.wait_for_timeout(3000)
-    page.locator("//li[@data-option-index='1']").click()
+    option = login_page.region_option(page)
+    waits.wait_for_locator(option)
+    option.click()
 
 
 @when("I fill the email")
-def fill_email(page: Page, user):
+def fill_email(page: Page, user, otp_request):
     try:
         print("Debug: Trying to fill the email.")
-        page.get_by_placeholder("請輸入", exact=True).click()
-        input_field = page.wait_for_selector(
-            'input[placeholder="請輸入"]', timeout=5000)
+        input_field = login_page.login_input(page)
         input_field.click()
         input_field.fill(user['email'])
-        page.get_by_placeholder("請輸入", exact=True).press("Enter")
+        otp_request["requested_at"] = http_client.now()
+        input_field.press("Enter")
         print("Debug: Email filled and confirmed.")
     except Exception as e:
         print(f"Error while filling the email: {e}")
@@ -219,60 +687,60 @@ def fill_email(page: Page, user):
 
 @when("I fill the line account email and password")
 def fill_line_account_info(page: Page, user):
-    page.get_by_placeholder("Email address").click()
-    page.locator("input[name=\"tid\"]").fill(user['email'])
-    page.wait_for_timeout(1000)
-    page.get_by_placeholder("Password").click()
-    page.locator("input[name=\"tpasswd\"]").fill(user['password'])
-    page.wait_for_timeout(1000)
-    page.get_by_role("button", name="Log in").click()
-    page.wait_for_timeout(3000)
+    login_page.line_email(page).fill(user['email'])
+    login_page.line_password(page).fill(user['password'])
+    previous_url = page.url
+    login_page.line_login_button(page).click()
+    waits.wait_for_url_change(page, previous_url)
+    waits.wait_for_load(page)
 
 
 @when("I fill the facebook account email and password")
 def fill_facebook_account_info(page: Page, user):
-    page.fill("#email", user['email'])
-    page.wait_for_timeout(1000)
-    page.fill("#pass", user['password'])
-    page.wait_for_timeout(1000)
-    page.click("button[name='login']")
-    page.wait_for_load_state("networkidle")
-    page.wait_for_timeout(3000)
+    login_page.facebook_email(page).fill(user['email'])
+    login_page.facebook_password(page).fill(user['password'])
+    previous_url = page.url
+    login_page.facebook_login_button(page).click()
+    waits.wait_for_url_change(page, previous_url)
+    waits.wait_for_load(page)
 
 
 @when(parsers.parse("I grant the facebook permission with {username}"))
 def grant_facebook_permission(page: Page, username):
-    page.get_by_label(f"以 {username} 的身分繼續").click()
-    page.wait_for_timeout(3000)
+    previous_url = page.url
+    login_page.facebook_continue_as(page, username).click()
+    waits.wait_for_url_change(page, previous_url)
+    waits.wait_for_load(page)
 
 
 @when("I fill the phone number")
-def fill_phone_number(page: Page, phone_info):
+def fill_phone_number(page: Page, phone_info, otp_request):
     print(
         f"Debug: Trying to fill the phone number: {phone_info['phone_number']}.")
-    page.get_by_placeholder("請輸入", exact=True).click()
-    input_field = page.wait_for_selector(
-        'input[placeholder="請輸入"]', timeout=5000)
+    input_field = login_page.login_input(page)
     input_field.click()
     input_field.fill(phone_info['phone_number'])
-    page.get_by_placeholder("請輸入", exact=True).press("Enter")
+    otp_request["requested_at"] = http_client.now()
+    input_field.press("Enter")
     print("Debug: Phone number filled and confirmed.")
 
 
 @when("I choose login with password")
 def choose_login_email_with_password(page: Page):
-    page.get_by_role("button", name="密碼登入").click()
-    page.wait_for_timeout(1000)
+    login_page.password_login_button(page).click()
+    waits.wait_for_locator(login_page.password_prompt(page).first)
 
 
 @when("I fill the password")
 def fill_password(page: Page, user):
-    page.get_by_placeholder("請輸入", exact=True).click()
-    page.locator("div").filter(has_text=re.compile(
-        r"^輸入密碼$")).locator("div").first.click()
-    page.get_by_placeholder("請輸入", exact=True).fill(user['password'])
-    page.get_by_role("button", name="確認").click()
-    page.wait_for_timeout(3000)
+    login_page.login_input(page).click()
+    login_page.password_prompt(page).locator("div").first.click()
+    login_page.login_input(page).fill(user['password'])
+    confirm_button = login_page.confirm_button(page)
+    # The password is checked by the site's login API, then the login modal closes
+    waits.wait_for_response(page, lambda response: is_login_api(response.request),
+                            confirm_button.click)
+    waits.wait_for_locator(confirm_button, "hidden")
 
 
 @when("I check the verification code in the email")
@@ -311,11 +779,12 @@ def input_verification_code(page, verification_code):
     """
     Input the verification code into the webpage's input fields.
     """
+    inputs = login_page.otp_inputs(page)
     # Wait for input fields to load
-    page.wait_for_selector("form input[type='tel']")
+    waits.wait_for_locator(inputs.first)
 
     # Locate all input fields
-    input_elements = page.locator("form input[type='tel']").all()
+    input_elements = inputs.all()
 
     # Debugging: Check input elements and verification code
     print(f"Number of input elements found: {len(input_elements)}")
@@ -330,138 +799,45 @@ def input_verification_code(page, verification_code):
     for index, digit in enumerate(verification_code):
         input_elements[index].fill(digit)
     print(f"Finish Fill Verification Code: {verification_code}")
-    page.wait_for_timeout(5000)
+    # The code is submitted automatically and the form closes once it is accepted
+    waits.wait_for_locator(inputs.first, "hidden")
 
 
-def check_verification_code_in_5_minutes(headers, sender_info):
-    """
-    Check the inbox for a verification code email from a specific sender within the last 5 minutes.
-    """
-    messages_url = f"{BASE_URL}/messages"
-    try:
-        # Fetch messages
-        response = requests.get(
-            messages_url, headers=headers, timeout=30, verify=False)
-        response.raise_for_status()
-
-    except RequestException as e:
-        pytest.fail(f"An error occurred while fetching messages: {e}")
-
-    filtered_messages = []
-    if response.status_code == 200:
-        messages = json.loads(response.text)['hydra:member']
-        current_time = datetime.now().replace(tzinfo=pytz.utc)
-        sorted_messages = sorted(
-            messages,
-            key=lambda x: datetime.fromisoformat(
-                x['createdAt'].replace('Z', '+00:00')),
-            reverse=True
-        )
-
-        # Filter messages from the last 5 minutes
-        for message in sorted_messages:
-            time.sleep(2)  # Optional delay for debugging
-            if all(key in message for key in ('createdAt', 'from', 'subject')):
-                received_time = datetime.fromisoformat(
-                    message['createdAt'].replace('Z', '+00:00'))
-                time_n_minutes_ago = current_time - timedelta(minutes=5)
-
-                if received_time > time_n_minutes_ago:
-                    if 'from' in message and len(message['from']) > 0:
-                        if (message['from']['name'] == sender_info['sender_name'] and
-                                message['from']['address'] == sender_info['sender_email']):
-                            filtered_messages.append(message)
-                            print(
-                                f"Verification code email found: {message['id']}")
-                    else:
-                        pytest.fail("The 'from' field is missing or empty.")
-            else:
-                pytest.fail(
-                    "One of the required fields is missing in the message.")
-
-        if not filtered_messages:
-            pytest.fail(f"No matching emails found in the last {5} minutes.")
-    else:
-        pytest.fail(
-            f"Failed to fetch emails. Status code: {response.status_code}")
-
-    # Sort and select the most recent matched mail
-    filtered_messages.sort(
-        key=lambda x: datetime.fromisoformat(
-            x['createdAt'].replace('Z', '+00:00')),
-        reverse=True
-    )
-    email_id = filtered_messages[0]['id']
-    email_url = f"{BASE_URL}/messages/{email_id}"
-    print('Verification mail URL is:', email_url)
-
-    # Fetch the email content
-    print('GET', email_url)
-    print('header:', headers)
-    response = requests.get(email_url, headers=headers)
-    if response.status_code != 200:
-        pytest.fail(
-            f"Failed to fetch email. Status code: {response.status_code}")
-
-    verification_email_html = response.json().get('text', '')
-
-    # Extract the verification code using regex
-    match = re.search(r'\b\d{6}\b', verification_email_html)
-    if match:
-        verification_code = match.group(0)
-        print("Verification Code:", verification_code)
-        return verification_code
-    else:
-        pytest.fail("No verification code found.")
-
-
-def check_phone_verification_code_in_5_minutes(phone_info):
-    """
-    Fetch the most recent verification code from Twilio.
-    """
-    twilio_account_sid = os.getenv("TWILIO_ACCOUNT_SID")
-    twilio_auth_token = os.getenv("TWILIO_AUTH_TOKEN")
-
-    if not twilio_account_sid or not twilio_auth_token:
-        raise ValueError("Twilio credentials are not configured correctly.")
-
-    client = Client(twilio_account_sid, twilio_auth_token)
-    current_time = datetime.utcnow()
+@when(parsers.parse('I wait for {minutes:d} minutes'))
+def wait_for_minutes(page: Page, minutes: int):
+    wait_time_ms = minutes * 60 * 1000
+    print(f"Waiting for {minutes} minutes...")
+    waits.sleep(page, wait_time_ms)
+    print(f"Finished waiting for {minutes} minutes.")
 
-    print(f"Phone info received: {phone_info}")
-    region_code = phone_info.get("region_code", "")
-    phone_number = phone_info.get("phone_number", "")
 
-    messages = client.messages.list(
-        to=f"{region_code}{phone_number}",
-        date_sent_after=current_time - timedelta(minutes=5),
-        limit=10  # Search limit up to 10 messages
-    )
+@then('I logout')
+def logout_homepage(page: Page):
+    login_page.user_menu(page).click()
+    logout_link = login_page.logout_link(page)
+    waits.wait_for_locator(logout_link)
+    logout_link.click()
 
-    if not messages:
-        raise ValueError("No messages found in the last 5 minutes.")
 
-    for message in messages:
-        print(f"Message received: {message.body}")
+@then(parsers.parse("the login modal is interactive within {budget:d} ms"))
+def check_login_modal_budget(web_perf, budget):
+    check_budget("login modal interactive time (ms)", web_perf.measurements.get("login modal"),
+                 budget)
 
-        match = re.search(r'\b\d{6}\b', message.body)
-        if match:
-            print(f"Verification code extracted: {match.group(0)}")
-            return match.group(0)
 
-    raise ValueError("No verification code found in messages.")
+@then(parsers.parse("the {metric} is within {budget:d} ms"))
+def check_page_metric_budget(page: Page, web_perf, metric, budget):
+    web_perf.collect(page)
+    check_budget(f"{metric} (ms)", web_perf.metric(metric), budget)
 
 
-@when(parsers.parse('I wait for {minutes:d} minutes'))
-def wait_for_minutes(page: Page, minutes: int):
-    wait_time_ms = minutes * 60 * 1000
-    print(f"Waiting for {minutes} minutes...")
-    page.wait_for_timeout(wait_time_ms)
-    print(f"Finished waiting for {minutes} minutes.")
+@then(parsers.parse("the layout shift score is below {budget:f}"))
+def check_layout_shift_budget(page: Page, web_perf, budget):
+    check_budget("layout shift score", web_perf.collect(page)["cls"], budget)
 
 
-@then('I logout')
-def logout_homepage(page: Page):
-    page.get_by_role("link", name="User").click()
-    page.wait_for_timeout(3000)
-    page.get_by_role("link", name="登出").click()
+@then(parsers.parse("the login API requests finish within {budget:d} ms"))
+def check_login_api_budget(web_perf, budget):
+    slowest = web_perf.slowest_api_request()
+    assert slowest, "No login API request was captured."
+    check_budget(f"{slowest['method']} {slowest['url']} (ms)", slowest["duration"], budget)
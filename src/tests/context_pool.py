@@ -0,0 +1,100 @@
+import time
+from collections import deque
+
+# Pools of this process's session, for the terminal summary
+pools = []
+
+
+class PooledContext:
+    """
+    A pre-created context. Its routes call `route`, which hands each request
+    to the filter of the scenario that has it checked out.
+    """
+
+    def __init__(self):
+        self.context = None
+        self.request_filter = None
+
+    def route(self, route):
+        if self.request_filter is None:
+            route.fallback()
+            return
+        self.request_filter.handle(route)
+
+
+class ContextPool:
+    """
+    Keep `size` browser contexts, each with a page, created ahead of the scenarios.
+
+    `create(pooled)` builds a configured context whose routes go through
+    `pooled.route`, for filters with the given `rules`. A scenario checks a
+    context out and it is closed when the scenario checks it back in, so no
+    state leaks between scenarios.
+
+    The Playwright sync API cannot be used from another thread, so a closed
+    context is replaced by `warm_up()` between scenarios: see refill_pools().
+    A checkout that finds the pool empty creates a context on demand.
+    """
+
+    def __init__(self, create, size=2, rules=None):
+        self.create = create
+        self.size = size
+        self.rules = rules
+        self.idle = deque()
+        self.hits = 0
+        self.misses = 0
+        self.warmups = 0
+        self.warmup_seconds = 0.0
+        self.miss_seconds = 0.0
+
+    def _new(self):
+        started = time.monotonic()
+        pooled = PooledContext()
+        pooled.context = self.create(pooled)
+        pooled.context.new_page()
+        self.warmups += 1
+        self.warmup_seconds += time.monotonic() - started
+        return pooled
+
+    def warm_up(self):
+        while len(self.idle) < self.size:
+            self.idle.append(self._new())
+
+    def serves(self, request_filter):
+        return request_filter is None or request_filter.rules() == self.rules
+
+    def checkout(self, request_filter=None):
+        if self.idle:
+            self.hits += 1
+            pooled = self.idle.popleft()
+        else:
+            self.misses += 1
+            started = time.monotonic()
+            pooled = self._new()
+            self.miss_seconds += time.monotonic() - started
+        pooled.request_filter = request_filter
+        return pooled.context
+
+    def checkin(self, context):
+        context.close()
+
+    def close(self):
+        while self.idle:
+            self.idle.popleft().context.close()
+
+    def summary_line(self):
+        checkouts = self.hits + self.misses
+        mean_warmup = self.warmup_seconds / self.warmups if self.warmups else 0.0
+        return (f"{self.hits}/{checkouts} contexts ready at checkout, {self.misses} created on demand "
+                f"({self.miss_seconds:.2f}s); {self.warmups} warm-ups, "
+                f"mean {mean_warmup * 1000:.0f} ms")
+
+
+def refill_pools():
+    """
+    Top up the pools of this process, replacing the contexts checked in.
+    Called after every scenario has finished, so the next one finds a
+    context ready whatever steps the previous one ran.
+    """
+    for pool in pools:
+        pool.warm_up()
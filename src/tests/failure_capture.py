@@ -0,0 +1,184 @@
+import os
+import re
+import tempfile
+import time
+from collections import deque
+
+import pytest
+from playwright.sync_api import Error as PlaywrightError
+
+CAPTURE_DIR = os.path.join("results", "failures")
+# Console messages and network events kept per page
+MAX_EVENTS = 500
+# What is captured: "logs" keeps console/network events and screenshots the
+# failure, "screenshots" adds a screenshot after every step, "trace" adds a
+# Playwright trace chunk per step
+MODES = ("off", "logs", "screenshots", "trace")
+
+
+def capture_name(nodeid):
+    return re.sub(r"[^\w.-]+", "_", nodeid.split("::")[-1]).strip("_")
+
+
+class FailureCapture:
+    """
+    A rolling window of what happened on one page, kept in memory.
+
+    Console messages, page errors and network responses go to a bounded
+    event log. Depending on the mode, the last `window` steps also leave a
+    JPEG screenshot and a trace chunk. Nothing is written unless `dump()` is
+    called, so a passing scenario only pays for the event handlers (and the
+    per-step screenshots or trace chunks when those are turned on).
+    """
+
+    def __init__(self, page, mode="logs", window=5, max_events=MAX_EVENTS):
+        self.page = page
+        self.mode = mode
+        self.events = deque(maxlen=max_events)
+        self.screenshots = deque(maxlen=window)
+        self.trace_chunks = deque(maxlen=window)
+        self.current_step = None
+        self._chunk_open = False
+        page.on("console", lambda message: self.log("console", f"{message.type}: {message.text}"))
+        page.on("pageerror", lambda error: self.log("pageerror", str(error)))
+        page.on("requestfailed", lambda request: self.log(
+            "requestfailed", f"{request.method} {request.url} {request.failure}"))
+        page.on("response", lambda response: self.log(
+            "response", f"{response.status} {response.request.method} {response.url}"))
+        if mode == "trace":
+            page.context.tracing.start(screenshots=True, snapshots=True)
+
+    def log(self, kind, text):
+        self.events.append((time.time(), self.current_step, kind, text))
+
+    def step_started(self, name):
+        self.current_step = name
+        if self.mode == "trace":
+            self.page.context.tracing.start_chunk(title=name)
+            self._chunk_open = True
+
+    def step_finished(self):
+        if self.mode in ("screenshots", "trace"):
+            self.screenshots.append(
+                (self.current_step, self.page.screenshot(type="jpeg", quality=40)))
+        if self._chunk_open:
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, "chunk.zip")
+                self.page.context.tracing.stop_chunk(path=path)
+                with open(path, "rb") as f:
+                    self.trace_chunks.append((self.current_step, f.read()))
+            self._chunk_open = False
+
+    def step_failed(self, exception):
+        self.log("step failed", f"{type(exception).__name__}: {exception}")
+
+    def dump(self, directory):
+        """
+        Write the window to `directory`, plus a screenshot and the HTML of the
+        page as it is now. Returns the paths written.
+        """
+        os.makedirs(directory, exist_ok=True)
+        written = []
+
+        def write(name, data, mode="wb"):
+            path = os.path.join(directory, name)
+            with open(path, mode) as f:
+                f.write(data)
+            written.append(path)
+
+        if not self.page.is_closed():
+            try:
+                write("failure.png", self.page.screenshot(full_page=True))
+                write("page.html", self.page.content(), "w")
+            except PlaywrightError as e:
+                self.log("capture", f"Could not capture the page: {e}")
+        for index, (step, image) in enumerate(self.screenshots, 1):
+            write(f"step-{index:02d}.jpg", image)
+        chunks = list(self.trace_chunks)
+        if self._chunk_open:
+            path = os.path.join(directory, f"trace-{len(chunks) + 1:02d}.zip")
+            try:
+                self.page.context.tracing.stop_chunk(path=path)
+                written.append(path)
+            except PlaywrightError as e:
+                self.log("capture", f"Could not save the trace of the failed step: {e}")
+            self._chunk_open = False
+        for index, (step, data) in enumerate(chunks, 1):
+            write(f"trace-{index:02d}.zip", data)
+        write("events.log", "".join(
+            f"{time.strftime('%H:%M:%S', time.localtime(at))}.{int(at * 1000) % 1000:03d} "
+            f"[{step or '-'}] {kind}: {text}\n"
+            for at, step, kind, text in self.events), "w")
+        return written
+
+
+class FailureCapturePlugin:
+    """
+    Keep a FailureCapture of each scenario's page and write it to
+    `--failure-capture-dir` when the scenario fails. The directory is linked
+    from the JUnit XML (`failure_capture` property) and the HTML report.
+    """
+
+    def __init__(self, config):
+        self.mode = config.getoption("failure_capture")
+        self.window = config.getoption("failure_capture_window")
+        self.output_dir = config.getoption("failure_capture_dir")
+        self.html_dir = os.path.dirname(getattr(config.option, "htmlpath", None) or "") or "."
+        self.captures = {}
+        self.written = []
+
+    def watch(self, item, page):
+        if self.mode != "off":
+            self.captures[item.nodeid] = FailureCapture(page, self.mode, self.window)
+
+    def pytest_bdd_before_step(self, request, step):
+        capture = self.captures.get(request.node.nodeid)
+        if capture:
+            capture.step_started(f"{step.type} {step.name}")
+
+    def pytest_bdd_after_step(self, request, step):
+        capture = self.captures.get(request.node.nodeid)
+        if capture:
+            capture.step_finished()
+
+    def pytest_bdd_step_error(self, request, step, exception):
+        capture = self.captures.get(request.node.nodeid)
+        if capture:
+            capture.step_failed(exception)
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_makereport(self, item, call):
+        outcome = yield
+        report = outcome.get_result()
+        if report.when == "teardown":
+            self.captures.pop(item.nodeid, None)
+            return
+        capture = self.captures.get(item.nodeid)
+        if capture is None or report.when != "call" or not report.failed:
+            return
+        directory = os.path.join(self.output_dir, capture_name(item.nodeid))
+        paths = capture.dump(directory)
+        self.written.append(directory)
+        item.user_properties.append(("failure_capture", directory))
+        self._link_in_html(report, paths)
+
+    def _link_in_html(self, report, paths):
+        try:
+            from pytest_html import extras
+        except ImportError:
+            return
+        links = []
+        for path in paths:
+            relative = os.path.relpath(path, self.html_dir)
+            name = os.path.basename(path)
+            if name == "failure.png":
+                links.append(extras.image(relative, name))
+            else:
+                links.append(extras.url(relative, name))
+        report.extras = getattr(report, "extras", []) + links
+
+    def pytest_terminal_summary(self, terminalreporter):
+        if self.written:
+            terminalreporter.section("failure capture")
+            for directory in self.written:
+                terminalreporter.write_line(directory)
@@ -0,0 +1,158 @@
+import json
+import queue
+import time
+import uuid
+from datetime import datetime, timezone
+
+from fake_server import FakeServer
+
+FAKE_DOMAIN = "dogcat.fake"
+PAGE_SIZE = 30
+
+
+class FakeMailtm(FakeServer):
+    """
+    Local stand-in for the mail.tm API and its Mercure event stream.
+
+    Messages are added with `deliver()`. Every delivered message is pushed to
+    the open Mercure subscriptions of its account, like mail.tm does. With
+    `auto_accounts`, logging in to an unknown address creates its inbox.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, faults=None, auto_accounts=False):
+        super().__init__(host, port, faults)
+        self.auto_accounts = auto_accounts
+        self.accounts = {}
+        self.messages = {}
+        self.mercure_enabled = True
+        self._subscribers = {}
+        self.add_route("GET", r"/(accounts|domains)", self.list_domains)
+        self.add_route("POST", r"/accounts", self.create_account)
+        self.add_route("POST", r"/token", self.issue_token)
+        self.add_route("GET", r"/me", self.get_me)
+        self.add_route("GET", r"/messages", self.list_messages)
+        self.add_route("GET", r"/messages/(?P<message_id>[^/]+)", self.get_message)
+        self.add_route("GET", r"/\.well-known/mercure", self.subscribe)
+
+    @property
+    def mercure_url(self):
+        return f"{self.base_url}/.well-known/mercure"
+
+    def add_account(self, address, password):
+        account = {
+            "id": uuid.uuid4().hex,
+            "address": address,
+            "password": password,
+            "token": uuid.uuid4().hex,
+        }
+        self.accounts[address] = account
+        self.messages[account["id"]] = []
+        self._subscribers[account["id"]] = []
+        return account
+
+    def deliver(self, address, sender_email, sender_name, text, subject="Verification code",
+                created_at=None):
+        """
+        Put a message in the inbox of `address` and notify its subscribers.
+        """
+        account = self.accounts[address]
+        message = {
+            "@type": "Message",
+            "id": uuid.uuid4().hex,
+            "accountId": account["id"],
+            "from": {"address": sender_email, "name": sender_name},
+            "to": [{"address": address, "name": ""}],
+            "subject": subject,
+            "intro": text[:100],
+            "seen": False,
+            "createdAt": (created_at or datetime.now(timezone.utc)).isoformat().replace(
+                "+00:00", "Z"),
+        }
+        stored = dict(message, text=text, deliveredAt=time.monotonic())
+        with self._lock:
+            self.messages[account["id"]].insert(0, stored)
+            subscribers = list(self._subscribers[account["id"]])
+        for subscriber in subscribers:
+            subscriber.put(message)
+        return stored
+
+    def _account_for(self, request):
+        token = (request.headers.get("Authorization") or "").replace("Bearer ", "")
+        for account in self.accounts.values():
+            if account["token"] == token:
+                return account
+        return None
+
+    def list_domains(self, request):
+        return 200, {"hydra:member": [{"id": "1", "domain": FAKE_DOMAIN, "isActive": True}]}
+
+    def create_account(self, request):
+        payload = request.json()
+        if payload["address"] in self.accounts:
+            return 422, {"detail": "address: This value is already used."}
+        account = self.add_account(payload["address"], payload["password"])
+        return 201, {"id": account["id"], "address": account["address"]}
+
+    def issue_token(self, request):
+        payload = request.json()
+        account = self.accounts.get(payload.get("address"))
+        if account is None and self.auto_accounts and payload.get("address"):
+            account = self.add_account(payload["address"], payload.get("password"))
+        if not account or account["password"] != payload.get("password"):
+            return 401, {"message": "Invalid credentials."}
+        return 200, {"id": account["id"], "token": account["token"]}
+
+    def get_me(self, request):
+        account = self._account_for(request)
+        if not account:
+            return 401, {"message": "JWT Token not found"}
+        return 200, {"id": account["id"], "address": account["address"]}
+
+    def list_messages(self, request):
+        account = self._account_for(request)
+        if not account:
+            return 401, {"message": "JWT Token not found"}
+        page = int(request.arg("page", 1))
+        with self._lock:
+            inbox = self.messages[account["id"]]
+            members = inbox[(page - 1) * PAGE_SIZE:page * PAGE_SIZE]
+            total = len(inbox)
+        summaries = [{key: value for key, value in message.items()
+                      if key not in ("text", "deliveredAt")} for message in members]
+        return 200, {"hydra:member": summaries, "hydra:totalItems": total}
+
+    def get_message(self, request):
+        account = self._account_for(request)
+        if not account:
+            return 401, {"message": "JWT Token not found"}
+        with self._lock:
+            for message in self.messages[account["id"]]:
+                if message["id"] == request.params["message_id"]:
+                    return 200, {key: value for key, value in message.items()
+                                 if key != "deliveredAt"}
+        return 404, {"detail": "Not Found"}
+
+    def subscribe(self, request):
+        if not self.mercure_enabled:
+            return 503, {"detail": "Mercure hub unavailable"}
+        account = self._account_for(request)
+        topic = request.arg("topic", "")
+        if not account or topic != f"/accounts/{account['id']}":
+            return 401, {"detail": "Unauthorized topic"}
+        subscriber = queue.Queue()
+        with self._lock:
+            self._subscribers[account["id"]].append(subscriber)
+        return 200, self._events(account["id"], subscriber)
+
+    def _events(self, account_id, subscriber):
+        try:
+            yield ":\n\n"
+            while not self.stopped.is_set():
+                try:
+                    message = subscriber.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                yield f"id: {message['id']}\ndata: {json.dumps(message)}\n\n"
+        finally:
+            with self._lock:
+                self._subscribers[account_id].remove(subscriber)
@@ -0,0 +1,256 @@
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+class FakeRequest:
+    """
+    The parts of an incoming request a fake route handler needs.
+    """
+
+    def __init__(self, method, path, query, headers, body, params):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.headers = headers
+        self.body = body
+        self.params = params
+
+    def json(self):
+        return json.loads(self.body or b"{}")
+
+    def arg(self, name, default=None):
+        values = self.query.get(name)
+        return values[0] if values else default
+
+
+def parse_latency(spec):
+    """
+    A latency sampler (returning seconds) from a spec in milliseconds:
+    `fixed:50`, `uniform:20:200` or `lognormal:80:300` (median and p95).
+    """
+    kind, *values = spec.split(":")
+    values = [float(value) / 1000 for value in values]
+    if kind == "fixed" and len(values) == 1:
+        return lambda rng: values[0]
+    if kind == "uniform" and len(values) == 2:
+        return lambda rng: rng.uniform(*values)
+    if kind == "lognormal" and len(values) == 2:
+        median, p95 = values
+        sigma = math.log(p95 / median) / 1.645
+        return lambda rng: rng.lognormvariate(math.log(median), sigma)
+    raise ValueError(f"Unknown latency spec: {spec}")
+
+
+class Faults:
+    """
+    Latency, rate limiting and errors a fake server injects into its responses.
+
+    `latency` is a parse_latency spec, `rate` the requests per second served
+    before answering 429 with Retry-After, and `error_rate` the share of
+    requests answered with `error_status`. Injected faults are counted in
+    `injected`. `seed` makes the sampled latencies and errors repeatable.
+    """
+
+    def __init__(self, latency=None, rate=None, error_rate=0.0, error_status=503, seed=None):
+        self.latency = latency
+        self.sample_latency = parse_latency(latency) if latency else None
+        self.rate = rate
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.injected = Counter()
+        self._random = random.Random(seed)
+        self._tokens = rate or 0
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_spec(cls, spec):
+        """
+        Faults from e.g. `latency=lognormal:80:300,rate=8,errors=0.05:500,seed=1`.
+        """
+        options = {}
+        for part in filter(None, (part.strip() for part in (spec or "").split(","))):
+            name, _, value = part.partition("=")
+            if name == "latency":
+                options["latency"] = value
+            elif name == "rate":
+                options["rate"] = float(value)
+            elif name == "errors":
+                error_rate, _, status = value.partition(":")
+                options["error_rate"] = float(error_rate)
+                if status:
+                    options["error_status"] = int(status)
+            elif name == "seed":
+                options["seed"] = int(value)
+            else:
+                raise ValueError(f"Unknown fault option: {name}")
+        return cls(**options)
+
+    def delay(self):
+        with self._lock:
+            return self.sample_latency(self._random) if self.sample_latency else 0.0
+
+    def failure(self):
+        """
+        The response that replaces the real one, or None to serve the request.
+        """
+        with self._lock:
+            if self.rate:
+                now = time.monotonic()
+                self._tokens = min(self.rate, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens < 1:
+                    self.injected["rate_limited"] += 1
+                    retry_after = (1 - self._tokens) / self.rate
+                    return 429, {"detail": "Too Many Requests"}, {
+                        "Retry-After": f"{retry_after:.2f}"}
+                self._tokens -= 1
+            if self.error_rate and self._random.random() < self.error_rate:
+                self.injected[f"status_{self.error_status}"] += 1
+                return self.error_status, {"detail": "Injected failure"}
+        return None
+
+
+class FakeServer:
+    """
+    Threaded local HTTP server that stands in for a third-party API.
+
+    Subclasses register routes with `add_route(method, pattern, handler)`.
+    A handler receives a FakeRequest and returns `(status, payload)` or
+    `(status, payload, headers)`. A dict/list payload is sent as JSON; a
+    generator payload is streamed as `text/event-stream`. With `faults`,
+    every request is delayed, rate limited or failed as configured.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, faults=None):
+        self.host = host
+        self.port = port
+        self.faults = faults
+        self.routes = []
+        self.requests_log = []
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+        self.stopped = threading.Event()
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def add_route(self, method, pattern, handler):
+        self.routes.append((method, re.compile(f"^{pattern}$"), handler))
+
+    def count_requests(self, method, pattern):
+        regex = re.compile(f"^{pattern}$")
+        with self._lock:
+            return sum(1 for logged_method, path in self.requests_log
+                       if logged_method == method and regex.match(path))
+
+    def start(self):
+        self.stopped.clear()
+        self._server = ThreadingHTTPServer(
+            (self.host, self.port), self._handler_class())
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def dispatch(self, request):
+        with self._lock:
+            self.requests_log.append((request.method, request.path))
+        if self.faults is not None:
+            self.stopped.wait(self.faults.delay())
+            failure = self.faults.failure()
+            if failure:
+                return failure
+        for method, regex, handler in self.routes:
+            match = regex.match(request.path)
+            if method == request.method and match:
+                request.params = match.groupdict()
+                return handler(request)
+        return 404, {"detail": f"No fake route for {request.method} {request.path}"}
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _handle(self):
+                url = urlsplit(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                request = FakeRequest(self.command, url.path, parse_qs(url.query),
+                                      self.headers, body, {})
+                result = fake.dispatch(request)
+                status, payload = result[0], result[1]
+                headers = result[2] if len(result) > 2 else {}
+                if hasattr(payload, "__next__"):
+                    self._stream(status, payload, headers)
+                else:
+                    self._send(status, payload, headers)
+
+            def _send(self, status, payload, headers):
+                if isinstance(payload, (dict, list)):
+                    data = json.dumps(payload).encode()
+                    content_type = "application/json"
+                else:
+                    data = (payload or "").encode()
+                    content_type = "text/plain"
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, status, chunks, headers):
+                self.send_response(status)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Transfer-Encoding", "chunked")
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.close_connection = True
+                try:
+                    for chunk in chunks:
+                        data = chunk.encode()
+                        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                        self.wfile.flush()
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            do_GET = _handle
+            do_POST = _handle
+            do_PATCH = _handle
+            do_DELETE = _handle
+
+        return Handler
@@ -0,0 +1,94 @@
+import os
+
+import http_client
+from fake_mailtm import FakeMailtm
+from fake_server import Faults
+from fake_testrail import FakeTestRail
+from fake_twilio import ACCOUNT_SID, FakeTwilio
+
+# Carries the fake mail.tm URL to pytest workers and child processes
+MAILTM_URL_VARIABLE = "FAKE_MAILTM_URL"
+# Base URLs of the mail.tm API and its Mercure hub, both served by FakeMailtm
+MAILTM_HOSTS = ("https://api.mail.tm", "https://mercure.mail.tm")
+TWILIO_AUTH_TOKEN = "fake-auth-token"
+TESTRAIL_ACCOUNT = "qa@example.com"
+TESTRAIL_TOKEN = "token"
+
+
+def point_at_fakes(environ=os.environ):
+    """
+    Send the mail.tm calls of this process to the fake named in `environ`.
+    Returns False when no fake is configured.
+    """
+    url = environ.get(MAILTM_URL_VARIABLE)
+    if not url:
+        return False
+    http_client.override_hosts({host: url for host in MAILTM_HOSTS})
+    return True
+
+
+class FakeServices:
+    """
+    The fakes of mail.tm, Twilio and TestRail on local ports.
+
+    Each fake gets its own Faults from `faults_spec` (see Faults.from_spec), so
+    they are rate limited separately like the real services. `install()` points
+    this process and the processes it starts at them: mail.tm calls through
+    http_client's host overrides, Twilio and TestRail through the environment
+    variables their clients already read. The fake mail.tm creates an inbox on
+    the first login to it.
+    """
+
+    def __init__(self, faults_spec=None):
+        self.faults_spec = faults_spec
+        self.mailtm = FakeMailtm(faults=Faults.from_spec(faults_spec), auto_accounts=True)
+        self.twilio = FakeTwilio(faults=Faults.from_spec(faults_spec))
+        self.testrail = FakeTestRail(account=TESTRAIL_ACCOUNT, token=TESTRAIL_TOKEN,
+                                     faults=Faults.from_spec(faults_spec))
+
+    @property
+    def servers(self):
+        return dict(mailtm=self.mailtm, twilio=self.twilio, testrail=self.testrail)
+
+    def start(self):
+        for server in self.servers.values():
+            server.start()
+        return self
+
+    def stop(self):
+        for server in self.servers.values():
+            server.stop()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def environment(self):
+        return {
+            MAILTM_URL_VARIABLE: self.mailtm.base_url,
+            "TWILIO_API_BASE_URL": self.twilio.base_url,
+            "TWILIO_ACCOUNT_SID": ACCOUNT_SID,
+            "TWILIO_AUTH_TOKEN": TWILIO_AUTH_TOKEN,
+            "TESTRAIL_URL": self.testrail.base_url,
+            "TESTRAIL_ACCOUNT": TESTRAIL_ACCOUNT,
+            "TESTRAIL_TOKEN": TESTRAIL_TOKEN,
+        }
+
+    def install(self):
+        os.environ.update(self.environment())
+        point_at_fakes()
+
+    def uninstall(self):
+        for name in self.environment():
+            os.environ.pop(name, None)
+        http_client.override_hosts({})
+
+    def summary_lines(self):
+        lines = []
+        for name, server in self.servers.items():
+            injected = ", ".join(f"{count} {fault}" for fault, count
+                                 in server.faults.injected.most_common()) or "none"
+            lines.append(f"{name}: {len(server.requests_log)} requests, injected faults: {injected}")
+        return lines
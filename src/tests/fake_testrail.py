@@ -0,0 +1,64 @@
+import base64
+import threading
+
+from fake_server import FakeServer
+
+
+class FakeTestRail(FakeServer):
+    """
+    Local stand-in for the TestRail result endpoints.
+
+    Accepted results are kept in `results` as (run_id, result) pairs. Queue
+    responses in `scripted_responses`, e.g. `(429, {}, {"Retry-After": "1"})`,
+    to make the next requests fail.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, account="qa@example.com", token="token",
+                 faults=None):
+        super().__init__(host, port, faults)
+        self.credentials = base64.b64encode(f"{account}:{token}".encode()).decode()
+        self.results = []
+        self.scripted_responses = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._results_lock = threading.Lock()
+        self.add_route("POST", r"/add_result_for_case/(?P<run_id>\d+)/(?P<case_id>\d+)",
+                       self.add_result_for_case)
+        self.add_route("POST", r"/add_results_for_cases/(?P<run_id>\d+)",
+                       self.add_results_for_cases)
+
+    def _check(self, request):
+        if request.headers.get("Authorization") != f"Basic {self.credentials}":
+            return 401, {"error": "Authentication failed: invalid or missing user/password or session cookie."}
+        with self._results_lock:
+            if self.scripted_responses:
+                return self.scripted_responses.pop(0)
+        return None
+
+    def add_result_for_case(self, request):
+        failure = self._check(request)
+        if failure:
+            return failure
+        result = dict(request.json(), case_id=int(request.params["case_id"]))
+        with self._results_lock:
+            self.results.append((int(request.params["run_id"]), result))
+        return 200, dict(result, id=len(self.results))
+
+    def add_results_for_cases(self, request):
+        failure = self._check(request)
+        if failure:
+            return failure
+        with self._results_lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            # Hold the request briefly so concurrent uploads overlap
+            self.stopped.wait(0.05)
+            results = request.json()["results"]
+            with self._results_lock:
+                for result in results:
+                    self.results.append((int(request.params["run_id"]), result))
+            return 200, [dict(result, id=index) for index, result in enumerate(results)]
+        finally:
+            with self._results_lock:
+                self.in_flight -= 1
@@ -0,0 +1,68 @@
+import time
+import uuid
+from datetime import datetime, timezone
+from email.utils import format_datetime
+
+from fake_server import FakeServer
+
+ACCOUNT_SID = "AC" + "0" * 32
+
+
+class FakeTwilio(FakeServer):
+    """
+    Local stand-in for the Twilio Messages list API.
+
+    Like Twilio, the `DateSent>` filter only compares dates, so callers must
+    check the exact send time themselves.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, faults=None):
+        super().__init__(host, port, faults)
+        self.messages = []
+        self.add_route("GET", r"/2010-04-01/Accounts/(?P<account_sid>[^/]+)/Messages\.json",
+                       self.list_messages)
+
+    def send_sms(self, to, body, sent_at=None, from_="+15005550006"):
+        sent_at = sent_at or datetime.now(timezone.utc)
+        message = {
+            "sid": "SM" + uuid.uuid4().hex,
+            "account_sid": ACCOUNT_SID,
+            "to": to,
+            "from": from_,
+            "body": body,
+            "status": "received",
+            "direction": "inbound",
+            "num_segments": "1",
+            "date_created": format_datetime(sent_at, usegmt=True),
+            "date_sent": format_datetime(sent_at, usegmt=True),
+            "date_updated": format_datetime(sent_at, usegmt=True),
+            "sentAt": sent_at,
+            "deliveredAt": time.monotonic(),
+        }
+        with self._lock:
+            self.messages.insert(0, message)
+        return message
+
+    def list_messages(self, request):
+        to = request.arg("To")
+        sent_after = request.arg("DateSent>")
+        page_size = int(request.arg("PageSize", 50))
+        with self._lock:
+            messages = [message for message in self.messages
+                        if (not to or message["to"] == to)
+                        and (not sent_after
+                             or message["sentAt"].date().isoformat() >= sent_after[:10])]
+        uri = f"/2010-04-01/Accounts/{request.params['account_sid']}/Messages.json"
+        return 200, {
+            "messages": [{key: value for key, value in message.items()
+                          if key not in ("sentAt", "deliveredAt")}
+                         for message in messages[:page_size]],
+            "end": min(page_size, len(messages)) - 1,
+            "first_page_uri": f"{uri}?PageSize={page_size}&Page=0",
+            "next_page_uri": None,
+            "page": 0,
+            "page_size": page_size,
+            "previous_page_uri": None,
+            "start": 0,
+            "uri": uri,
+        }
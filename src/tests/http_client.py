@@ -0,0 +1,468 @@
+import fcntl
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+from stats import percentile
+
+# requests is imported on first use: it is the slowest import of conftest.py
+# and many runs (--collect-only, UI-only scenarios) never make an API call.
+
+DEFAULT_TIMEOUT = 30
+MAX_RETRIES = 3
+BACKOFF_SECONDS = 0.5
+MAX_BACKOFF_SECONDS = 30
+
+# 429 and 503 mean the request was not processed, so any method may be retried.
+ALWAYS_RETRY_STATUSES = {429, 503}
+IDEMPOTENT_RETRY_STATUSES = {500, 502, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+# Tolerated difference between this machine's clock and the timestamps of
+# external services, e.g. when checking a message was sent after a request
+CLOCK_SKEW = timedelta(seconds=5)
+
+# Requests per second allowed per host, shared by every process on this
+# machine. mail.tm allows 8 queries per second per IP. Twilio limits the
+# concurrent requests of an account instead; 10 per second keeps the message
+# polling of many workers well under it.
+HOST_RATE_LIMITS = {
+    "api.mail.tm": 8,
+    "api.twilio.com": 10,
+}
+
+# Token buckets and circuit breakers shared between processes, one file each
+STATE_DIR = os.path.join(".cache", "http-state")
+# The providers whose outage fails the calls of a circuit breaker fast. Other
+# hosts, e.g. TestRail or the site itself, are always called.
+BREAKER_HOSTS = ("api.mail.tm", "api.twilio.com")
+# Consecutive failed attempts (connection errors, timeouts, 5xx) that open a
+# host's circuit, and the seconds it stays open before one call may probe it
+BREAKER_THRESHOLD = 5
+BREAKER_COOLDOWN = 30
+
+_lock = threading.Lock()
+_sessions = {}
+_limiters = {}
+_breakers = {}
+_breaker_settings = {"threshold": BREAKER_THRESHOLD, "cooldown": BREAKER_COOLDOWN}
+_breaker_hosts = set(BREAKER_HOSTS)
+_state_dir = STATE_DIR
+_metrics = []
+# Cassette that records or replays the calls to its hosts, see recording.py
+_cassette = None
+# Base URLs sent elsewhere, e.g. to the local fakes of fake_services.py
+_host_overrides = {}
+
+
+@contextmanager
+def _locked_state(path):
+    """
+    The JSON state in `path`, locked against other processes and threads until
+    the block ends. Changes made to the yielded dict are written back.
+    """
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    with os.fdopen(fd, "r+") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            content = f.read()
+            state = json.loads(content) if content else {}
+        except ValueError:
+            state = {}
+        before = dict(state)
+        yield state
+        if state != before:
+            f.seek(0)
+            f.truncate()
+            json.dump(state, f)
+
+
+def _state_path(state_dir, host, kind):
+    os.makedirs(state_dir, exist_ok=True)
+    return os.path.join(state_dir, f"{host.replace(':', '_')}.{kind}.json")
+
+
+class SharedRateLimiter:
+    """
+    Token bucket that allows `rate` requests per second with bursts up to
+    `capacity`, kept in a locked file so that every pytest process on this
+    machine draws from the same bucket of a host.
+    """
+
+    def __init__(self, host, rate, capacity=None, state_dir=STATE_DIR):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.path = _state_path(state_dir, host, "bucket")
+
+    def acquire(self):
+        """
+        Block until a request may be sent. Returns the seconds spent waiting.
+        """
+        started = time.monotonic()
+        while True:
+            with _locked_state(self.path) as bucket:
+                now = time.time()
+                tokens = min(self.capacity, bucket.get("tokens", self.capacity)
+                             + max(0.0, now - bucket.get("updated_at", now)) * self.rate)
+                bucket["updated_at"] = now
+                if tokens >= 1:
+                    bucket["tokens"] = tokens - 1
+                    return time.monotonic() - started
+                bucket["tokens"] = tokens
+                delay = (1 - tokens) / self.rate
+            time.sleep(delay)
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling a host whose circuit is open.
+    """
+
+
+class CircuitBreaker:
+    """
+    Fast-fails the calls to a host after `threshold` consecutive failed attempts
+    by any process, instead of letting every scenario wait out the timeouts.
+
+    After `cooldown` seconds one call is let through as a probe (the others
+    still fail fast): if it succeeds the circuit closes, if it fails the
+    circuit opens for another cooldown.
+    """
+
+    def __init__(self, host, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN,
+                 state_dir=STATE_DIR):
+        self.host = host
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.path = _state_path(state_dir, host, "breaker")
+
+    def check(self):
+        with _locked_state(self.path) as breaker:
+            if breaker.get("failures", 0) < self.threshold:
+                return
+            now = time.time()
+            # A process with a higher threshold may have counted the failures
+            # without opening the circuit, so open_until can be missing
+            until = max(breaker.get("open_until", 0), breaker.get("probe_until", 0))
+            if now >= until:
+                breaker["probe_until"] = now + self.cooldown
+                return
+            raise CircuitOpenError(
+                f"{self.host} is failing, not calling it for another {until - now:.0f}s "
+                f"after {breaker['failures']} failures (last: {breaker.get('last_error')})")
+
+    def record_success(self):
+        with _locked_state(self.path) as breaker:
+            breaker.clear()
+
+    def record_failure(self, error):
+        with _locked_state(self.path) as breaker:
+            breaker["failures"] = breaker.get("failures", 0) + 1
+            breaker["last_error"] = error
+            if breaker["failures"] >= self.threshold:
+                if breaker["failures"] == self.threshold:
+                    print(f"Opening the circuit of {self.host} for {self.cooldown}s: {error}")
+                breaker["open_until"] = time.time() + self.cooldown
+                breaker.pop("probe_until", None)
+
+
+def _host_of(url):
+    return urlsplit(url).netloc
+
+
+def get_session(url):
+    """
+    Return the keep-alive Session shared by every call to the host of `url`.
+    """
+    parts = urlsplit(url)
+    key = f"{parts.scheme}://{parts.netloc}"
+    with _lock:
+        session = _sessions.get(key)
+        if session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=16)
+            session.mount(f"{key}/", adapter)
+            _sessions[key] = session
+        return session
+
+
+def use_cassette(cassette):
+    """
+    Record or replay calls through `cassette` until it is replaced; None turns it off.
+    """
+    global _cassette
+    _cassette = cassette
+
+
+def override_hosts(overrides):
+    """
+    Send the calls to each base URL of `overrides` (e.g. "https://api.mail.tm")
+    to the base URL it maps to instead. Rate limits and metrics stay those of
+    the original host. An empty mapping turns the overrides off.
+    """
+    with _lock:
+        _host_overrides.clear()
+        _host_overrides.update(overrides)
+
+
+def _target_url(url):
+    parts = urlsplit(url)
+    target = _host_overrides.get(f"{parts.scheme}://{parts.netloc}")
+    return target + url[len(parts.scheme) + 3 + len(parts.netloc):] if target else url
+
+
+def now():
+    """
+    The current UTC time. An active cassette records it, and returns the
+    recorded value on replay, so it matches the replayed responses.
+    """
+    cassette = _cassette
+    return cassette.now() if cassette is not None else datetime.now(timezone.utc)
+
+
+def use_state_dir(state_dir):
+    """
+    Keep the shared rate limits and circuits in `state_dir` from now on, e.g.
+    a temporary directory so a test does not share them with other runs.
+    """
+    global _state_dir
+    with _lock:
+        _state_dir = state_dir
+        _limiters.clear()
+        _breakers.clear()
+
+
+def get_rate_limiter(host):
+    with _lock:
+        if host not in _limiters and host in HOST_RATE_LIMITS:
+            _limiters[host] = SharedRateLimiter(host, HOST_RATE_LIMITS[host], state_dir=_state_dir)
+        return _limiters.get(host)
+
+
+def configure_circuit_breakers(threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN,
+                               hosts=BREAKER_HOSTS):
+    """
+    Set when the circuits of `hosts` open and for how long; a threshold of 0
+    turns them off.
+    """
+    with _lock:
+        _breaker_settings.update(threshold=threshold, cooldown=cooldown)
+        _breaker_hosts.clear()
+        _breaker_hosts.update(hosts)
+        _breakers.clear()
+
+
+def get_circuit_breaker(host):
+    with _lock:
+        if not _breaker_settings["threshold"] or host not in _breaker_hosts:
+            return None
+        if host not in _breakers:
+            _breakers[host] = CircuitBreaker(host, state_dir=_state_dir, **_breaker_settings)
+        return _breakers[host]
+
+
+def _retry_after(response, attempt):
+    value = response.headers.get("Retry-After") if response is not None else None
+    if value:
+        try:
+            delay = float(value)
+        except ValueError:
+            try:
+                delay = parsedate_to_datetime(value).timestamp() - time.time()
+            except (TypeError, ValueError):
+                print(f"Ignoring the malformed Retry-After header {value!r}")
+                delay = None
+        if delay is not None:
+            return min(max(0.0, delay), MAX_BACKOFF_SECONDS)
+    return min(BACKOFF_SECONDS * 2 ** attempt, MAX_BACKOFF_SECONDS)
+
+
+def _should_retry(method, status_code):
+    if status_code in ALWAYS_RETRY_STATUSES:
+        return True
+    return status_code in IDEMPOTENT_RETRY_STATUSES and method in IDEMPOTENT_METHODS
+
+
+def record_metric(host, method, path, status, elapsed, attempts=1, throttled=0.0,
+                  kind="call", queued=0.0, rejected=False):
+    """
+    Record one external call. `kind` is "call" for a request/response and
+    "stream" for time spent reading a long-lived stream such as Mercure.
+    `queued` is the time spent waiting for the host's shared rate limit,
+    `throttled` the time spent backing off after the host refused a request,
+    and `rejected` marks a call its open circuit failed without sending.
+    """
+    with _lock:
+        _metrics.append({
+            "host": host,
+            "method": method,
+            "path": path,
+            "status": status,
+            "elapsed": elapsed,
+            "attempts": attempts,
+            "throttled": throttled,
+            "queued": queued,
+            "rejected": rejected,
+            "kind": kind,
+            "thread": threading.get_ident(),
+        })
+
+
+def request(method, url, retries=MAX_RETRIES, timeout=DEFAULT_TIMEOUT, **kwargs):
+    """
+    Send a request through the pooled session for its host.
+
+    Waits for the host's rate limit, retries 429/5xx responses and connection
+    errors with backoff (honouring Retry-After), and records the latency.
+    Raises CircuitOpenError without sending when the host keeps failing.
+    The final response is returned as is; callers check the status code.
+    Calls to the hosts of an active cassette are recorded or replayed.
+    """
+    from requests.exceptions import ConnectionError, Timeout
+
+    method = method.upper()
+    host = _host_of(url)
+    path = urlsplit(url).path
+    cassette = _cassette
+    if cassette is not None and cassette.covers(url):
+        if cassette.mode == "replay":
+            started = time.monotonic()
+            response = cassette.replay(method, url, kwargs.get("params"))
+            record_metric(host, method, path, response.status_code,
+                          time.monotonic() - started)
+            return response
+    else:
+        cassette = None
+    target = _target_url(url)
+    session = get_session(target)
+    limiter = get_rate_limiter(host)
+    breaker = get_circuit_breaker(host)
+    queued = throttled = 0.0
+    started = time.monotonic()
+    attempt = 0
+    while True:
+        if breaker:
+            try:
+                breaker.check()
+            except CircuitOpenError:
+                record_metric(host, method, path, None, time.monotonic() - started,
+                              attempt, throttled, queued=queued, rejected=True)
+                raise
+        if limiter:
+            queued += limiter.acquire()
+        try:
+            response = session.request(method, target, timeout=timeout, **kwargs)
+        except (ConnectionError, Timeout) as e:
+            if breaker:
+                breaker.record_failure(f"{type(e).__name__}: {e}"[:200])
+            if attempt >= retries or method not in IDEMPOTENT_METHODS:
+                record_metric(host, method, path, None, time.monotonic() - started,
+                              attempt + 1, throttled, queued=queued)
+                raise
+            time.sleep(_retry_after(None, attempt))
+            attempt += 1
+            continue
+        if breaker:
+            if response.status_code >= 500:
+                breaker.record_failure(f"{method} {path} returned {response.status_code}")
+            elif response.status_code != 429:
+                breaker.record_success()
+        if attempt < retries and _should_retry(method, response.status_code):
+            delay = _retry_after(response, attempt)
+            print(f"{method} {url} returned {response.status_code}, retrying in {delay:.1f}s")
+            response.close()
+            time.sleep(delay)
+            throttled += delay
+            attempt += 1
+            continue
+        record_metric(host, method, path, response.status_code,
+                      time.monotonic() - started, attempt + 1, throttled, queued=queued)
+        if cassette is not None:
+            cassette.record(method, url, kwargs.get("params"), response,
+                            stream=kwargs.get("stream", False))
+        return response
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+def get_metrics(since=0):
+    with _lock:
+        return list(_metrics[since:])
+
+
+def metrics_count():
+    with _lock:
+        return len(_metrics)
+
+
+def reset_metrics():
+    with _lock:
+        _metrics.clear()
+
+
+def latency_summary():
+    """
+    Summarise the recorded calls per host: count, p50/p95/max latency, retries,
+    time queued for the shared rate limit and throttled by the host, and calls
+    rejected by an open circuit.
+    """
+    by_host = {}
+    for metric in get_metrics():
+        if metric["kind"] != "call":
+            continue
+        by_host.setdefault(metric["host"], []).append(metric)
+    summary = {}
+    for host, calls in by_host.items():
+        latencies = [call["elapsed"] for call in calls]
+        queued = [call.get("queued", 0.0) for call in calls]
+        summary[host] = {
+            "calls": len(calls),
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "max": max(latencies),
+            "retries": sum(max(0, call["attempts"] - 1) for call in calls),
+            "throttled": sum(call["throttled"] for call in calls),
+            "queued": sum(queued),
+            "queued_p95": percentile(queued, 95),
+            "rejected": sum(1 for call in calls if call.get("rejected")),
+        }
+    return summary
+
+
+def latency_summary_lines():
+    return [
+        f"{host}: {stats['calls']} calls, p50 {stats['p50'] * 1000:.0f} ms, "
+        f"p95 {stats['p95'] * 1000:.0f} ms, max {stats['max'] * 1000:.0f} ms, "
+        f"{stats['retries']} retries, {stats['queued']:.2f}s queued "
+        f"(p95 {stats['queued_p95'] * 1000:.0f} ms), {stats['throttled']:.2f}s throttled"
+        + (f", {stats['rejected']} rejected by the open circuit" if stats["rejected"] else "")
+        for host, stats in latency_summary().items()
+    ]
+
+
+def write_latency_summary(path):
+    """
+    Write latency_summary() as JSON, e.g. to compare the queued time of runs
+    with different numbers of workers.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(latency_summary(), f, indent=4, sort_keys=True)
+
+
+def print_latency_summary():
+    for line in latency_summary_lines():
+        print(line)
@@ -0,0 +1,221 @@
+import asyncio
+import json
+import time
+from collections import Counter
+
+from account_lease import LEASE_DIR, AccountLeases
+from async_scenarios import load_scenarios, run_scenario
+from stats import percentile
+
+# Seconds per bucket of the throughput timeline
+INTERVAL = 10
+# The steps that tell whether a scenario can log in with a fresh mail.tm inbox:
+# it reads the code sent to the account's email and never types a password
+EMAIL_CODE_STEP = "I check the verification code in the email"
+PASSWORD_STEP = "I fill the password"
+
+
+class Pacer:
+    """
+    Spaces the iteration starts of all virtual users to `rate` per second.
+    Without a rate, every user starts its next iteration right away.
+    """
+
+    def __init__(self, rate=None):
+        self.rate = rate
+        self.next_start = None
+
+    async def wait(self):
+        if not self.rate:
+            return
+        now = time.monotonic()
+        start = max(now, self.next_start or now)
+        self.next_start = start + 1 / self.rate
+        await asyncio.sleep(start - now)
+
+
+def load_accounts(path):
+    """
+    The account sets of the virtual users: a JSON list whose items map Given
+    step targets to accounts, e.g. {"user": {"email": ..., "password": ...},
+    "mail_account": {...}, "phone_info": {"region_code": ..., "phone_number": ...}}.
+    """
+    if not path:
+        return []
+    with open(path) as f:
+        return json.load(f)
+
+
+def pooled_account_sets(scenarios, users, mailtm_pool, lease_dir=LEASE_DIR):
+    """
+    One account set per user for a load run without an accounts file: each
+    user logs in with its own inbox of `mailtm_pool`.
+    Raises ValueError for scenarios that cannot log in with an inbox, since
+    all users would otherwise queue for the one account of the feature file.
+    """
+    unpooled = [scenario.name for scenario in scenarios
+                if not any(step.name == EMAIL_CODE_STEP for step in scenario.steps)
+                or any(step.name == PASSWORD_STEP for step in scenario.steps)]
+    if unpooled:
+        raise ValueError(
+            f"{users} users would share one account in: {', '.join(unpooled)}. "
+            "Only email verification code logins get pooled inboxes; give the users "
+            "their own accounts with an accounts file")
+    # One lease holder per user, as re-leasing a held inbox is a no-op. The
+    # leases are dropped again once every user has a distinct inbox: each
+    # iteration leases its user's inbox in the mail account step
+    leases = [AccountLeases(lease_dir) for _ in range(users)]
+    try:
+        inboxes = [mailtm_pool.lease(user_leases) for user_leases in leases]
+    finally:
+        for user_leases in leases:
+            user_leases.release_all()
+    return [{"user": inbox, "mail_account": inbox} for inbox in inboxes]
+
+
+async def run_virtual_users(scenarios, registry, open_state, close_state, users, ramp_up=0,
+                            rate=None, duration=60, iterations=None):
+    """
+    Run `users` virtual users in the current event loop, each repeating the
+    scenarios in turn until `duration` seconds pass or it ran `iterations`.
+
+    User n starts `n * ramp_up / users` seconds in. `open_state(user)`
+    prepares the state of one iteration of a user (its own context and
+    accounts) and `close_state(state)` cleans it up. Returns one result
+    record per iteration (see run_scenario) with its user and start offset.
+    """
+    pacer = Pacer(rate)
+    records = []
+    started = time.monotonic()
+    deadline = started + duration
+
+    async def virtual_user(user):
+        await asyncio.sleep(user * ramp_up / users)
+        count = 0
+        while time.monotonic() < deadline and (iterations is None or count < iterations):
+            await pacer.wait()
+            if time.monotonic() >= deadline:
+                return
+            scenario = scenarios[(user + count) % len(scenarios)]
+            count += 1
+            iteration_started = time.monotonic()
+            try:
+                state = await open_state(user)
+            except Exception as e:
+                result = dict(feature=scenario.feature.rel_filename, scenario=scenario.name,
+                              passed=False, error=f"{type(e).__name__}: {e}", steps=[],
+                              seconds=time.monotonic() - iteration_started)
+            else:
+                try:
+                    result = await run_scenario(scenario, registry, state)
+                finally:
+                    await close_state(state)
+            result.update(user=user, started=iteration_started - started)
+            records.append(result)
+
+    await asyncio.gather(*(virtual_user(user) for user in range(users)))
+    return records
+
+
+def latency_stats(values):
+    return {"p50": percentile(values, 50), "p95": percentile(values, 95),
+            "p99": percentile(values, 99), "max": max(values), "samples": len(values)}
+
+
+def build_report(records, wall, interval=INTERVAL):
+    """
+    Per-step and end-to-end latency percentiles, error rate, and the
+    throughput of every `interval` seconds of the run.
+    """
+    passed = [record for record in records if record["passed"]]
+    steps = {}
+    for record in records:
+        for step in record["steps"]:
+            steps.setdefault(step["step"], []).append(step["seconds"])
+    buckets = {}
+    for record in records:
+        bucket = buckets.setdefault(int((record["started"] + record["seconds"]) // interval),
+                                    Counter())
+        bucket["passed" if record["passed"] else "failed"] += 1
+    timeline = [dict(start=index * interval, passed=bucket["passed"], failed=bucket["failed"],
+                     per_min=(bucket["passed"] + bucket["failed"]) / interval * 60)
+                for index, bucket in sorted(buckets.items())]
+    errors = Counter(record["error"].splitlines()[0][:160] for record in records
+                     if record["error"])
+    return dict(
+        iterations=len(records),
+        passed=len(passed),
+        error_rate=(len(records) - len(passed)) / len(records) if records else 0,
+        wall=wall,
+        per_min=len(records) / wall * 60 if wall else 0,
+        end_to_end=latency_stats([record["seconds"] for record in passed]) if passed else None,
+        steps={step: latency_stats(values) for step, values in steps.items()},
+        timeline=timeline,
+        errors=errors.most_common(),
+    )
+
+
+def report_lines(report):
+    lines = [f"{report['iterations']} iterations ({report['passed']} passed, "
+             f"{report['error_rate']:.1%} errors) in {report['wall']:.1f}s: "
+             f"{report['per_min']:.1f} iterations/min"]
+    if report["end_to_end"]:
+        stats = report["end_to_end"]
+        lines.append(f"end to end: p50 {stats['p50']:.2f}s, p95 {stats['p95']:.2f}s, "
+                     f"p99 {stats['p99']:.2f}s, max {stats['max']:.2f}s")
+    lines.append("steps:")
+    for step, stats in sorted(report["steps"].items(), key=lambda item: -item[1]["p95"]):
+        lines.append(f"    p50 {stats['p50']:6.2f}s  p95 {stats['p95']:6.2f}s  "
+                     f"p99 {stats['p99']:6.2f}s  ({stats['samples']})  {step}")
+    lines.append("throughput:")
+    for bucket in report["timeline"]:
+        lines.append(f"    {bucket['start']:5d}s  {bucket['per_min']:6.1f}/min  "
+                     f"{bucket['passed']} passed, {bucket['failed']} failed")
+    if report["errors"]:
+        lines.append("errors:")
+        for error, count in report["errors"]:
+            lines.append(f"    {count:5d}  {error}")
+    return lines
+
+
+async def run_load(paths, users=10, ramp_up=0, rate=None, duration=60, iterations=None,
+                   browsers=1, tags=None, accounts=(), headless=True, otp_timeout=300):
+    """
+    Run the login scenarios of the feature files under `paths` as virtual
+    users on the async steps. The users share `browsers` Chromium instances,
+    with a new context per iteration, and user n logs in with
+    `accounts[n % len(accounts)]` when account sets are given, or with its
+    own mail.tm inbox otherwise (see pooled_account_sets).
+    Returns the iteration records and the wall time in seconds.
+    """
+    from playwright.async_api import async_playwright
+
+    import browser_server
+    from async_steps import STEPS, close_state, open_state
+    from mailtm_pool import MailtmPool
+
+    scenarios = load_scenarios(paths, tags)
+    if accounts and len(accounts) < users:
+        print(f"{users} users share {len(accounts)} account sets, so some wait for a lease")
+    mailtm_pool = MailtmPool()
+    if not accounts and users > 1:
+        accounts = await asyncio.to_thread(pooled_account_sets, scenarios, users, mailtm_pool)
+    started = time.monotonic()
+    async with async_playwright() as playwright:
+        instances = [await playwright.chromium.launch(
+                         **browser_server.launch_options(headless=headless))
+                     for _ in range(browsers)]
+
+        async def open_user_state(user):
+            return await open_state(
+                instances[user % browsers], mailtm_pool, otp_timeout=otp_timeout,
+                accounts=accounts[user % len(accounts)] if accounts else None)
+
+        try:
+            records = await run_virtual_users(
+                scenarios, STEPS, open_user_state, close_state, users, ramp_up, rate,
+                duration, iterations)
+        finally:
+            for instance in instances:
+                await instance.close()
+    return records, time.monotonic() - started
@@ -0,0 +1,100 @@
+import re
+
+# Locators of the site's login flow, shared by the sync steps of conftest.py
+# and async_steps.py. Building a locator does not talk to the browser, so the
+# same functions serve pages of the sync and the async Playwright API.
+
+LOGIN_OPTION = re.compile(r"^使用 .*登入$")
+PASSWORD_PROMPT = re.compile(r"^輸入密碼$")
+# Login types whose form stays in the site's login modal; the others are SSO
+# logins that leave the site for the provider's login page
+IN_MODAL_LOGIN_TYPES = ("電子信箱", "手機驗證")
+
+
+def leaves_site(login_type):
+    return login_type not in IN_MODAL_LOGIN_TYPES
+
+
+def user_menu(page):
+    return page.get_by_role("link", name="User")
+
+
+def member_center_link(page):
+    return page.get_by_role("link", name="會員中心")
+
+
+def logout_link(page):
+    return page.get_by_role("link", name="登出")
+
+
+def confirm_modal_button(page):
+    return page.get_by_role("button", name="確定前往")
+
+
+def first_login_option(page):
+    return page.get_by_role("button", name=LOGIN_OPTION).first
+
+
+def login_type_button(page, login_type):
+    # The email option has a space before 登入, the others do not
+    separator = " " if login_type == "電子信箱" else ""
+    return page.locator(f'role=button[name="使用 {login_type}{separator}登入"]')
+
+
+def login_input(page):
+    """
+    The email or phone number field of the login modal, reused for the password.
+    """
+    return page.get_by_placeholder("請輸入", exact=True)
+
+
+def password_login_button(page):
+    return page.get_by_role("button", name="密碼登入")
+
+
+def password_prompt(page):
+    return page.locator("div").filter(has_text=PASSWORD_PROMPT)
+
+
+def confirm_button(page):
+    return page.get_by_role("button", name="確認")
+
+
+def region_button(page):
+    return page.locator('xpath=//*[@id="theme-provider"]/div/div/div/div[1]/div/div[1]')
+
+
+def region_option(page):
+    return page.locator("//li[@data-option-index='1']")
+
+
+def otp_inputs(page):
+    return page.locator("form input[type='tel']")
+
+
+def line_email(page):
+    return page.locator("input[name=\"tid\"]")
+
+
+def line_password(page):
+    return page.locator("input[name=\"tpasswd\"]")
+
+
+def line_login_button(page):
+    return page.get_by_role("button", name="Log in")
+
+
+def facebook_email(page):
+    return page.locator("#email")
+
+
+def facebook_password(page):
+    return page.locator("#pass")
+
+
+def facebook_login_button(page):
+    return page.locator("button[name='login']")
+
+
+def facebook_continue_as(page, username):
+    return page.get_by_label(f"以 {username} 的身分繼續")
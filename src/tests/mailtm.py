@@ -1,5 +1,6 @@
 import pytest
-import requests
+
+import http_client
 
 api_url = "https://api.mail.tm/accounts"
 base_url = "https://api.mail.tm"
@@ -15,7 +16,7 @@ def mailtm_account(email, password):
     }
 
     # Send the account creation request
-    response = requests.post(api_url, json=payload)
+    response = http_client.post(api_url, json=payload)
     if response.status_code == 201:
         account_data = response.json()
         return {"email": email, "password": password, "id": account_data["id"]}
@@ -25,7 +26,7 @@ def mailtm_account(email, password):
 
 def get_mailtm_domains():
 
-    response = requests.get(api_url)
+    response = http_client.get(f"{base_url}/domains")
     if response.status_code == 200:
         domains_data = response.json()
         return [domain["domain"] for domain in domains_data["hydra:member"]]
@@ -38,7 +39,7 @@ def create_account(email, password):
         "address": email,
         "password": password
     }
-    response = requests.post(api_url, json=payload)
+    response = http_client.post(api_url, json=payload)
     if response.status_code == 201:
         account_data = response.json()
         return {"email": email, "password": password, "id": account_data["id"]}
@@ -82,7 +83,7 @@ def login_to_mailtm(mail_account, mail_password, mailtm_headers):
         "password": mail_password
     }
 
-    response = requests.post(
+    response = http_client.post(
         token_url,
         headers={
             "accept": "application/json",
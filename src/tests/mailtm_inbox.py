@@ -0,0 +1,159 @@
+import threading
+from bisect import bisect_right
+from datetime import datetime
+
+import http_client
+from mailtm import base_url
+
+# Messages per page of GET /messages
+PAGE_SIZE = 30
+
+# Indexes per (API, token), shared by every wait on the same inbox in this process
+_indexes = {}
+_lock = threading.Lock()
+
+
+def parse_created_at(created_at):
+    return datetime.fromisoformat(created_at.replace('Z', '+00:00'))
+
+
+def sender_key(address, name):
+    return (address or "").lower(), name or ""
+
+
+def index_for(headers, api_url=base_url):
+    """
+    The inbox index of the token in `headers`, created on first use.
+    """
+    key = (api_url, headers.get("Authorization"))
+    with _lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = InboxIndex(headers, api_url)
+        return index
+
+
+class InboxIndex:
+    """
+    Message metadata of one mail.tm inbox, indexed by id and by sender.
+
+    `refresh` pages through GET /messages (newest first) only until it reaches
+    messages already covered: everything after the high-watermark, or after
+    the oldest `since` asked for so far. Timestamps are parsed once, per-sender
+    lists are kept sorted by time, so "messages from X after T" is a bisect.
+    Bodies are downloaded on first use and cached.
+    """
+
+    def __init__(self, headers, api_url=base_url, page_size=PAGE_SIZE):
+        self.headers = headers
+        self.api_url = api_url
+        self.page_size = page_size
+        self.messages = {}
+        # sender -> (sorted timestamps, message ids in the same order)
+        self.by_sender = {}
+        self.bodies = {}
+        # Newest createdAt seen by a refresh, the time since which every message
+        # is indexed, and whether the oldest message was reached
+        self.watermark = None
+        self.floor = None
+        self.complete = False
+        self.pages_fetched = 0
+        self._lock = threading.RLock()
+
+    def add(self, message):
+        """
+        Index one message summary. Returns False when it is already indexed.
+        """
+        with self._lock:
+            if message['id'] in self.messages or 'createdAt' not in message:
+                return False
+            created = parse_created_at(message['createdAt'])
+            sender = message.get('from') or {}
+            key = sender_key(sender.get('address'), sender.get('name'))
+            self.messages[message['id']] = dict(
+                id=message['id'], sender=key, subject=message.get('subject'),
+                created=created)
+            timestamps, ids = self.by_sender.setdefault(key, ([], []))
+            position = bisect_right(timestamps, created.timestamp())
+            timestamps.insert(position, created.timestamp())
+            ids.insert(position, message['id'])
+            return True
+
+    def _fetch_page(self, page):
+        response = http_client.get(
+            f"{self.api_url}/messages", params={"page": page}, headers=self.headers, timeout=10)
+        response.raise_for_status()
+        self.pages_fetched += 1
+        return response.json()['hydra:member']
+
+    def refresh(self, since=None):
+        """
+        Fetch the messages not indexed yet, newest first, and return the new ones.
+
+        Paging stops at the watermark of the previous refresh. A `since` older
+        than what the index covers pages back to it once.
+        """
+        with self._lock:
+            deep = (since is not None and not self.complete
+                    and (self.floor is None or since < self.floor))
+            boundary = since if deep else self.watermark
+            added = []
+            oldest = None
+            page = 1
+            while True:
+                members = self._fetch_page(page)
+                for message in members:
+                    if self.add(message):
+                        added.append(self.messages[message['id']])
+                if not members:
+                    self.complete = True
+                    break
+                if page == 1:
+                    newest = parse_created_at(members[0]['createdAt'])
+                    self.watermark = max(self.watermark or newest, newest)
+                oldest = parse_created_at(members[-1]['createdAt'])
+                if len(members) < self.page_size:
+                    self.complete = True
+                    break
+                if boundary is None or oldest < boundary:
+                    break
+                page += 1
+            # The pages fetched join up with what was indexed before
+            if oldest is not None:
+                self.floor = min(self.floor or oldest, oldest)
+            return added
+
+    def messages_from(self, sender_email, sender_name, after):
+        """
+        Messages of the sender created after `after`, newest first.
+        """
+        with self._lock:
+            timestamps, ids = self.by_sender.get(sender_key(sender_email, sender_name), ([], []))
+            start = bisect_right(timestamps, after.timestamp())
+            return [self.messages[message_id] for message_id in reversed(ids[start:])]
+
+    def latest_from(self, sender_email, sender_name, after):
+        """
+        The newest message of the sender if it was created after `after`, else None.
+        """
+        with self._lock:
+            timestamps, ids = self.by_sender.get(sender_key(sender_email, sender_name), ([], []))
+            if not timestamps or timestamps[-1] <= after.timestamp():
+                return None
+            return self.messages[ids[-1]]
+
+    def body(self, message_id):
+        """
+        The text of a message, downloaded once.
+        """
+        with self._lock:
+            if message_id in self.bodies:
+                return self.bodies[message_id]
+        response = http_client.get(
+            f"{self.api_url}/messages/{message_id}", headers=self.headers, timeout=10)
+        response.raise_for_status()
+        text = response.json().get('text', '')
+        with self._lock:
+            self.bodies[message_id] = text
+        return text
+
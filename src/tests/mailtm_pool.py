@@ -0,0 +1,254 @@
+import base64
+import json
+import os
+import secrets
+import tempfile
+import threading
+import time
+
+import http_client
+from account_lease import AccountLeases
+from mailtm import base_url
+
+POOL_PATH = os.path.join(".cache", "mailtm_pool.json")
+DOMAIN_TTL = 3600
+# Tokens without a readable expiry are assumed to last this long
+TOKEN_TTL = 3600
+# Tokens expiring sooner than this are renewed before they are handed out
+REFRESH_MARGIN = 300
+REFRESH_INTERVAL = 60
+ADDRESS_PREFIX = "dogcat"
+# Seconds a worker waits for another one saving the pool or creating inboxes,
+# like --account-lease-timeout
+LEASE_TIMEOUT = 600
+
+# Pools of this process, for the terminal summary
+pools = []
+
+
+def token_expiry(token, issued_at):
+    """
+    The `exp` claim of a mail.tm JWT, or `issued_at + TOKEN_TTL` when it has none.
+    """
+    try:
+        payload = token.split(".")[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+        return float(claims["exp"])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return issued_at + TOKEN_TTL
+
+
+class MailtmPool:
+    """
+    mail.tm inboxes, their tokens and the domain list, kept on disk across runs.
+
+    Tokens are reused until they get within `refresh_margin` seconds of their
+    expiry, and a background thread renews them before a scenario asks. The
+    file is shared by the pytest workers: every save merges what the others
+    wrote, under a lease, so the newest token of each inbox wins. Inboxes the
+    pool created itself are leased to scenarios like the accounts of the Given
+    steps, and new ones are created when all of them are taken.
+    """
+
+    def __init__(self, path=POOL_PATH, api_url=base_url, domain_ttl=DOMAIN_TTL,
+                 refresh_margin=REFRESH_MARGIN, lease_timeout=LEASE_TIMEOUT):
+        self.path = path
+        self.api_url = api_url
+        self.domain_ttl = domain_ttl
+        self.refresh_margin = refresh_margin
+        self.lease_timeout = lease_timeout
+        self.accounts = {}
+        self.domain_list = []
+        self.domains_fetched_at = 0
+        self.logins = 0
+        self.token_hits = 0
+        self._lock = threading.RLock()
+        self._stopped = threading.Event()
+        self._refresher = None
+        self.load()
+
+    def _file_lease(self, name):
+        leases = AccountLeases(timeout=self.lease_timeout, poll_interval=0.05)
+        leases.acquire(f"mailtm-pool:{name}:{os.path.abspath(self.path)}")
+        return leases
+
+    def load(self):
+        """
+        Merge the saved pool into this one, keeping the newer token of each inbox.
+        """
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        with self._lock:
+            for address, account in data.get("accounts", {}).items():
+                known = self.accounts.get(address)
+                if known is None or account.get("expires_at", 0) > known.get("expires_at", 0):
+                    self.accounts[address] = account
+            if data.get("domains_fetched_at", 0) > self.domains_fetched_at:
+                self.domain_list = data.get("domains", [])
+                self.domains_fetched_at = data["domains_fetched_at"]
+
+    def save(self):
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        leases = self._file_lease("save")
+        try:
+            with self._lock:
+                self.load()
+                data = dict(accounts=self.accounts, domains=self.domain_list,
+                            domains_fetched_at=self.domains_fetched_at)
+                # mkstemp creates the file 0600; it holds passwords and tokens
+                fd, temporary = tempfile.mkstemp(dir=directory, suffix=".tmp")
+                with os.fdopen(fd, "w") as f:
+                    json.dump(data, f, indent=4, sort_keys=True)
+                os.replace(temporary, self.path)
+        finally:
+            leases.release_all()
+
+    def domains(self):
+        """
+        The active mail.tm domains, fetched again after `domain_ttl` seconds.
+        """
+        with self._lock:
+            if self.domain_list and time.time() - self.domains_fetched_at < self.domain_ttl:
+                return self.domain_list
+        response = http_client.get(f"{self.api_url}/domains", timeout=10)
+        if response.status_code != 200:
+            raise Exception(f"Failed to fetch domains: {response.text}")
+        domains = [domain["domain"] for domain in response.json()["hydra:member"]
+                   if domain.get("isActive", True)]
+        with self._lock:
+            self.domain_list = domains
+            self.domains_fetched_at = time.time()
+        self.save()
+        return domains
+
+    def _login(self, address, password):
+        issued_at = time.time()
+        response = http_client.post(f"{self.api_url}/token",
+                                    json={"address": address, "password": password}, timeout=10)
+        if response.status_code != 200:
+            raise Exception(f"Failed to log in to Mail.tm as {address}: {response.text}")
+        token = response.json()["token"]
+        self.logins += 1
+        return dict(token=token, expires_at=token_expiry(token, issued_at))
+
+    def _fresh(self, account):
+        return bool(account.get("token")) and (
+            account.get("expires_at", 0) - time.time() > self.refresh_margin)
+
+    def authorization(self, address, password=None):
+        """
+        The Authorization header of `address`, logging in only without a fresh token.
+        An inbox not in the pool yet is added with `password`.
+        """
+        with self._lock:
+            account = self.accounts.get(address)
+            if account is None:
+                if password is None:
+                    raise KeyError(f"{address} is not in the mail.tm pool")
+                account = self.accounts[address] = dict(password=password)
+            elif password is not None and password != account["password"]:
+                account.update(password=password, token=None, expires_at=0)
+            if self._fresh(account):
+                self.token_hits += 1
+                return f"Bearer {account['token']}"
+            password = account["password"]
+        login = self._login(address, password)
+        with self._lock:
+            account.update(login)
+        self.save()
+        return f"Bearer {login['token']}"
+
+    def refresh_expiring(self):
+        """
+        Renew the tokens that are expired or about to expire. Returns how many were renewed.
+        """
+        with self._lock:
+            due = [(address, account["password"]) for address, account in self.accounts.items()
+                   if account.get("token") and not self._fresh(account)]
+        renewed = 0
+        for address, password in due:
+            try:
+                login = self._login(address, password)
+            except Exception as e:
+                print(f"Could not renew the mail.tm token of {address}: {e}")
+                continue
+            with self._lock:
+                self.accounts[address].update(login)
+            renewed += 1
+        if renewed:
+            self.save()
+        return renewed
+
+    def start_refresher(self, interval=REFRESH_INTERVAL):
+        if self._refresher is not None:
+            return
+
+        def refresh():
+            while not self._stopped.wait(interval):
+                self.refresh_expiring()
+
+        self._refresher = threading.Thread(target=refresh, name="mailtm-token-refresher",
+                                           daemon=True)
+        self._refresher.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._refresher is not None:
+            self._refresher.join()
+            self._refresher = None
+
+    def provisioned(self):
+        with self._lock:
+            return sorted(address for address, account in self.accounts.items()
+                          if account.get("provisioned"))
+
+    def provision(self, count, prefix=ADDRESS_PREFIX):
+        """
+        Create inboxes until the pool holds `count` of its own, logged in and saved.
+        Returns the addresses created.
+        """
+        leases = self._file_lease("provision")
+        try:
+            self.load()
+            created = []
+            while len(self.provisioned()) < count:
+                domain = self.domains()[0]
+                address = f"{prefix}-{secrets.token_hex(5)}@{domain}"
+                password = secrets.token_urlsafe(12)
+                response = http_client.post(f"{self.api_url}/accounts",
+                                            json={"address": address, "password": password},
+                                            timeout=10)
+                if response.status_code == 422:
+                    # Address already used
+                    continue
+                if response.status_code != 201:
+                    raise Exception(f"Failed to create Mail.tm account: {response.text}")
+                account = dict(password=password, id=response.json()["id"], provisioned=True)
+                account.update(self._login(address, password))
+                with self._lock:
+                    self.accounts[address] = account
+                created.append(address)
+            if created:
+                self.save()
+            return created
+        finally:
+            leases.release_all()
+
+    def lease(self, leases):
+        """
+        Lease a free inbox of the pool through `leases`, creating one when all
+        are taken. Returns the mail account of the scenario.
+        """
+        while True:
+            for address in self.provisioned():
+                if leases.try_acquire(f"mailtm:{address}"):
+                    return dict(email=address, password=self.accounts[address]["password"])
+            self.provision(len(self.provisioned()) + 1)
+
+    def summary_line(self):
+        return (f"{len(self.accounts)} inboxes ({len(self.provisioned())} provisioned): "
+                f"{self.token_hits} tokens reused, {self.logins} logins")
@@ -0,0 +1,150 @@
+import json
+import re
+import time
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlsplit
+
+import pytest
+from requests.exceptions import RequestException
+
+import http_client
+from mailtm import base_url
+from mailtm_inbox import index_for
+
+MERCURE_URL = "https://mercure.mail.tm/.well-known/mercure"
+CODE_PATTERN = re.compile(r'\b\d{6}\b')
+
+
+def get_account_id(headers, api_url=base_url):
+    response = http_client.get(f"{api_url}/me", headers=headers, timeout=10)
+    response.raise_for_status()
+    return response.json()['id']
+
+
+def listen_for_messages(headers, account_id, deadline, mercure_url=MERCURE_URL,
+                        on_open=None, read_timeout=30):
+    """
+    Yield the messages mail.tm pushes on the account's Mercure topic.
+
+    Stops at the deadline, or when the stream is closed or goes quiet for
+    `read_timeout` seconds. `on_open` is called once the subscription is live.
+    """
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        return
+    response = http_client.get(
+        mercure_url,
+        params={"topic": f"/accounts/{account_id}"},
+        headers=headers,
+        stream=True,
+        retries=0,
+        timeout=(5, min(read_timeout, remaining)),
+    )
+    # Time blocked on the stream counts as external time in the HTTP metrics
+    waited = 0.0
+    try:
+        response.raise_for_status()
+        if on_open:
+            yield from on_open()
+        data_lines = []
+        lines = response.iter_lines(chunk_size=None, decode_unicode=True)
+        while True:
+            started = time.monotonic()
+            line = next(lines, None)
+            waited += time.monotonic() - started
+            if line is None:
+                return
+            if line.startswith('data:'):
+                data_lines.append(line[5:].strip())
+            elif not line and data_lines:
+                event = json.loads('\n'.join(data_lines))
+                data_lines = []
+                if event.get('@type', 'Message') == 'Message':
+                    yield event
+            if time.monotonic() >= deadline:
+                return
+    finally:
+        response.close()
+        parts = urlsplit(mercure_url)
+        http_client.record_metric(parts.netloc, "GET", parts.path, response.status_code,
+                                  waited, kind="stream")
+
+
+def wait_for_verification_code(headers, sender_info, timeout=300, since=None,
+                               api_url=base_url, mercure_url=MERCURE_URL,
+                               poll_interval=1.0, max_poll_interval=10.0):
+    """
+    Wait until a verification code email from `sender_info` arrives and return the code.
+
+    Listens on the Mercure stream and falls back to polling with a growing
+    interval when the stream is unavailable or goes quiet. Messages come from
+    the token's inbox index, so only pages newer than its watermark are
+    fetched, and only the body of a matching message is downloaded.
+    Fails the test once `timeout` seconds pass.
+    """
+    deadline = time.monotonic() + timeout
+    since = since or datetime.now(timezone.utc) - timedelta(minutes=5)
+    index = index_for(headers, api_url)
+    checked_ids = set()
+
+    def find_code():
+        for message in index.messages_from(
+                sender_info['sender_email'], sender_info['sender_name'], since):
+            if message['id'] in checked_ids:
+                continue
+            checked_ids.add(message['id'])
+            print(f"Verification code email found: {message['id']}")
+            match = CODE_PATTERN.search(index.body(message['id']))
+            if match:
+                return match.group(0)
+        return None
+
+    try:
+        account_id = get_account_id(headers, api_url)
+    except RequestException as e:
+        print(f"Cannot resolve mail.tm account, polling instead: {e}")
+        account_id = None
+
+    interval = poll_interval
+    while time.monotonic() < deadline:
+        if account_id:
+            opened = []
+
+            def catch_up():
+                # Mail that arrived before the subscription went live is only visible via the API.
+                opened.append(True)
+                index.refresh(since)
+                yield None
+
+            try:
+                for message in listen_for_messages(headers, account_id, deadline,
+                                                   mercure_url, on_open=catch_up):
+                    if message is not None:
+                        index.add(message)
+                    code = find_code()
+                    if code:
+                        print("Verification Code:", code)
+                        return code
+            except RequestException as e:
+                if not opened:
+                    print(f"Mercure stream unavailable, polling instead: {e}")
+                    account_id = None
+                    continue
+            # The stream dropped or went quiet: reconnect, which polls once more.
+            time.sleep(max(0, min(poll_interval, deadline - time.monotonic())))
+            continue
+
+        try:
+            index.refresh(since)
+            code = find_code()
+        except RequestException as e:
+            print(f"An error occurred while fetching messages: {e}")
+            code = None
+        if code:
+            print("Verification Code:", code)
+            return code
+        time.sleep(max(0, min(interval, deadline - time.monotonic())))
+        interval = min(interval * 1.5, max_poll_interval)
+
+    pytest.fail(
+        f"No verification code from {sender_info['sender_email']} within {timeout} seconds.")
@@ -0,0 +1,242 @@
+import json
+import os
+import re
+from collections import Counter
+from urllib.parse import urlsplit
+
+# Resource types the login flows never need
+BLOCKED_RESOURCE_TYPES = ("image", "media", "font")
+
+# Analytics and ad tags loaded by the storefront. The Facebook and LINE
+# domains stay allowed because the SSO logins go through them.
+BLOCKED_DOMAINS = (
+    "google-analytics.com",
+    "googletagmanager.com",
+    "googleadservices.com",
+    "googlesyndication.com",
+    "doubleclick.net",
+    "hotjar.com",
+    "clarity.ms",
+    "criteo.com",
+    "criteo.net",
+    "analytics.tiktok.com",
+    "bat.bing.com",
+    "cdn.segment.com",
+)
+
+# URL extensions of each blocked resource type. Only matching URLs are routed
+# through Python; every routed request is a round trip to the test process.
+RESOURCE_TYPE_EXTENSIONS = {
+    "image": ("png", "jpe?g", "gif", "webp", "avif", "svg", "ico", "bmp"),
+    "media": ("mp4", "webm", "m3u8", "ts", "mov", "mp3", "ogg", "wav"),
+    "font": ("woff2?", "ttf", "otf", "eot"),
+}
+
+# Empty bodies for tags that are stubbed rather than aborted, so pages do not
+# run their script error handlers
+STUB_CONTENT_TYPES = {
+    "script": "text/javascript",
+    "stylesheet": "text/css",
+}
+
+SIZE_CACHE_PATH = os.path.join(".cache", "network_sizes.json")
+
+
+def domain_matches(host, domains):
+    return any(host == domain or host.endswith("." + domain) for domain in domains)
+
+
+def size_key(url):
+    """
+    Cache key of a URL: query strings are mostly cache busters, so they are dropped.
+    """
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}{parts.path}"
+
+
+class SizeCache:
+    """
+    Response sizes seen on unfiltered requests, used to estimate the bytes a blocked request saves.
+
+    Sizes come from Content-Length headers and are kept on disk between runs,
+    so a run with `--no-network-filter` teaches the estimates to later runs.
+    """
+
+    def __init__(self, path=SIZE_CACHE_PATH):
+        self.path = path
+        self.sizes = {}
+        self.changed = False
+        if path and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self.sizes = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable size cache {path}: {e}")
+
+    def get(self, url):
+        return self.sizes.get(size_key(url))
+
+    def learn(self, response):
+        length = response.headers.get("content-length")
+        if not length or not length.isdigit():
+            return
+        key = size_key(response.url)
+        if self.sizes.get(key) != int(length):
+            self.sizes[key] = int(length)
+            self.changed = True
+
+    def save(self):
+        if not self.path or not self.changed:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "w") as f:
+            json.dump(self.sizes, f, indent=0, sort_keys=True)
+        self.changed = False
+
+
+class FilterStats:
+    """
+    Requests a filter blocked and the bytes that saved, per reason.
+    """
+
+    def __init__(self):
+        self.requests = Counter()
+        self.bytes = Counter()
+        self.unknown_sizes = 0
+
+    def add(self, reason, size):
+        self.requests[reason] += 1
+        if size is None:
+            self.unknown_sizes += 1
+        else:
+            self.bytes[reason] += size
+
+    def merge(self, other):
+        self.requests.update(other.requests)
+        self.bytes.update(other.bytes)
+        self.unknown_sizes += other.unknown_sizes
+
+    @property
+    def total_requests(self):
+        return sum(self.requests.values())
+
+    @property
+    def total_bytes(self):
+        return sum(self.bytes.values())
+
+
+# Everything the scenarios of this process blocked
+session_stats = FilterStats()
+
+
+class NetworkFilter:
+    """
+    Routing rules for one scenario's browser context.
+
+    Requests of `resource_types` are aborted. Requests to `deny` domains are
+    stubbed with an empty response when they are scripts, styles or beacons,
+    and aborted otherwise. Hosts in `allow` are never filtered.
+    """
+
+    def __init__(self, resource_types=BLOCKED_RESOURCE_TYPES, deny=BLOCKED_DOMAINS,
+                 allow=(), size_cache=None, enabled=True):
+        self.resource_types = tuple(resource_types)
+        self.deny = tuple(deny)
+        self.allow = tuple(allow)
+        self.size_cache = size_cache
+        self.enabled = enabled
+        self.stats = FilterStats()
+
+    def rules(self):
+        return self.resource_types, self.deny, self.allow, self.enabled
+
+    def pattern(self):
+        """
+        Regex of the URLs that may be filtered, so the rest never leave the browser.
+        """
+        alternatives = []
+        if self.deny:
+            domains = "|".join(re.escape(domain) for domain in self.deny)
+            alternatives.append(rf"^[a-z]+://([^/?#]*\.)?({domains})(:\d+)?[/?#]")
+        extensions = [extension for resource_type in self.resource_types
+                      for extension in RESOURCE_TYPE_EXTENSIONS.get(resource_type, ())]
+        if extensions:
+            alternatives.append(rf"\.({'|'.join(extensions)})([?#]|$)")
+        if not alternatives:
+            return None
+        return re.compile("|".join(alternatives), re.IGNORECASE)
+
+    def decide(self, url, resource_type):
+        """
+        Return "abort", "stub" or None (let the request through) with the reason.
+        """
+        host = urlsplit(url).hostname or ""
+        if domain_matches(host, self.allow):
+            return None, None
+        if domain_matches(host, self.deny):
+            if resource_type in STUB_CONTENT_TYPES or resource_type in ("xhr", "fetch", "ping"):
+                return "stub", f"domain {host}"
+            return "abort", f"domain {host}"
+        if resource_type in self.resource_types:
+            return "abort", resource_type
+        return None, None
+
+    def install(self, context, handler=None):
+        """
+        Route the candidate URLs of `context` to `handler`, by default this filter.
+        """
+        if self.size_cache is not None:
+            context.on("response", self.size_cache.learn)
+        pattern = self.pattern()
+        if self.enabled and pattern:
+            context.route(pattern, handler or self.handle)
+        return context
+
+    def resolve(self, request):
+        """
+        Count the request if it is blocked and return the route method to call with its arguments.
+        """
+        action, reason = self.decide(request.url, request.resource_type)
+        if action is None:
+            # Leave the request to routes registered before this one
+            return "fallback", {}
+        size = self.size_cache.get(request.url) if self.size_cache is not None else None
+        self.stats.add(reason, size)
+        if action == "stub":
+            content_type = STUB_CONTENT_TYPES.get(request.resource_type)
+            if content_type:
+                return "fulfill", dict(status=200, content_type=content_type, body="")
+            return "fulfill", dict(status=204, body="")
+        return "abort", dict(error_code="blockedbyclient")
+
+    def handle(self, route):
+        method, arguments = self.resolve(route.request)
+        getattr(route, method)(**arguments)
+
+    async def handle_async(self, route):
+        """
+        `handle` for contexts of the async Playwright API.
+        """
+        method, arguments = self.resolve(route.request)
+        await getattr(route, method)(**arguments)
+
+
+def filter_from_options(config, marker=None, size_cache=None):
+    """
+    Build the filter of a scenario from the command line and its `network_filter` marker.
+
+    The marker's `allow`/`deny` extend the lists from the command line,
+    `resource_types` replaces them and `enabled=False` turns filtering off.
+    """
+    resource_types = config.getoption("block_resource_types")
+    resource_types = (BLOCKED_RESOURCE_TYPES if resource_types is None
+                      else [value for value in resource_types.split(",") if value])
+    deny = list(BLOCKED_DOMAINS) + config.getoption("block_domain")
+    allow = list(config.getoption("allow_domain"))
+    enabled = not config.getoption("no_network_filter")
+    if marker is not None:
+        allow += marker.kwargs.get("allow", [])
+        deny += marker.kwargs.get("deny", [])
+        resource_types = marker.kwargs.get("resource_types", resource_types)
+        enabled = marker.kwargs.get("enabled", enabled)
+    return NetworkFilter(resource_types, deny, allow, size_cache, enabled)
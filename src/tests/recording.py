@@ -0,0 +1,328 @@
+import base64
+import json
+import os
+import re
+import threading
+from collections import defaultdict
+from datetime import datetime, timezone
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import requests
+from requests.exceptions import ConnectionError
+
+# Query parameters that change on every run: cache busters, nonces, OAuth
+# state and tracking ids. They are left out when matching a request.
+VOLATILE_PARAMS = {
+    "_", "t", "ts", "v", "ver", "cb", "timestamp", "rand", "nonce", "_wpnonce",
+    "state", "code", "token", "access_token", "id_token", "session", "sid",
+    "gclid", "fbclid", "_ga", "_gl",
+}
+
+# Hosts whose API calls go through the http_client cassette
+CASSETTE_HOSTS = ("api.mail.tm", "mercure.mail.tm", "api.twilio.com")
+
+# Headers that describe the recorded transfer rather than the body being replayed
+TRANSFER_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection"}
+
+
+def match_key(method, url, params=None, ignore=VOLATILE_PARAMS):
+    """
+    The key a request is matched on: method, URL without fragment and the
+    sorted query (including `params`) minus volatile parameters.
+    """
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    if params:
+        query += list(params.items()) if isinstance(params, dict) else list(params)
+    query = sorted((str(name), str(value)) for name, value in query
+                   if str(name).lower() not in ignore and not str(name).lower().startswith("utm_"))
+    path = f"{parts.scheme}://{parts.netloc}{parts.path}"
+    return f"{method.upper()} {path}?{urlencode(query)}" if query else f"{method.upper()} {path}"
+
+
+def recording_name(nodeid):
+    """
+    File name of a scenario's recordings. Each feature file holds one scenario,
+    so this is also one recording per feature.
+    """
+    return re.sub(r"[^\w.-]+", "_", nodeid.split("::")[-1]).strip("_")
+
+
+class Sequence:
+    """
+    Recorded responses per match key, replayed in the order they were recorded.
+    Once a key's responses are used up its last response is repeated.
+    """
+
+    def __init__(self):
+        self.entries = defaultdict(list)
+        self.positions = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def add(self, key, entry):
+        self.entries[key].append(entry)
+
+    def next(self, key):
+        with self._lock:
+            entries = self.entries.get(key)
+            if not entries:
+                return None
+            position = self.positions[key]
+            self.positions[key] = position + 1
+            return entries[min(position, len(entries) - 1)]
+
+
+class HarReplayer:
+    """
+    Serve a context's requests from HAR files recorded with `record_har_path`.
+
+    Unlike `BrowserContext.route_from_har`, requests are matched with
+    `match_key`, so cache busters and nonces in the URL do not cause misses.
+    Unmatched requests are aborted (`not_found="abort"`) or left to the
+    network (`not_found="fallback"`).
+    """
+
+    def __init__(self, har_paths, not_found="abort", ignore=VOLATILE_PARAMS):
+        self.not_found = not_found
+        self.ignore = ignore
+        self.sequence = Sequence()
+        self.hits = 0
+        self.misses = []
+        for path in har_paths:
+            with open(path) as f:
+                har = json.load(f)
+            for entry in har["log"]["entries"]:
+                # Requests aborted while recording have no response to replay
+                if entry["response"].get("status", 0) <= 0:
+                    continue
+                request = entry["request"]
+                self.sequence.add(match_key(request["method"], request["url"],
+                                            ignore=ignore), entry["response"])
+
+    def install(self, context):
+        context.route("**/*", self.handle)
+        return context
+
+    def handle(self, route):
+        request = route.request
+        response = self.sequence.next(match_key(request.method, request.url, ignore=self.ignore))
+        if response is None:
+            self.misses.append(f"{request.method} {request.url}")
+            if self.not_found == "fallback":
+                route.fallback()
+            else:
+                route.abort("internetdisconnected")
+            return
+        self.hits += 1
+        headers = {}
+        for header in response.get("headers", []):
+            name = header["name"].lower()
+            if name in TRANSFER_HEADERS:
+                continue
+            # Playwright takes several Set-Cookie values separated by newlines
+            separator = "\n" if name == "set-cookie" else ", "
+            headers[name] = (f"{headers[name]}{separator}{header['value']}"
+                             if name in headers else header["value"])
+        content = response.get("content", {})
+        body = content.get("text", "")
+        body = base64.b64decode(body) if content.get("encoding") == "base64" else body.encode()
+        route.fulfill(status=response["status"], headers=headers, body=body)
+
+
+class CassetteMiss(ConnectionError):
+    """
+    A replayed request that was not recorded. It is a ConnectionError, so
+    callers handle it like the service being unreachable.
+    """
+
+
+class _TeeRaw:
+    """
+    Wraps a streamed response's raw body and keeps a copy of every chunk read.
+    """
+
+    def __init__(self, raw, chunks):
+        self._raw = raw
+        self._chunks = chunks
+
+    def stream(self, amt=None, decode_content=None):
+        for chunk in self._raw.stream(amt, decode_content=decode_content):
+            self._chunks.append(chunk)
+            yield chunk
+
+    def read(self, amt=None, *args, **kwargs):
+        chunk = self._raw.read(amt, *args, **kwargs)
+        self._chunks.append(chunk)
+        return chunk
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+
+class Cassette:
+    """
+    Record or replay the http_client calls of one scenario.
+
+    In "record" mode the responses of `hosts` are kept and written to `path`
+    by `save()`; streamed responses keep what the caller actually read. In
+    "replay" mode the calls are answered from the file in the recorded order
+    per match key, and unrecorded calls raise CassetteMiss. `now()` is
+    recorded too, so timestamps compared against replayed responses match.
+    """
+
+    def __init__(self, path, mode, hosts=CASSETTE_HOSTS, ignore=VOLATILE_PARAMS):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Invalid cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.hosts = tuple(hosts)
+        self.ignore = ignore
+        self.interactions = []
+        self.clock = []
+        self.sequence = Sequence()
+        self._lock = threading.Lock()
+        if mode == "replay":
+            with open(path) as f:
+                data = json.load(f)
+            self.clock = [datetime.fromisoformat(value) for value in data.get("clock", [])]
+            for interaction in data["interactions"]:
+                self.sequence.add(interaction["key"], interaction)
+
+    def covers(self, url):
+        return urlsplit(url).hostname in self.hosts
+
+    def now(self):
+        if self.mode == "replay":
+            with self._lock:
+                if self.clock:
+                    return self.clock.pop(0)
+            return datetime.now(timezone.utc)
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            self.clock.append(now)
+        return now
+
+    def record(self, method, url, params, response, stream=False):
+        chunks = []
+        interaction = {
+            "key": match_key(method, url, params, self.ignore),
+            "status": response.status_code,
+            "reason": response.reason,
+            "headers": {name: value for name, value in response.headers.items()
+                        if name.lower() not in TRANSFER_HEADERS},
+            "encoding": response.encoding,
+            "chunks": chunks,
+        }
+        if stream:
+            response.raw = _TeeRaw(response.raw, chunks)
+        else:
+            chunks.append(response.content)
+        with self._lock:
+            self.interactions.append(interaction)
+        return response
+
+    def replay(self, method, url, params=None):
+        key = match_key(method, url, params, self.ignore)
+        interaction = self.sequence.next(key)
+        if interaction is None:
+            raise CassetteMiss(f"No recorded response for {key} in {self.path}")
+        response = requests.Response()
+        response.status_code = interaction["status"]
+        response.reason = interaction.get("reason")
+        response.headers.update(interaction["headers"])
+        response.encoding = interaction["encoding"]
+        response.url = url
+        body = base64.b64decode(interaction["body"])
+        response._content = body
+        response.raw = _ReplayRaw(body)
+        return response
+
+    def save(self):
+        if self.mode != "record":
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._lock:
+            interactions = [
+                {**{name: value for name, value in interaction.items() if name != "chunks"},
+                 "body": base64.b64encode(b"".join(interaction["chunks"])).decode()}
+                for interaction in self.interactions]
+            clock = [value.isoformat() for value in self.clock]
+        with open(self.path, "w") as f:
+            json.dump({"clock": clock, "interactions": interactions}, f, indent=1)
+
+
+class _ReplayRaw:
+    """
+    Raw body of a replayed response, so `iter_lines` on a stream works as recorded.
+    """
+
+    def __init__(self, body):
+        self.body = body
+
+    def stream(self, amt=None, decode_content=None):
+        if self.body:
+            yield self.body
+        self.body = b""
+
+    def read(self, amt=None, *args, **kwargs):
+        body, self.body = self.body, b""
+        return body
+
+    def close(self):
+        pass
+
+    def release_conn(self):
+        pass
+
+
+class ScenarioRecording:
+    """
+    The record/replay setup of one scenario: HAR files for its browser
+    contexts and a cassette for its mail.tm and Twilio calls, stored as
+    `<name>-<n>.har` and `<name>.cassette.json` in `directory`.
+    """
+
+    def __init__(self, directory, name, mode, not_found="abort"):
+        self.directory = directory
+        self.name = name
+        self.mode = mode
+        self.contexts = 0
+        self.replayer = None
+        cassette_path = os.path.join(directory, f"{name}.cassette.json")
+        if mode == "replay" and not os.path.exists(cassette_path):
+            raise ValueError(
+                f"No recording of {name} in {directory}, record it with --record-har first.")
+        if mode == "record" and os.path.isdir(directory):
+            # A new recording replaces every file of the previous one
+            for path in self.har_paths():
+                os.remove(path)
+        self.cassette = Cassette(cassette_path, mode)
+        if mode == "replay":
+            self.replayer = HarReplayer(self.har_paths(), not_found)
+
+    def har_paths(self):
+        prefix = f"{self.name}-"
+        return sorted(os.path.join(self.directory, file_name)
+                      for file_name in os.listdir(self.directory)
+                      if file_name.startswith(prefix) and file_name.endswith(".har"))
+
+    def context_options(self):
+        """
+        Extra `new_context` options: a HAR file per context while recording.
+        """
+        if self.mode != "record":
+            return {}
+        self.contexts += 1
+        os.makedirs(self.directory, exist_ok=True)
+        return {
+            "record_har_path": os.path.join(self.directory, f"{self.name}-{self.contexts}.har"),
+            "record_har_content": "embed",
+        }
+
+    def install(self, context):
+        if self.replayer is not None:
+            self.replayer.install(context)
+        return context
+
+    def close(self):
+        self.cassette.save()
@@ -0,0 +1,161 @@
+import hashlib
+import inspect
+import json
+import os
+import time
+
+import pytest
+
+CACHE_PATH = os.path.join(".cache", "scenario_results.json")
+DEFAULT_MAX_AGE = 24 * 3600
+
+
+# pytest-bdd has no public API for the scenario of a test item or the steps it
+# binds, so these internals (present in pytest-bdd 8.1 and 9.0) are used. When
+# they change, fingerprinting fails with one of these errors, and the plugin
+# warns and runs the scenario instead of trusting a fingerprint.
+FINGERPRINT_ERRORS = (ImportError, AttributeError, KeyError, TypeError, OSError)
+
+
+def scenario_of(item):
+    """
+    The rendered pytest-bdd scenario a test item runs, or None for plain tests.
+    """
+    from pytest_bdd.scenario import scenario_wrapper_template_registry
+
+    template = scenario_wrapper_template_registry.get(getattr(item, "function", None))
+    if template is None:
+        return None
+    callspec = getattr(item, "callspec", None)
+    example = callspec.params.get("_pytest_bdd_example", {}) if callspec else {}
+    return template.render(example)
+
+
+def step_sources(item, scenario):
+    """
+    The source of the step function each step of `scenario` binds for `item`.
+    """
+    from pytest_bdd.scenario import find_fixturedefs_for_step
+    from pytest_bdd.steps import step_function_context_registry
+
+    sources = []
+    for step in scenario.steps:
+        fixturedefs = list(find_fixturedefs_for_step(step, item.session._fixturemanager, item))
+        if not fixturedefs:
+            sources.append(f"unbound {step.type} {step.name}")
+            continue
+        # The closest definition wins, like when the scenario runs
+        context = step_function_context_registry[fixturedefs[-1].func]
+        sources.append(inspect.getsource(context.step_func))
+    return sources
+
+
+def fingerprint(item, deploy_version):
+    """
+    A hash of what decides a scenario's outcome on our side: its feature file,
+    the step functions it binds and the deployed version under test (the
+    target URL is in the feature file). None for tests that are not scenarios.
+    """
+    scenario = scenario_of(item)
+    if scenario is None:
+        return None
+    digest = hashlib.sha256()
+    with open(scenario.feature.filename, "rb") as f:
+        digest.update(f.read())
+    digest.update(scenario.name.encode())
+    for source in step_sources(item, scenario):
+        digest.update(source.encode())
+    digest.update((deploy_version or "").encode())
+    return digest.hexdigest()
+
+
+class ResultCachePlugin:
+    """
+    Skip scenarios that passed with the same fingerprint within `--max-cache-age`
+    seconds, opt-in with --result-cache.
+
+    A failed or unfinished scenario always runs again, and so does every
+    scenario once its last real run is older than the maximum age, so the
+    live site is still checked regularly.
+
+    Fingerprints are computed where the tests are collected and travel on the
+    test reports, so under pytest-xdist the controller, which collects nothing,
+    still learns them from the workers' reports and saves the cache.
+    """
+
+    def __init__(self, config):
+        self.path = config.getoption("result_cache_path")
+        self.max_age = config.getoption("max_cache_age")
+        self.deploy_version = config.getoption("deploy_version") or os.getenv("DEPLOY_VERSION", "")
+        self.entries = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.entries = json.load(f)
+        # Of the items collected in this process
+        self.fingerprints = {}
+        self.skipped = set()
+        # Of the reports, from this process or the workers
+        self.ran = {}
+        self.outcomes = {}
+        self.cached = set()
+
+    def pytest_collection_modifyitems(self, items):
+        now = time.time()
+        for item in items:
+            try:
+                current = fingerprint(item, self.deploy_version)
+            except FINGERPRINT_ERRORS as e:
+                item.warn(pytest.PytestWarning(
+                    f"Cannot fingerprint the scenario for the result cache, running it: "
+                    f"{type(e).__name__}: {e}"))
+                continue
+            if current is None:
+                continue
+            self.fingerprints[item.nodeid] = current
+            entry = self.entries.get(item.nodeid)
+            if (entry and entry["fingerprint"] == current and entry["outcome"] == "passed"
+                    and now - entry["ran_at"] <= self.max_age):
+                self.skipped.add(item.nodeid)
+                item.add_marker(pytest.mark.skip(
+                    reason=f"cached: passed {(now - entry['ran_at']) / 3600:.1f}h ago "
+                           f"with the same feature, steps and deploy version"))
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_makereport(self, item):
+        outcome = yield
+        report = outcome.get_result()
+        if item.nodeid in self.fingerprints:
+            # Plain attributes of a report are sent to the pytest-xdist controller
+            report.result_cache_fingerprint = self.fingerprints[item.nodeid]
+            report.result_cache_cached = item.nodeid in self.skipped
+
+    def pytest_runtest_logreport(self, report):
+        current = getattr(report, "result_cache_fingerprint", None)
+        if current is None:
+            return
+        if report.result_cache_cached:
+            self.cached.add(report.nodeid)
+            return
+        self.ran[report.nodeid] = current
+        if report.failed:
+            self.outcomes[report.nodeid] = "failed"
+        elif report.when == "call" and report.passed:
+            self.outcomes.setdefault(report.nodeid, "passed")
+
+    def pytest_unconfigure(self, config):
+        # Under pytest-xdist the controller saves, from the reports workers send back
+        if hasattr(config, "workerinput") or not self.outcomes:
+            return
+        now = time.time()
+        for nodeid, outcome in self.outcomes.items():
+            self.entries[nodeid] = dict(fingerprint=self.ran[nodeid], outcome=outcome, ran_at=now)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "w") as f:
+            json.dump(self.entries, f, indent=4, sort_keys=True)
+
+    def pytest_terminal_summary(self, terminalreporter):
+        if self.cached:
+            terminalreporter.section("result cache")
+            terminalreporter.write_line(
+                f"{len(self.cached)} scenarios skipped as cached, "
+                f"{len(self.outcomes)} ran (--max-cache-age {self.max_age:.0f}s)")
@@ -0,0 +1,192 @@
+import hashlib
+import heapq
+import json
+import os
+import xml.etree.ElementTree as ET
+
+import pytest
+
+DURATIONS_PATH = os.path.join(".cache", "test_durations.json")
+# Weight of the newest run in a test's duration estimate
+NEWEST_WEIGHT = 0.3
+# Estimate for a test without history when no test has any
+DEFAULT_DURATION = 10.0
+# Hashes of the JUnit XML files read, newest last
+MAX_SOURCES = 200
+
+
+def junit_key(nodeid):
+    """
+    The `classname::name` a node id gets in pytest's JUnit XML.
+    """
+    names = nodeid.split("::")
+    names[0] = names[0].replace("/", ".")
+    if names[0].endswith(".py"):
+        names[0] = names[0][:-3]
+    return f"{'.'.join(names[:-1])}::{names[-1]}"
+
+
+def parse_shard(value):
+    """
+    `i/N` to (i, N), with 1 <= i <= N.
+    """
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise pytest.UsageError(f"--shard expects i/N, e.g. 2/4, not {value}") from None
+    if not 1 <= index <= count:
+        raise pytest.UsageError(f"--shard {value}: i must be between 1 and N")
+    return index, count
+
+
+class DurationStore:
+    """
+    Per-test durations learned from JUnit XML files, kept on disk.
+
+    Each file is read once (its content hash is remembered), and a test's
+    estimate moves towards every new measurement by NEWEST_WEIGHT, so it
+    follows a test that got slower without jumping on one slow run.
+    """
+
+    def __init__(self, path=DURATIONS_PATH):
+        self.path = path
+        self.durations = {}
+        self.sources = []
+        if os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            self.durations = data.get("durations", {})
+            self.sources = data.get("sources", [])
+
+    def record(self, key, seconds):
+        known = self.durations.get(key)
+        self.durations[key] = seconds if known is None else (
+            known + NEWEST_WEIGHT * (seconds - known))
+
+    def ingest(self, xml_path):
+        """
+        Learn the test durations of a JUnit XML file. Returns how many were read;
+        0 when the file is missing or was read before.
+        """
+        if not os.path.exists(xml_path):
+            return 0
+        with open(xml_path, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        if digest in self.sources:
+            return 0
+        count = 0
+        for _, element in ET.iterparse(xml_path):
+            if element.tag == "testcase" and element.get("time"):
+                self.record(f"{element.get('classname')}::{element.get('name')}",
+                            float(element.get("time")))
+                count += 1
+                element.clear()
+        self.sources = (self.sources + [digest])[-MAX_SOURCES:]
+        return count
+
+    def estimate(self, nodeid, default):
+        return self.durations.get(junit_key(nodeid), default)
+
+    def default_duration(self):
+        """
+        The estimate of a test without history: the mean of the known tests.
+        """
+        if not self.durations:
+            return DEFAULT_DURATION
+        return sum(self.durations.values()) / len(self.durations)
+
+    def digest(self):
+        """
+        A short hash of the durations, equal on every node that plans from the same data.
+        """
+        data = json.dumps(self.durations, sort_keys=True).encode()
+        return hashlib.sha256(data).hexdigest()[:12]
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "w") as f:
+            json.dump({"durations": self.durations, "sources": self.sources}, f,
+                      indent=4, sort_keys=True)
+
+
+def split_into_shards(items, durations, count):
+    """
+    Longest processing time first: hand each test, longest first, to the shard
+    with the least estimated time so far. Returns `count` (total seconds, tests)
+    pairs, each shard's tests longest first.
+    """
+    shards = [(0.0, index, []) for index in range(count)]
+    ordered = sorted(items, key=lambda item: (-durations[item.nodeid], item.nodeid))
+    for item in ordered:
+        total, index, tests = heapq.heappop(shards)
+        tests.append(item)
+        heapq.heappush(shards, (total + durations[item.nodeid], index, tests))
+    return [(total, tests) for total, _, tests in sorted(shards, key=lambda shard: shard[1])]
+
+
+class ShardingPlugin:
+    """
+    `--shard i/N` runs the i-th of N shards of similar estimated duration,
+    longest tests first. Without --shard only the store is updated.
+
+    The shards only add up to the whole suite when every node plans from the
+    same durations, so the plan uses the DurationStore (e.g. an artifact
+    every node downloads) and the `--durations-from` files only, never the
+    node's own previous results, and reports the digest of what it used.
+    With `--durations-digest`, a node whose durations have another digest
+    stops instead of running a shard that overlaps the others. This run's
+    JUnit XML is learned after the run.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.shard = parse_shard(config.getoption("shard")) if config.getoption("shard") else None
+        self.store = DurationStore(config.getoption("durations_store"))
+        self.xml_path = getattr(config.option, "xmlpath", None)
+        self.estimates = []
+        for path in config.getoption("durations_from"):
+            self.store.ingest(path)
+        self.digest = self.store.digest()
+        expected = config.getoption("durations_digest")
+        if self.shard and expected and self.digest != expected:
+            raise pytest.UsageError(
+                f"--shard: the durations of {self.store.path} have digest {self.digest}, "
+                f"not {expected}, so this node's shard would not match the others'")
+
+    @pytest.hookimpl(trylast=True)
+    def pytest_collection_modifyitems(self, config, items):
+        if self.shard is None or not items:
+            return
+        index, count = self.shard
+        default = self.store.default_duration()
+        durations = {item.nodeid: self.store.estimate(item.nodeid, default) for item in items}
+        shards = split_into_shards(items, durations, count)
+        self.estimates = [total for total, _ in shards]
+        selected = shards[index - 1][1]
+        chosen = {item.nodeid for item in selected}
+        deselected = [item for item in items if item.nodeid not in chosen]
+        if deselected:
+            config.hook.pytest_deselected(items=deselected)
+        items[:] = selected
+
+    def pytest_report_header(self, config):
+        if self.shard:
+            return f"shard {self.shard[0]}/{self.shard[1]} planned from durations {self.digest}"
+
+    def pytest_unconfigure(self, config):
+        # pytest-xdist workers shard like the controller, which alone keeps the store
+        if hasattr(config, "workerinput"):
+            return
+        if self.xml_path:
+            self.store.ingest(self.xml_path)
+        self.store.save()
+
+    def pytest_terminal_summary(self, terminalreporter):
+        if not self.estimates:
+            return
+        index, count = self.shard
+        terminalreporter.section("sharding")
+        terminalreporter.write_line(
+            f"shard {index}/{count} from durations {self.digest}: estimated "
+            f"{self.estimates[index - 1]:.0f}s (shards {min(self.estimates):.0f}s to "
+            f"{max(self.estimates):.0f}s, {sum(self.estimates):.0f}s in total)")
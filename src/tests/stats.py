@@ -0,0 +1,7 @@
+def percentile(values, percent):
+    """
+    The value at `percent` (0-100) of `values`, nearest rank.
+    """
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+    return ordered[index]
@@ -0,0 +1,190 @@
+import json
+import os
+import threading
+import time
+
+import pytest
+
+import http_client
+from account_lease import worker_id
+from stats import percentile
+
+TIMELINE_FILE = "step_timeline.json"
+FOLDED_FILE = "step_timing.folded"
+
+
+def external_service(host):
+    """
+    Group an external host under the service it belongs to.
+    """
+    if "mail.tm" in host:
+        return "mailtm"
+    if "twilio" in host:
+        return "twilio"
+    if "testrail" in host:
+        return "testrail"
+    return host
+
+
+def step_key(record):
+    return f"{record['test']} :: {record['type']} {record['step']}"
+
+
+def summarize(records):
+    """
+    p50/p95 wall time per step across all samples in `records`.
+    """
+    samples = {}
+    for record in records:
+        samples.setdefault(step_key(record), []).append(record["wall"])
+    return {key: {"p50": percentile(values, 50), "p95": percentile(values, 95),
+                  "samples": len(values)}
+            for key, values in samples.items()}
+
+
+def find_regressions(records, baseline_records, threshold=0.2, min_seconds=0.1):
+    """
+    Steps whose p50 or p95 grew by more than `threshold` (and `min_seconds`) over the baseline.
+    """
+    current = summarize(records)
+    baseline = summarize(baseline_records)
+    regressions = []
+    for key, stats in sorted(current.items()):
+        if key not in baseline:
+            continue
+        for stat in ("p50", "p95"):
+            before, after = baseline[key][stat], stats[stat]
+            if after - before > min_seconds and after > before * (1 + threshold):
+                regressions.append(dict(step=key, stat=stat, baseline=before, current=after))
+    return regressions
+
+
+class StepTimingPlugin:
+    """
+    Time every Given/When/Then step of the pytest-bdd scenarios.
+
+    Wall time is split into external HTTP time per service (from the
+    http_client metrics recorded on the test thread) and "other", the rest
+    of the step: mostly Playwright, but also the step's own Python code and
+    waits. Per-step timings are attached to the JUnit report as properties;
+    a JSON timeline and a folded-stacks file for flame graph tools are
+    written at the end of the session.
+
+    The timings travel with the test reports, so under pytest-xdist the
+    controller writes one timeline of all workers.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.output_dir = config.getoption("timing_dir")
+        self.baseline_path = config.getoption("timing_baseline")
+        self.threshold = config.getoption("timing_threshold")
+        self.fail_on_regression = config.getoption("timing_fail_on_regression")
+        self.session_started = time.time()
+        self.records = []
+        self.regressions = []
+        self._started = {}
+        # Records of the tests still running in this process, by node id
+        self._pending = {}
+
+    def pytest_bdd_before_step(self, request, step):
+        self._started[request.node.nodeid] = (time.monotonic(), time.time(),
+                                              http_client.metrics_count())
+
+    def pytest_bdd_after_step(self, request, step):
+        self._finish_step(request, step, failed=False)
+
+    def pytest_bdd_step_error(self, request, step):
+        self._finish_step(request, step, failed=True)
+
+    def _finish_step(self, request, step, failed):
+        started = self._started.pop(request.node.nodeid, None)
+        if not started:
+            return
+        started_monotonic, started_at, metrics_index = started
+        wall = time.monotonic() - started_monotonic
+        thread = threading.get_ident()
+        external = {}
+        for metric in http_client.get_metrics(metrics_index):
+            if metric["thread"] == thread:
+                service = external_service(metric["host"])
+                external[service] = external.get(service, 0.0) + metric["elapsed"]
+        http_seconds = min(wall, sum(external.values()))
+        record = {
+            "test": request.node.nodeid,
+            "type": step.type,
+            "step": step.name,
+            "started_at": started_at,
+            "wall": wall,
+            "other": wall - http_seconds,
+            "http": external,
+            "failed": failed,
+            "worker": worker_id(),
+        }
+        records = self._pending.setdefault(request.node.nodeid, [])
+        records.append(record)
+        http_detail = " ".join(f"{service}={seconds:.3f}"
+                               for service, seconds in sorted(external.items()))
+        request.node.user_properties.append((
+            f"step {len(records):02d} {step.type} {step.name}",
+            f"wall={wall:.3f} other={record['other']:.3f} {http_detail}".strip(),
+        ))
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_makereport(self, item, call):
+        outcome = yield
+        report = outcome.get_result()
+        if report.when == "teardown":
+            # Plain attributes of a report are sent to the pytest-xdist controller
+            report.step_timing = self._pending.pop(item.nodeid, [])
+
+    def pytest_runtest_logreport(self, report):
+        for record in getattr(report, "step_timing", []):
+            record = dict(record)
+            record["start"] = record.pop("started_at") - self.session_started
+            self.records.append(record)
+
+    def pytest_sessionfinish(self, session):
+        # The controller writes the timeline of every worker
+        if hasattr(session.config, "workerinput") or not self.records:
+            return
+        os.makedirs(self.output_dir, exist_ok=True)
+        with open(os.path.join(self.output_dir, TIMELINE_FILE), "w") as f:
+            json.dump({"started_at": self.session_started, "steps": self.records},
+                      f, ensure_ascii=False, indent=2)
+        with open(os.path.join(self.output_dir, FOLDED_FILE), "w") as f:
+            for line in self.folded_stacks():
+                f.write(line + "\n")
+
+        if self.baseline_path:
+            with open(self.baseline_path) as f:
+                baseline = json.load(f)["steps"]
+            self.regressions = find_regressions(self.records, baseline, self.threshold)
+            if self.regressions and self.fail_on_regression:
+                session.exitstatus = 1
+
+    def folded_stacks(self):
+        """
+        `test;step;part milliseconds` lines, the input format of flamegraph.pl and speedscope.
+        """
+        lines = []
+        for record in self.records:
+            frame = f"{record['test']};{record['type']} {record['step']}"
+            lines.append(f"{frame};other {round(record['other'] * 1000)}")
+            for service, seconds in sorted(record["http"].items()):
+                lines.append(f"{frame};http {service} {round(seconds * 1000)}")
+        return lines
+
+    def pytest_terminal_summary(self, terminalreporter):
+        if not self.records:
+            return
+        terminalreporter.section("step timing")
+        for key, stats in summarize(self.records).items():
+            terminalreporter.write_line(
+                f"p50 {stats['p50']:7.2f}s  p95 {stats['p95']:7.2f}s  {key}")
+        if self.regressions:
+            terminalreporter.section("step timing regressions")
+            for regression in self.regressions:
+                terminalreporter.write_line(
+                    f"{regression['stat']} {regression['baseline']:.2f}s -> "
+                    f"{regression['current']:.2f}s  {regression['step']}", red=True)
@@ -0,0 +1,80 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from account_lease import AccountLeases
+
+pytestmark = pytest.mark.offline
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.fixture
+def lease_dir(tmp_path):
+    return str(tmp_path)
+
+
+def test_second_worker_waits_for_a_held_account(lease_dir):
+    first = AccountLeases(lease_dir, timeout=0.3, poll_interval=0.05)
+    second = AccountLeases(lease_dir, timeout=0.3, poll_interval=0.05)
+    first.acquire("homepage:qa@example.com")
+
+    with pytest.raises(TimeoutError):
+        second.acquire("homepage:qa@example.com")
+
+    first.release_all()
+    second.acquire("homepage:qa@example.com")
+    assert "homepage:qa@example.com" in second.held
+
+
+def test_lease_of_a_dead_process_is_free_again(lease_dir):
+    # The worker dies holding the lease, without releasing it
+    subprocess.run([sys.executable, "-c", HOLD_AND_DIE, lease_dir], cwd=TESTS_DIR, check=True)
+    leases = AccountLeases(lease_dir, timeout=1, poll_interval=0.05)
+    with open(leases._path("phone:+886900000000")) as f:
+        assert json.load(f)["worker"] == "gw1"
+
+    leases.acquire("phone:+886900000000")
+
+    assert "phone:+886900000000" in leases.held
+
+
+def test_workers_racing_for_a_dead_workers_lease_get_it_once(lease_dir):
+    subprocess.run([sys.executable, "-c", HOLD_AND_DIE, lease_dir], cwd=TESTS_DIR, check=True)
+    go = os.path.join(lease_dir, "go")
+    workers = [subprocess.Popen([sys.executable, "-c", RACE, lease_dir, go],
+                                cwd=TESTS_DIR, stdout=subprocess.PIPE, text=True)
+               for _ in range(6)]
+    time.sleep(0.5)
+    open(go, "w").close()
+
+    results = [worker.communicate(timeout=10)[0].strip() for worker in workers]
+
+    assert results.count("True") == 1
+
+
+HOLD_AND_DIE = """
+import os, sys
+os.environ["PYTEST_XDIST_WORKER"] = "gw1"
+sys.path.insert(0, os.getcwd())
+from account_lease import AccountLeases
+AccountLeases(sys.argv[1]).acquire("phone:+886900000000")
+os._exit(0)
+"""
+
+# Waits for the go file, then tries the lease and holds it until the others tried
+RACE = """
+import os, sys, time
+sys.path.insert(0, os.getcwd())
+from account_lease import AccountLeases
+while not os.path.exists(sys.argv[2]):
+    time.sleep(0.001)
+leases = AccountLeases(sys.argv[1])
+print(leases.try_acquire("phone:+886900000000"))
+sys.stdout.flush()
+time.sleep(1)
+"""
@@ -0,0 +1,92 @@
+import asyncio
+import time
+
+import pytest
+from pytest_bdd import parsers
+
+from async_scenarios import StepRegistry, load_scenarios, run_scenarios
+
+pytestmark = pytest.mark.offline
+
+FEATURE = """Feature: Login
+    @login
+    Scenario Outline: I can login with a verification code
+        Given I have homepage account: <email>, secret
+        When I check the verification code in the email
+        Then I can see the member center
+
+        Examples:
+            | email             |
+            | one@example.com   |
+            | two@example.com   |
+            | three@example.com |
+
+    Scenario: I can logout
+        Given I have homepage account: four@example.com, secret
+        Then I logout
+"""
+
+
+@pytest.fixture
+def scenarios(tmp_path):
+    (tmp_path / "login.feature").write_text(FEATURE)
+    return load_scenarios([str(tmp_path)])
+
+
+@pytest.fixture
+def registry():
+    steps = StepRegistry()
+
+    @steps.given(parsers.parse("I have homepage account: {email}, {password}"), target="user")
+    async def given_user(state, email, password):
+        return dict(email=email, password=password)
+
+    @steps.when("I check the verification code in the email", target="verification_code")
+    async def wait_for_code(state):
+        # A blocking OTP wait, run off the event loop like the real one
+        await asyncio.to_thread(time.sleep, 0.3)
+        return state["user"]["email"][:3]
+
+    @steps.then("I can see the member center")
+    async def check(state):
+        if state["verification_code"] == "two":
+            raise AssertionError("member center not shown")
+
+    return steps
+
+
+async def open_state(scenario):
+    return {}
+
+
+async def close_state(state):
+    state["closed"] = True
+
+
+def test_outlines_are_expanded_and_tags_filter(tmp_path, scenarios):
+    assert [scenario.name for scenario in scenarios].count(
+        "I can login with a verification code") == 3
+    assert len(load_scenarios([str(tmp_path)], tags=["login"])) == 3
+
+
+def test_waits_of_concurrent_scenarios_overlap(scenarios, registry):
+    started = time.monotonic()
+    results = asyncio.run(run_scenarios(scenarios, registry, open_state, close_state,
+                                        concurrency=4))
+    wall = time.monotonic() - started
+
+    assert wall < 0.6
+    assert [result["passed"] for result in results] == [True, False, True, False]
+    assert results[1]["error"] == "AssertionError: member center not shown"
+    assert results[3]["error"] == "ValueError: No async step matches: then I logout"
+    assert [step["step"] for step in results[0]["steps"]] == [
+        "given I have homepage account: one@example.com, secret",
+        "when I check the verification code in the email",
+        "then I can see the member center"]
+
+
+def test_concurrency_is_bounded(scenarios, registry):
+    started = time.monotonic()
+    asyncio.run(run_scenarios(scenarios[:3], registry, open_state, close_state, concurrency=1))
+
+    assert time.monotonic() - started >= 0.9
@@ -0,0 +1,104 @@
+import os
+import time
+from unittest.mock import MagicMock
+
+import pytest
+from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
+
+import conftest
+from auth_state import StorageStateCache
+
+pytestmark = pytest.mark.offline
+
+URL = "https://www.dogcatstar.com"
+USER = dict(email="member@dogcat.test", password="secret")
+
+
+def fake_browser(logged_in=True):
+    """
+    A browser whose contexts save an empty storage state and hand out mock
+    pages, on which the member center link shows unless not `logged_in`.
+    """
+    browser = MagicMock()
+    contexts = []
+
+    def new_context(**kwargs):
+        context = MagicMock()
+        context.options = kwargs
+        context.storage_state.side_effect = lambda path: open(path, "w").write("{}")
+        if not logged_in:
+            page = context.new_page.return_value
+            page.get_by_role.return_value.wait_for.side_effect = PlaywrightTimeoutError("Timeout")
+        contexts.append(context)
+        return context
+
+    browser.new_context.side_effect = new_context
+    browser.contexts = contexts
+    return browser
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return StorageStateCache(state_dir=str(tmp_path), ttl=3600)
+
+
+@pytest.fixture
+def login_flow(monkeypatch):
+    # expect() only accepts real locators
+    monkeypatch.setattr(conftest, "expect", lambda locator: MagicMock())
+    logins = []
+
+    def login(page):
+        logins.append(page)
+        conftest.login_with_email_password(page, URL, USER)
+    return logins, login
+
+
+def test_storage_state_login_runs_the_ui_login_once(cache, login_flow):
+    logins, login = login_flow
+    browser = fake_browser()
+
+    first = cache.open_page(browser, browser.new_context, URL, "電子信箱", USER["email"], login)
+    second = cache.open_page(browser, browser.new_context, URL, "電子信箱", USER["email"], login)
+
+    assert logins == [first]
+    first.goto.assert_called_with(URL)
+    first.get_by_placeholder.return_value.fill.assert_any_call(USER["password"])
+    assert browser.contexts[1].options == {
+        "storage_state": cache.path_for("電子信箱", USER["email"])}
+    second.goto.assert_called_with(URL)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_states_are_kept_per_login_type_and_account(cache):
+    cache.save(fake_browser().new_context(), "電子信箱", USER["email"])
+
+    assert cache.load("電子信箱", USER["email"])
+    assert cache.load("LINE", USER["email"]) is None
+    assert cache.load("電子信箱", "other@dogcat.test") is None
+    assert oct(os.stat(cache.path_for("電子信箱", USER["email"])).st_mode & 0o777) == "0o600"
+
+
+def test_an_expired_state_is_removed(cache):
+    path = cache.save(fake_browser().new_context(), "電子信箱", USER["email"])
+    an_hour_ago = time.time() - 3601
+    os.utime(path, (an_hour_ago, an_hour_ago))
+
+    assert cache.load("電子信箱", USER["email"]) is None
+    assert not os.path.exists(path)
+
+
+def test_a_state_no_longer_logged_in_is_replaced(cache):
+    browser = fake_browser(logged_in=False)
+    path = cache.save(browser.new_context(), "電子信箱", USER["email"])
+    login = MagicMock()
+
+    page = cache.open_page(browser, browser.new_context, URL, "電子信箱", USER["email"], login)
+
+    stale = browser.contexts[1]
+    assert stale.options == {"storage_state": path}
+    stale.close.assert_called_once()
+    login.assert_called_once_with(page)
+    assert browser.contexts[2].options == {}
+    browser.contexts[2].storage_state.assert_called_once_with(path=path)
+    assert (cache.hits, cache.misses) == (0, 1)
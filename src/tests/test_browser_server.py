@@ -0,0 +1,132 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+from types import SimpleNamespace
+
+import pytest
+from playwright.sync_api import Error as PlaywrightError
+
+import browser_server
+
+pytestmark = pytest.mark.offline
+
+
+@pytest.fixture
+def listening():
+    with socket.create_server(("127.0.0.1", 0)) as server:
+        yield f"ws://127.0.0.1:{server.getsockname()[1]}/abc"
+
+
+@pytest.fixture
+def server_pid():
+    process = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(60)"])
+    yield process.pid
+    process.kill()
+    process.wait()
+
+
+def dead_pid():
+    return int(subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"],
+                              capture_output=True, text=True).stdout)
+
+
+def write_state(path, **state):
+    path.write_text(json.dumps(state))
+    return str(path)
+
+
+def test_a_server_is_healthy_while_its_process_accepts_connections(server_pid, listening):
+    assert browser_server.is_healthy(dict(pid=server_pid, ws_endpoint=listening))
+    assert not browser_server.is_healthy(dict(pid=dead_pid(), ws_endpoint=listening))
+    assert not browser_server.is_healthy(None)
+
+
+def test_a_healthy_server_with_the_same_options_is_reused(tmp_path, monkeypatch, server_pid,
+                                                         listening):
+    options = browser_server.launch_options()
+    path = write_state(tmp_path / "server.json", pid=server_pid, ws_endpoint=listening,
+                       options=browser_server.options_digest(options))
+    launched = []
+    monkeypatch.setattr(browser_server, "launch_server",
+                        lambda options, path: launched.append(options) or {"relaunched": True})
+
+    assert browser_server.ensure_server(options, path)["ws_endpoint"] == listening
+    assert launched == []
+
+    headed = browser_server.launch_options(headless=False)
+    assert browser_server.ensure_server(headed, path) == {"relaunched": True}
+    assert launched == [headed]
+
+
+def test_a_dead_server_is_forgotten_and_relaunched(tmp_path, monkeypatch, listening):
+    options = browser_server.launch_options()
+    path = write_state(tmp_path / "server.json", pid=dead_pid(), ws_endpoint=listening,
+                       options=browser_server.options_digest(options))
+    monkeypatch.setattr(browser_server, "launch_server", lambda options, path: {"relaunched": True})
+
+    assert browser_server.ensure_server(options, path) == {"relaunched": True}
+    assert not os.path.exists(path)
+    assert browser_server.stop_server(path) is False
+
+
+def test_a_failed_connection_relaunches_the_server_once(tmp_path, monkeypatch):
+    states = iter([{"ws_endpoint": "ws://127.0.0.1:1/stale"},
+                   {"ws_endpoint": "ws://127.0.0.1:2/new"}])
+    stopped = []
+    monkeypatch.setattr(browser_server, "ensure_server", lambda options, path: next(states))
+    monkeypatch.setattr(browser_server, "stop_server", stopped.append)
+    connected = []
+
+    def connect(ws_endpoint, timeout):
+        connected.append(ws_endpoint)
+        if ws_endpoint.endswith("stale"):
+            raise PlaywrightError("connect ECONNREFUSED")
+        return "browser"
+    browser_type = SimpleNamespace(connect=connect)
+
+    path = str(tmp_path / "server.json")
+    assert browser_server.connect(browser_type, browser_server.launch_options(), path) == "browser"
+    assert connected == ["ws://127.0.0.1:1/stale", "ws://127.0.0.1:2/new"]
+    assert stopped == [path]
+
+
+def driver_installed():
+    try:
+        return all(os.path.exists(path) for path in browser_server._driver())
+    except Exception:
+        return False
+
+
+@pytest.mark.skipif(not driver_installed(), reason="Playwright's Node driver is not installed")
+def test_a_server_that_cannot_start_raises_with_its_log(tmp_path):
+    path = str(tmp_path / "server.json")
+    options = dict(browser_server.launch_options(), executablePath=str(tmp_path / "no-chromium"))
+
+    with pytest.raises(RuntimeError, match="did not start"):
+        browser_server.launch_server(options, path, timeout=20)
+    assert browser_server.load_state(path) is None
+
+
+@pytest.mark.skipif(not driver_installed(), reason="Playwright's Node driver is not installed")
+def test_runs_connect_to_one_launched_server(tmp_path):
+    from playwright.sync_api import sync_playwright
+
+    path = str(tmp_path / "server.json")
+    options = browser_server.launch_options()
+    with sync_playwright() as playwright:
+        if not os.path.exists(playwright.chromium.executable_path):
+            pytest.skip("Chromium is not installed")
+        try:
+            browser = browser_server.connect(playwright.chromium, options, path)
+            state = browser_server.load_state(path)
+            assert browser.new_page().evaluate("1 + 1") == 2
+            browser.close()
+
+            # The next run reuses the server left running
+            browser = browser_server.connect(playwright.chromium, options, path)
+            assert browser_server.load_state(path) == state
+            browser.close()
+        finally:
+            assert browser_server.stop_server(path)
@@ -0,0 +1,100 @@
+import pytest
+
+import context_pool
+from context_pool import ContextPool
+from network_filter import NetworkFilter
+
+pytestmark = pytest.mark.offline
+
+
+class FakeContext:
+    def __init__(self):
+        self.pages = []
+        self.closed = False
+
+    def new_page(self):
+        self.pages.append(object())
+        return self.pages[-1]
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def created():
+    return []
+
+
+@pytest.fixture
+def pool(created):
+    def create(pooled):
+        created.append(FakeContext())
+        return created[-1]
+
+    return ContextPool(create, size=2, rules=NetworkFilter().rules())
+
+
+def test_warm_contexts_are_handed_out_and_replaced(pool, created):
+    pool.warm_up()
+    assert len(created) == 2
+
+    context = pool.checkout(NetworkFilter())
+    assert context is created[0] and len(context.pages) == 1
+    assert len(created) == 2
+
+    pool.checkin(context)
+    assert context.closed
+    # Replaced once the scenario has finished
+    assert len(pool.idle) == 1 and len(created) == 2
+    context_pool.pools.append(pool)
+    try:
+        context_pool.refill_pools()
+    finally:
+        context_pool.pools.remove(pool)
+    assert len(pool.idle) == 2 and len(created) == 3
+    assert (pool.hits, pool.misses) == (1, 0)
+
+
+def test_scenarios_without_a_code_wait_find_contexts_ready(pool, created):
+    # e.g. email+password, LINE and Facebook logins, refilled after each scenario
+    context_pool.pools.append(pool)
+    try:
+        for _ in range(6):
+            pool.checkin(pool.checkout(NetworkFilter()))
+            context_pool.refill_pools()
+    finally:
+        context_pool.pools.remove(pool)
+
+    assert (pool.hits, pool.misses) == (5, 1)
+    assert all(context.closed for context in created[:6])
+    assert len(pool.idle) == 2
+
+
+def test_an_empty_pool_creates_on_demand(pool, created):
+    context = pool.checkout()
+
+    assert context is created[0]
+    assert (pool.hits, pool.misses) == (0, 1)
+    assert "0/1 contexts ready at checkout" in pool.summary_line()
+
+
+def test_requests_go_to_the_filter_of_the_current_scenario(pool):
+    pool.warm_up()
+    pooled = pool.idle[0]
+    first, second = NetworkFilter(), NetworkFilter()
+    route = type("Route", (), {
+        "request": type("Request", (), {"url": "https://cdn.dogcatstar.com/a.png",
+                                        "resource_type": "image"}),
+        "abort": lambda self, error_code=None: None})()
+
+    pool.checkout(first)
+    pooled.route(route)
+    pooled.request_filter = second
+    pooled.route(route)
+
+    assert first.stats.total_requests == 1 and second.stats.total_requests == 1
+
+
+def test_scenarios_with_their_own_rules_are_not_served(pool):
+    assert pool.serves(NetworkFilter())
+    assert not pool.serves(NetworkFilter(allow=["cdn.dogcatstar.com"]))
@@ -0,0 +1,95 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from failure_capture import FailureCapture, capture_name
+
+pytestmark = pytest.mark.offline
+
+
+class FakeTracing:
+    def __init__(self):
+        self.started = False
+        self.chunks = 0
+
+    def start(self, **options):
+        self.started = True
+
+    def start_chunk(self, title=None):
+        self.chunks += 1
+
+    def stop_chunk(self, path=None):
+        with open(path, "wb") as f:
+            f.write(f"chunk {self.chunks}".encode())
+
+
+class FakePage:
+    """
+    The page events and calls FailureCapture uses.
+    """
+
+    def __init__(self):
+        self.handlers = {}
+        self.screenshots = 0
+        self.context = SimpleNamespace(tracing=FakeTracing())
+
+    def on(self, event, handler):
+        self.handlers[event] = handler
+
+    def emit(self, event, value):
+        self.handlers[event](value)
+
+    def screenshot(self, **options):
+        self.screenshots += 1
+        return f"image {self.screenshots}".encode()
+
+    def content(self):
+        return "<html></html>"
+
+    def is_closed(self):
+        return False
+
+
+def run_steps(capture, count):
+    for index in range(1, count + 1):
+        capture.step_started(f"when step {index}")
+        capture.page.emit("console", SimpleNamespace(type="log", text=f"message {index}"))
+        capture.step_finished()
+
+
+def test_logs_mode_keeps_a_bounded_event_log_without_screenshots(tmp_path):
+    page = FakePage()
+    capture = FailureCapture(page, "logs", window=2, max_events=3)
+
+    run_steps(capture, 5)
+
+    assert page.screenshots == 0
+    assert [event[3] for event in capture.events] == [
+        "log: message 3", "log: message 4", "log: message 5"]
+    assert not os.listdir(tmp_path)
+
+
+def test_dump_writes_the_last_steps_and_the_failed_page(tmp_path):
+    page = FakePage()
+    capture = FailureCapture(page, "trace", window=2)
+    run_steps(capture, 3)
+    capture.step_started("then step 4")
+    capture.step_failed(AssertionError("member center not shown"))
+
+    paths = capture.dump(str(tmp_path))
+
+    assert page.context.tracing.started
+    assert sorted(os.path.basename(path) for path in paths) == [
+        "events.log", "failure.png", "page.html", "step-01.jpg", "step-02.jpg",
+        "trace-01.zip", "trace-02.zip", "trace-03.zip"]
+    assert (tmp_path / "step-01.jpg").read_bytes() == b"image 2"
+    assert (tmp_path / "trace-02.zip").read_bytes() == b"chunk 3"
+    assert (tmp_path / "trace-03.zip").read_bytes() == b"chunk 4"
+    assert "[then step 4] step failed: AssertionError: member center not shown" in (
+        tmp_path / "events.log").read_text()
+
+
+def test_capture_name_is_a_file_name():
+    assert capture_name("src/tests/test_homepage_login.py::test_login[電子信箱-a@b.c]") == (
+        "test_login_電子信箱-a_b.c")
@@ -0,0 +1,70 @@
+import time
+
+import pytest
+
+import http_client
+from fake_server import FakeServer, Faults, parse_latency
+from fake_services import FakeServices
+from mailtm_pool import MailtmPool
+
+pytestmark = pytest.mark.offline
+
+
+@pytest.fixture(autouse=True)
+def http_state(tmp_path):
+    # The calls to the faked providers use their rate limits and circuits
+    http_client.use_state_dir(str(tmp_path))
+    yield
+    http_client.use_state_dir(http_client.STATE_DIR)
+
+
+def test_latency_specs_sample_the_configured_distribution():
+    import random
+
+    rng = random.Random(1)
+    assert parse_latency("fixed:50")(rng) == 0.05
+    assert all(0.02 <= parse_latency("uniform:20:200")(rng) <= 0.2 for _ in range(100))
+    samples = sorted(parse_latency("lognormal:80:300")(rng) for _ in range(2000))
+    assert 0.07 < samples[1000] < 0.09
+    assert 0.25 < samples[1900] < 0.35
+    with pytest.raises(ValueError):
+        Faults.from_spec("latency=pareto:1")
+
+
+def test_rate_limited_requests_are_retried_after_retry_after():
+    with FakeServer(faults=Faults.from_spec("rate=5")) as server:
+        server.add_route("GET", "/messages", lambda request: (200, {"hydra:member": []}))
+
+        started = time.monotonic()
+        statuses = [http_client.get(f"{server.base_url}/messages").status_code for _ in range(8)]
+
+        assert statuses == [200] * 8
+        assert time.monotonic() - started >= 0.4
+        assert server.faults.injected["rate_limited"] > 0
+
+
+def test_injected_errors_are_repeatable_with_a_seed():
+    def statuses():
+        with FakeServer(faults=Faults.from_spec("errors=0.5:500,seed=3")) as server:
+            server.add_route("POST", "/add_result_for_case/1/2", lambda request: (200, {}))
+            return [http_client.post(f"{server.base_url}/add_result_for_case/1/2",
+                                     json={}).status_code for _ in range(10)]
+
+    first = statuses()
+    assert first == statuses()
+    assert {200, 500} == set(first)
+
+
+def test_installed_services_serve_mailtm_calls_to_the_real_hosts(tmp_path):
+    with FakeServices("latency=fixed:10") as services:
+        services.install()
+        try:
+            pool = MailtmPool(str(tmp_path / "pool.json"))
+            authorization = pool.authorization("qa@dogcat.fake", "secret")
+        finally:
+            services.uninstall()
+
+    assert authorization == f"Bearer {services.mailtm.accounts['qa@dogcat.fake']['token']}"
+    assert services.mailtm.count_requests("POST", "/token") == 1
+    assert "api.mail.tm" in {metric["host"] for metric in http_client.get_metrics()}
+    assert "TESTRAIL_URL" in services.environment()
@@ -2,6 +2,7 @@ import pytest
 import re
 from playwright.sync_api import sync_playwright, Page
 from pytest_bdd import given, when, then, parsers, scenario
+from auth_state import member_center_visible
 
 
 @pytest.mark.case_id(1)
@@ -36,6 +37,4 @@ def test_login_with_sso_facebook_caseid_11():
 
 @then("I can see the member center")
 def check_my_account(page: Page):
-    page.get_by_role("link", name="User").click()
-    page.wait_for_timeout(3000)
-    assert page.get_by_role("link", name="會員中心").is_visible()
+    assert member_center_visible(page)
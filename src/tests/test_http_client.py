@@ -0,0 +1,158 @@
+import threading
+import time
+
+import pytest
+
+import http_client
+from fake_server import FakeServer
+
+pytestmark = pytest.mark.offline
+
+
+@pytest.fixture(autouse=True)
+def http_state(tmp_path):
+    http_client.use_state_dir(str(tmp_path))
+    yield
+    http_client.use_state_dir(http_client.STATE_DIR)
+    http_client.configure_circuit_breakers()
+
+
+@pytest.fixture
+def server():
+    with FakeServer() as fake:
+        yield fake
+
+
+def responses(*results):
+    queue = list(results)
+
+    def handler(request):
+        return queue.pop(0) if len(queue) > 1 else queue[0]
+    return handler
+
+
+def test_429_is_retried_after_the_retry_after_delay(server):
+    server.add_route("GET", "/messages", responses(
+        (429, {"detail": "Too Many Requests"}, {"Retry-After": "0.2"}),
+        (200, {"hydra:member": []}),
+    ))
+
+    started = time.monotonic()
+    response = http_client.get(f"{server.base_url}/messages")
+
+    assert response.status_code == 200
+    assert time.monotonic() - started >= 0.2
+    assert server.count_requests("GET", "/messages") == 2
+
+
+def test_malformed_retry_after_falls_back_to_the_backoff(server):
+    server.add_route("GET", "/messages", responses(
+        (429, {"detail": "Too Many Requests"}, {"Retry-After": "soon"}),
+        (200, {"hydra:member": []}),
+    ))
+
+    response = http_client.get(f"{server.base_url}/messages")
+
+    assert response.status_code == 200
+    assert server.count_requests("GET", "/messages") == 2
+
+
+def test_post_is_not_retried_on_500(server):
+    server.add_route("POST", "/add_result_for_case/1/2", responses((500, {})))
+
+    response = http_client.post(f"{server.base_url}/add_result_for_case/1/2", json={})
+
+    assert response.status_code == 500
+    assert server.count_requests("POST", "/add_result_for_case/1/2") == 1
+
+
+def test_calls_to_one_host_share_a_session(server):
+    assert http_client.get_session(f"{server.base_url}/a") is \
+        http_client.get_session(f"{server.base_url}/b")
+
+
+def test_rate_limiter_spaces_out_bursts(tmp_path):
+    limiter = http_client.SharedRateLimiter("api.example", rate=20, capacity=1,
+                                            state_dir=str(tmp_path))
+
+    started = time.monotonic()
+    for _ in range(5):
+        limiter.acquire()
+
+    assert time.monotonic() - started >= 0.19
+
+
+def test_latency_is_recorded_per_host(server):
+    server.add_route("GET", "/me", responses((200, {"id": "1"})))
+    http_client.reset_metrics()
+
+    http_client.get(f"{server.base_url}/me")
+
+    summary = http_client.latency_summary()
+    assert summary[f"127.0.0.1:{server.port}"]["calls"] == 1
+
+
+def test_shared_rate_limiters_draw_from_one_bucket(tmp_path):
+    # Two limiters on one state file behave like the limiters of two processes
+    limiters = [http_client.SharedRateLimiter("api.example", rate=20, capacity=1,
+                                              state_dir=str(tmp_path)) for _ in range(2)]
+    waited = []
+
+    def acquire_three(limiter):
+        for _ in range(3):
+            waited.append(limiter.acquire())
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=acquire_three, args=(limiter,)) for limiter in limiters]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert time.monotonic() - started >= 0.24
+    assert sum(waited) > 0
+
+
+def test_open_circuit_fast_fails_until_a_probe_succeeds(server):
+    http_client.configure_circuit_breakers(threshold=2, cooldown=0.3,
+                                           hosts=[f"127.0.0.1:{server.port}"])
+    status = [500]
+    server.add_route("POST", "/add_result_for_case/1/2", lambda request: (status[0], {}))
+    url = f"{server.base_url}/add_result_for_case/1/2"
+    http_client.reset_metrics()
+
+    for _ in range(2):
+        assert http_client.post(url, json={}).status_code == 500
+    with pytest.raises(http_client.CircuitOpenError):
+        http_client.post(url, json={})
+    assert server.count_requests("POST", "/add_result_for_case/1/2") == 2
+    assert http_client.latency_summary()[f"127.0.0.1:{server.port}"]["rejected"] == 1
+
+    time.sleep(0.3)
+    status[0] = 200
+    assert http_client.post(url, json={}).status_code == 200
+    assert http_client.post(url, json={}).status_code == 200
+
+
+def test_hosts_without_a_breaker_are_always_called(server):
+    http_client.configure_circuit_breakers(threshold=1, cooldown=30)
+    server.add_route("POST", "/add_result_for_case/1/2", responses((500, {})))
+    url = f"{server.base_url}/add_result_for_case/1/2"
+
+    for _ in range(3):
+        assert http_client.post(url, json={}).status_code == 500
+    assert server.count_requests("POST", "/add_result_for_case/1/2") == 3
+
+
+def test_failures_counted_under_a_higher_threshold_open_the_circuit(tmp_path):
+    # Another process counted 3 failures without reaching its threshold of 5
+    lenient = http_client.CircuitBreaker("api.mail.tm", threshold=5, state_dir=str(tmp_path))
+    for _ in range(3):
+        lenient.record_failure("ConnectionError")
+    strict = http_client.CircuitBreaker("api.mail.tm", threshold=2, cooldown=30,
+                                        state_dir=str(tmp_path))
+
+    # One probe is let through, the other calls fail fast until it is done
+    strict.check()
+    with pytest.raises(http_client.CircuitOpenError, match="after 3 failures"):
+        strict.check()
@@ -0,0 +1,162 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+from pytest_bdd import parsers
+
+import async_steps
+from account_lease import AccountLeases
+from async_scenarios import StepRegistry, load_scenarios
+from fake_mailtm import FakeMailtm
+from load_mode import build_report, pooled_account_sets, report_lines, run_virtual_users
+from mailtm_pool import MailtmPool
+
+pytestmark = pytest.mark.offline
+
+FEATURE = """Feature: Login
+    Scenario: I can login with a verification code
+        Given I have homepage account: qa@example.com, secret
+        When I check the verification code in the email
+        Then I can see the member center
+"""
+
+PASSWORD_FEATURE = """Feature: Login
+    Scenario: I can login with a password
+        Given I have homepage account: qa@example.com, secret
+        When I fill the password
+        Then I can see the member center
+"""
+
+
+@pytest.fixture
+def scenarios(tmp_path):
+    (tmp_path / "login.feature").write_text(FEATURE)
+    return load_scenarios([str(tmp_path)])
+
+
+@pytest.fixture
+def registry():
+    steps = StepRegistry()
+
+    @steps.given(parsers.parse("I have homepage account: {email}, {password}"), target="user")
+    async def given_user(state, email, password):
+        return state["accounts"].get("user", dict(email=email, password=password))
+
+    @steps.when("I check the verification code in the email")
+    async def wait_for_code(state):
+        await asyncio.sleep(0.05)
+
+    @steps.then("I can see the member center")
+    async def check(state):
+        if state["accounts"].get("fail"):
+            raise AssertionError("member center not shown")
+
+    return steps
+
+
+def run(scenarios, registry, users, accounts, **kwargs):
+    opened = []
+
+    async def open_state(user):
+        opened.append(user)
+        return {"accounts": accounts[user % len(accounts)]}
+
+    async def close_state(state):
+        state["closed"] = True
+
+    started = time.monotonic()
+    records = asyncio.run(run_virtual_users(
+        scenarios, registry, open_state, close_state, users, **kwargs))
+    return records, time.monotonic() - started, opened
+
+
+def test_users_ramp_up_and_run_their_iterations(scenarios, registry):
+    accounts = [{"user": {"email": f"vu{user}@example.com", "password": "secret"}}
+                for user in range(4)]
+
+    records, wall, opened = run(scenarios, registry, 4, accounts, ramp_up=0.3, iterations=3)
+
+    assert sorted(opened) == [0, 0, 0, 1, 1, 1, 2, 2, 2, 3, 3, 3]
+    first_starts = sorted(min(record["started"] for record in records if record["user"] == user)
+                          for user in range(4))
+    assert first_starts[0] < 0.05
+    assert first_starts[3] == pytest.approx(0.225, abs=0.05)
+    assert all(record["passed"] for record in records)
+    assert wall < 0.7
+
+
+def test_target_rate_paces_iterations_across_users(scenarios, registry):
+    records, wall, _ = run(scenarios, registry, 4, [{}], rate=20, duration=0.5)
+
+    starts = sorted(record["started"] for record in records)
+    assert 9 <= len(records) <= 11
+    assert min(later - earlier for earlier, later in zip(starts, starts[1:])) >= 0.04
+
+
+def test_report_has_step_and_end_to_end_percentiles(scenarios, registry):
+    records, wall, _ = run(scenarios, registry, 2, [{}, {"fail": True}], iterations=2)
+
+    report = build_report(records, wall, interval=1)
+
+    assert report["iterations"] == 4
+    assert report["error_rate"] == 0.5
+    assert report["end_to_end"]["samples"] == 2
+    assert report["steps"]["when I check the verification code in the email"]["p50"] >= 0.05
+    assert report["errors"] == [("AssertionError: member center not shown", 2)]
+    assert sum(bucket["passed"] + bucket["failed"] for bucket in report["timeline"]) == 4
+    assert report_lines(report)[0].startswith("4 iterations (2 passed, 50.0% errors)")
+
+
+def test_users_queued_for_one_account_do_not_starve_the_executor(scenarios, tmp_path):
+    steps = StepRegistry()
+
+    @steps.given(parsers.parse("I have homepage account: {email}, {password}"), target="user")
+    async def given_user(state, email, password):
+        await async_steps.lease(state, f"homepage:{email}")
+
+    @steps.when("I check the verification code in the email")
+    async def wait_for_code(state):
+        # Like the OTP waits, which run in worker threads
+        await asyncio.to_thread(time.sleep, 0.1)
+
+    @steps.then("I can see the member center")
+    async def check(state):
+        pass
+
+    async def open_state(user):
+        return {"context": SimpleNamespace(close=AsyncMock()), "accounts": {},
+                "leases": AccountLeases(str(tmp_path), timeout=5, poll_interval=0.01)}
+
+    async def run_with_two_threads():
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=2))
+        return await run_virtual_users(scenarios, steps, open_state, async_steps.close_state,
+                                       users=4, iterations=1)
+
+    started = time.monotonic()
+    records = asyncio.run(run_with_two_threads())
+
+    assert [record["error"] for record in records] == [None] * 4
+    assert time.monotonic() - started < 2
+
+
+def test_users_without_account_sets_get_their_own_inbox(scenarios, tmp_path):
+    with FakeMailtm() as server:
+        pool = MailtmPool(str(tmp_path / "pool.json"), api_url=server.base_url)
+
+        account_sets = pooled_account_sets(scenarios, 3, pool, str(tmp_path / "leases"))
+
+    addresses = [account_set["user"]["email"] for account_set in account_sets]
+    assert len(set(addresses)) == 3
+    assert all(account_set["mail_account"] == account_set["user"] for account_set in account_sets)
+
+
+def test_users_without_account_sets_fail_fast_on_flows_without_a_pool(tmp_path):
+    (tmp_path / "login.feature").write_text(PASSWORD_FEATURE)
+    scenarios = load_scenarios([str(tmp_path)])
+
+    with pytest.raises(ValueError, match="I can login with a password.*accounts file"):
+        pooled_account_sets(scenarios, 3, MailtmPool(str(tmp_path / "pool.json")),
+                            str(tmp_path / "leases"))
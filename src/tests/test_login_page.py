@@ -0,0 +1,27 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+import login_page
+
+pytestmark = pytest.mark.offline
+
+
+@pytest.mark.parametrize("login_type, selector", [
+    ("電子信箱", 'role=button[name="使用 電子信箱 登入"]'),
+    ("LINE", 'role=button[name="使用 LINE登入"]'),
+    ("手機驗證", 'role=button[name="使用 手機驗證登入"]'),
+])
+def test_login_type_buttons(login_type, selector):
+    page = MagicMock()
+
+    login_page.login_type_button(page, login_type)
+
+    page.locator.assert_called_once_with(selector)
+
+
+def test_only_sso_logins_leave_the_site():
+    assert not login_page.leaves_site("電子信箱")
+    assert not login_page.leaves_site("手機驗證")
+    assert login_page.leaves_site("LINE")
+    assert login_page.leaves_site("Facebook")
@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from fake_mailtm import FAKE_DOMAIN, PAGE_SIZE, FakeMailtm
+from mailtm_inbox import InboxIndex
+
+pytestmark = pytest.mark.offline
+
+ADDRESS = f"qa@{FAKE_DOMAIN}"
+SENDER = ("service@dogcatstar.com", "汪喵星球")
+NOW = datetime.now(timezone.utc).replace(microsecond=0)
+
+
+@pytest.fixture
+def fake_mailtm():
+    with FakeMailtm() as server:
+        yield server
+
+
+@pytest.fixture
+def index(fake_mailtm):
+    account = fake_mailtm.add_account(ADDRESS, "secret")
+    return InboxIndex({"Authorization": f"Bearer {account['token']}"}, fake_mailtm.base_url)
+
+
+def fill_inbox(fake_mailtm, count):
+    """
+    A shared inbox: `count` older messages, one per minute, every tenth from the site.
+    """
+    for minutes in range(count, 0, -1):
+        sender = SENDER if minutes % 10 == 0 else (f"news{minutes}@example.com", "News")
+        fake_mailtm.deliver(ADDRESS, *sender, text=f"您的驗證碼為 {minutes:06d}",
+                            created_at=NOW - timedelta(minutes=minutes))
+
+
+def message_pages(fake_mailtm):
+    return fake_mailtm.count_requests("GET", r"/messages")
+
+
+def test_refresh_only_pages_back_to_since_and_then_the_watermark(fake_mailtm, index):
+    fill_inbox(fake_mailtm, 10 * PAGE_SIZE)
+
+    index.refresh(since=NOW - timedelta(minutes=45))
+    assert message_pages(fake_mailtm) == 2
+
+    fake_mailtm.deliver(ADDRESS, *SENDER, text="您的驗證碼為 424242")
+    added = index.refresh(since=NOW - timedelta(minutes=45))
+
+    assert [message["subject"] for message in added] == ["Verification code"]
+    assert message_pages(fake_mailtm) == 3
+
+
+def test_older_since_pages_further_back_once(fake_mailtm, index):
+    fill_inbox(fake_mailtm, 3 * PAGE_SIZE)
+    index.refresh(since=NOW - timedelta(minutes=10))
+    index.refresh(since=NOW - timedelta(minutes=50))
+    pages = message_pages(fake_mailtm)
+
+    index.refresh(since=NOW - timedelta(minutes=50))
+
+    assert pages == 3
+    assert message_pages(fake_mailtm) == pages + 1
+    assert len(index.messages_from(*SENDER, NOW - timedelta(minutes=50))) == 4
+
+
+def test_sender_lookups_and_lazy_bodies(fake_mailtm, index):
+    fill_inbox(fake_mailtm, PAGE_SIZE - 1)
+    index.refresh(since=NOW - timedelta(hours=1))
+
+    latest = index.latest_from(*SENDER, NOW - timedelta(minutes=25))
+    assert latest["created"] == NOW - timedelta(minutes=10)
+    assert index.latest_from(*SENDER, NOW - timedelta(minutes=5)) is None
+    assert [message["created"] for message in index.messages_from(
+        "SERVICE@dogcatstar.com", SENDER[1], NOW - timedelta(minutes=25))] == [
+        NOW - timedelta(minutes=10), NOW - timedelta(minutes=20)]
+
+    assert index.body(latest["id"]) == "您的驗證碼為 000010"
+    assert index.body(latest["id"]) == "您的驗證碼為 000010"
+    assert fake_mailtm.count_requests("GET", r"/messages/[^/]+") == 1
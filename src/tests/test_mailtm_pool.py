@@ -0,0 +1,93 @@
+import base64
+import json
+import time
+
+import pytest
+
+from account_lease import AccountLeases
+from fake_mailtm import FAKE_DOMAIN, FakeMailtm
+from mailtm_pool import MailtmPool, token_expiry
+
+pytestmark = pytest.mark.offline
+
+ADDRESS = f"qa@{FAKE_DOMAIN}"
+
+
+@pytest.fixture
+def fake_mailtm():
+    with FakeMailtm() as server:
+        server.add_account(ADDRESS, "secret")
+        yield server
+
+
+@pytest.fixture
+def new_pool(fake_mailtm, tmp_path):
+    def new_pool(**kwargs):
+        return MailtmPool(str(tmp_path / "mailtm_pool.json"), api_url=fake_mailtm.base_url,
+                          **kwargs)
+    return new_pool
+
+
+def test_token_expiry_reads_the_jwt_exp_claim():
+    claims = base64.urlsafe_b64encode(json.dumps({"exp": 1900000000}).encode()).rstrip(b"=")
+    token = f"eyJ0eXAiOiJKV1QifQ.{claims.decode()}.signature"
+
+    assert token_expiry(token, issued_at=1000) == 1900000000
+    assert token_expiry("not-a-jwt", issued_at=1000) == 1000 + 3600
+
+
+def test_token_is_reused_by_the_next_run(fake_mailtm, new_pool):
+    first = new_pool().authorization(ADDRESS, "secret")
+    second_run = new_pool()
+
+    assert second_run.authorization(ADDRESS) == first
+    assert second_run.token_hits == 1
+    assert fake_mailtm.count_requests("POST", r"/token") == 1
+
+
+def test_expiring_tokens_are_renewed(fake_mailtm, new_pool):
+    pool = new_pool()
+    pool.authorization(ADDRESS, "secret")
+    pool.accounts[ADDRESS]["expires_at"] = time.time() + 60
+
+    assert pool.refresh_expiring() == 1
+    assert pool.refresh_expiring() == 0
+    assert new_pool().accounts[ADDRESS]["expires_at"] > time.time() + 3000
+    assert fake_mailtm.count_requests("POST", r"/token") == 2
+
+
+def test_domains_are_cached_until_the_ttl(fake_mailtm, new_pool):
+    assert new_pool().domains() == [FAKE_DOMAIN]
+    assert new_pool().domains() == [FAKE_DOMAIN]
+    assert fake_mailtm.count_requests("GET", r"/domains") == 1
+
+    new_pool(domain_ttl=0).domains()
+    assert fake_mailtm.count_requests("GET", r"/domains") == 2
+
+
+def test_provisioned_inboxes_are_leased_once(fake_mailtm, new_pool, tmp_path):
+    pool = new_pool()
+    created = pool.provision(2)
+    first = AccountLeases(str(tmp_path / "leases"))
+    second = AccountLeases(str(tmp_path / "leases"))
+
+    leased = [pool.lease(first)["email"], pool.lease(second)["email"]]
+
+    assert sorted(leased) == sorted(created)
+    third = pool.lease(AccountLeases(str(tmp_path / "leases")))
+    assert third["email"] not in created
+    assert third["email"] in fake_mailtm.accounts
+    assert pool.authorization(third["email"]) == (
+        f"Bearer {fake_mailtm.accounts[third['email']]['token']}")
+
+
+def test_provisioning_waits_up_to_the_lease_timeout(new_pool):
+    # Another worker is creating inboxes
+    other = new_pool()._file_lease("provision")
+    try:
+        started = time.monotonic()
+        with pytest.raises(TimeoutError):
+            new_pool(lease_timeout=0.2).provision(1)
+        assert 0.2 <= time.monotonic() - started < 5
+    finally:
+        other.release_all()
@@ -0,0 +1,100 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from fake_mailtm import FAKE_DOMAIN, FakeMailtm
+from mailtm_waiter import wait_for_verification_code
+
+pytestmark = pytest.mark.offline
+
+SENDER = dict(sender_email="service@dogcatstar.com", sender_name="汪喵星球")
+ADDRESS = f"qa@{FAKE_DOMAIN}"
+
+
+@pytest.fixture
+def fake_mailtm():
+    with FakeMailtm() as server:
+        yield server
+
+
+@pytest.fixture
+def headers(fake_mailtm):
+    account = fake_mailtm.add_account(ADDRESS, "secret")
+    return {"Authorization": f"Bearer {account['token']}"}
+
+
+def deliver_later(fake_mailtm, delay, **message):
+    delivered = {}
+
+    def deliver():
+        delivered.update(fake_mailtm.deliver(ADDRESS, **message))
+
+    timer = threading.Timer(delay, deliver)
+    timer.start()
+    return delivered
+
+
+def wait(fake_mailtm, headers, **kwargs):
+    kwargs.setdefault("timeout", 5)
+    return wait_for_verification_code(
+        headers, SENDER, api_url=fake_mailtm.base_url,
+        mercure_url=fake_mailtm.mercure_url, **kwargs)
+
+
+def test_code_pushed_over_mercure_is_returned_without_polling(fake_mailtm, headers):
+    delivered = deliver_later(
+        fake_mailtm, 0.3, sender_email=SENDER["sender_email"],
+        sender_name=SENDER["sender_name"], text="您的驗證碼為 123456")
+
+    code = wait(fake_mailtm, headers)
+
+    latency = time.monotonic() - delivered["deliveredAt"]
+    print(f"Latency to first code over Mercure: {latency * 1000:.1f} ms")
+    assert code == "123456"
+    assert latency < 0.5
+    assert fake_mailtm.count_requests("GET", r"/messages") == 1
+
+
+def test_falls_back_to_polling_when_mercure_is_unavailable(fake_mailtm, headers):
+    fake_mailtm.mercure_enabled = False
+    deliver_later(
+        fake_mailtm, 0.5, sender_email=SENDER["sender_email"],
+        sender_name=SENDER["sender_name"], text="您的驗證碼為 654321")
+
+    code = wait(fake_mailtm, headers, poll_interval=0.2)
+
+    assert code == "654321"
+    assert fake_mailtm.count_requests("GET", r"/messages") >= 2
+
+
+def test_only_the_matching_message_body_is_downloaded(fake_mailtm, headers):
+    for index in range(20):
+        fake_mailtm.deliver(ADDRESS, "news@example.com", "Newsletter",
+                            f"Promo code 99990{index % 10}")
+    fake_mailtm.deliver(ADDRESS, SENDER["sender_email"], SENDER["sender_name"],
+                        "您的驗證碼為 246810")
+
+    code = wait(fake_mailtm, headers)
+
+    assert code == "246810"
+    assert fake_mailtm.count_requests("GET", r"/messages/[^/]+") == 1
+
+
+def test_messages_before_since_are_ignored(fake_mailtm, headers):
+    fake_mailtm.deliver(ADDRESS, SENDER["sender_email"], SENDER["sender_name"],
+                        "您的驗證碼為 111111")
+    since = datetime.now(timezone.utc) + timedelta(milliseconds=50)
+    deliver_later(
+        fake_mailtm, 0.3, sender_email=SENDER["sender_email"],
+        sender_name=SENDER["sender_name"], text="您的驗證碼為 222222")
+
+    assert wait(fake_mailtm, headers, since=since) == "222222"
+
+
+def test_fails_once_the_deadline_passes(fake_mailtm, headers):
+    started = time.monotonic()
+    with pytest.raises(pytest.fail.Exception, match="No verification code"):
+        wait(fake_mailtm, headers, timeout=0.5)
+    assert time.monotonic() - started < 2
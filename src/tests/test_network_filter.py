@@ -0,0 +1,77 @@
+from types import SimpleNamespace
+
+import pytest
+
+from network_filter import NetworkFilter, SizeCache
+
+pytestmark = pytest.mark.offline
+
+
+class FakeRoute:
+    def __init__(self, url, resource_type):
+        self.request = SimpleNamespace(url=url, resource_type=resource_type)
+        self.outcome = None
+
+    def fallback(self):
+        self.outcome = ("fallback",)
+
+    def abort(self, error_code=None):
+        self.outcome = ("abort", error_code)
+
+    def fulfill(self, status=200, content_type=None, body=None):
+        self.outcome = ("fulfill", status, content_type)
+
+
+def handle(request_filter, url, resource_type):
+    route = FakeRoute(url, resource_type)
+    request_filter.handle(route)
+    return route.outcome
+
+
+def test_only_candidate_urls_are_routed():
+    pattern = NetworkFilter().pattern()
+
+    assert pattern.search("https://www.googletagmanager.com/gtm.js?id=GTM-1")
+    assert pattern.search("https://cdn.dogcatstar.com/uploads/banner.WEBP?v=3")
+    assert pattern.search("https://www.dogcatstar.com/fonts/noto.woff2")
+    assert not pattern.search("https://www.dogcatstar.com/my-account/")
+    assert not pattern.search("https://www.dogcatstar.com/wp-json/login?next=a.png.html")
+    assert not pattern.search("https://notgoogletagmanager.com/gtm.js")
+
+
+def test_trackers_are_stubbed_and_heavy_resources_aborted():
+    request_filter = NetworkFilter()
+
+    assert handle(request_filter, "https://www.googletagmanager.com/gtm.js", "script") == (
+        "fulfill", 200, "text/javascript")
+    assert handle(request_filter, "https://region1.google-analytics.com/g/collect", "ping") == (
+        "fulfill", 204, None)
+    assert handle(request_filter, "https://cdn.dogcatstar.com/hero.mp4", "media") == (
+        "abort", "blockedbyclient")
+    # A script served from an image-looking URL is still needed
+    assert handle(request_filter, "https://www.dogcatstar.com/captcha.svg", "script") == (
+        "fallback",)
+    assert request_filter.stats.total_requests == 3
+
+
+def test_allow_list_wins_over_blocked_types_and_domains():
+    request_filter = NetworkFilter(allow=["cdn.dogcatstar.com", "googletagmanager.com"])
+
+    assert handle(request_filter, "https://cdn.dogcatstar.com/logo.png", "image") == ("fallback",)
+    assert handle(request_filter, "https://www.googletagmanager.com/gtm.js", "script") == (
+        "fallback",)
+    assert handle(request_filter, "https://www.dogcatstar.com/logo.png", "image")[0] == "abort"
+
+
+def test_saved_bytes_come_from_learned_sizes(tmp_path):
+    cache = SizeCache(str(tmp_path / "sizes.json"))
+    cache.learn(SimpleNamespace(url="https://cdn.dogcatstar.com/hero.mp4?v=1",
+                                headers={"content-length": "2048"}))
+    cache.save()
+
+    request_filter = NetworkFilter(size_cache=SizeCache(str(tmp_path / "sizes.json")))
+    handle(request_filter, "https://cdn.dogcatstar.com/hero.mp4?v=2", "media")
+    handle(request_filter, "https://cdn.dogcatstar.com/other.mp4", "media")
+
+    assert request_filter.stats.bytes["media"] == 2048
+    assert request_filter.stats.unknown_sizes == 1
@@ -0,0 +1,103 @@
+import json
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import http_client
+from fake_mailtm import FAKE_DOMAIN, FakeMailtm
+from mailtm_waiter import wait_for_verification_code
+from recording import Cassette, CassetteMiss, HarReplayer, match_key
+
+pytestmark = pytest.mark.offline
+
+SENDER = dict(sender_email="service@dogcatstar.com", sender_name="汪喵星球")
+ADDRESS = f"qa@{FAKE_DOMAIN}"
+
+
+class FakeRoute:
+    def __init__(self, method, url):
+        self.request = SimpleNamespace(method=method, url=url)
+        self.outcome = None
+
+    def fallback(self):
+        self.outcome = ("fallback",)
+
+    def abort(self, error_code=None):
+        self.outcome = ("abort", error_code)
+
+    def fulfill(self, status=200, headers=None, body=None):
+        self.outcome = ("fulfill", status, headers, body)
+
+
+@pytest.fixture
+def cassette_path(tmp_path):
+    yield str(tmp_path / "scenario.cassette.json")
+    http_client.use_cassette(None)
+
+
+def test_volatile_query_params_are_ignored():
+    assert match_key("get", "https://www.dogcatstar.com/?_=1700000000&utm_source=x&page=2") == \
+        match_key("GET", "https://www.dogcatstar.com/?page=2&_=1800000000")
+    assert match_key("GET", "https://api.mail.tm/messages", {"page": 1}) == \
+        "GET https://api.mail.tm/messages?page=1"
+    assert match_key("GET", "https://www.dogcatstar.com/?page=2") != \
+        match_key("GET", "https://www.dogcatstar.com/?page=3")
+
+
+def test_har_entries_replay_in_order_and_misses_are_aborted(tmp_path):
+    def entry(url, status, text):
+        return {"request": {"method": "GET", "url": url},
+                "response": {"status": status, "content": {"text": text},
+                             "headers": [{"name": "Content-Type", "value": "text/html"},
+                                         {"name": "Content-Length", "value": "99"},
+                                         {"name": "Set-Cookie", "value": "a=1"},
+                                         {"name": "Set-Cookie", "value": "b=2"}]}}
+
+    har = tmp_path / "scenario-1.har"
+    har.write_text(json.dumps({"log": {"entries": [
+        entry("https://www.dogcatstar.com/?v=1", 200, "first"),
+        entry("https://www.dogcatstar.com/?v=2", 200, "second"),
+        entry("https://www.googletagmanager.com/gtm.js", -1, ""),
+    ]}}))
+    replayer = HarReplayer([str(har)])
+
+    outcomes = []
+    for url in ("https://www.dogcatstar.com/?v=9", "https://www.dogcatstar.com/",
+                "https://www.dogcatstar.com/", "https://www.googletagmanager.com/gtm.js"):
+        route = FakeRoute("GET", url)
+        replayer.handle(route)
+        outcomes.append(route.outcome)
+
+    assert [outcome[-1] for outcome in outcomes[:3]] == [b"first", b"second", b"second"]
+    assert outcomes[0][2] == {"content-type": "text/html", "set-cookie": "a=1\nb=2"}
+    assert outcomes[3] == ("abort", "internetdisconnected")
+    assert replayer.misses == ["GET https://www.googletagmanager.com/gtm.js"]
+
+
+def test_recorded_otp_wait_replays_without_the_service(cassette_path):
+    with FakeMailtm() as fake_mailtm:
+        account = fake_mailtm.add_account(ADDRESS, "secret")
+        headers = {"Authorization": f"Bearer {account['token']}"}
+        recorder = Cassette(cassette_path, "record", hosts=["127.0.0.1"])
+        http_client.use_cassette(recorder)
+        since = http_client.now()
+        threading.Timer(0.3, lambda: fake_mailtm.deliver(
+            ADDRESS, SENDER["sender_email"], SENDER["sender_name"],
+            "您的驗證碼為 246810")).start()
+
+        assert wait_for_verification_code(
+            headers, SENDER, timeout=5, since=since, api_url=fake_mailtm.base_url,
+            mercure_url=fake_mailtm.mercure_url) == "246810"
+        recorder.save()
+        api_url, mercure_url = fake_mailtm.base_url, fake_mailtm.mercure_url
+
+    replayer = Cassette(cassette_path, "replay", hosts=["127.0.0.1"])
+    http_client.use_cassette(replayer)
+
+    assert http_client.now() == since
+    assert wait_for_verification_code(
+        headers, SENDER, timeout=5, since=since, api_url=api_url,
+        mercure_url=mercure_url) == "246810"
+    with pytest.raises(CassetteMiss):
+        http_client.get(f"{api_url}/domains")
@@ -0,0 +1,126 @@
+import os
+import subprocess
+import sys
+import textwrap
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import result_cache
+from result_cache import ResultCachePlugin
+
+pytestmark = pytest.mark.offline
+
+FEATURE = """
+Feature: Cached
+    Scenario: Adding
+        Given I have 1
+        Then I have {expected}
+"""
+
+STEPS = """
+from pytest_bdd import given, parsers, scenarios, then
+
+scenarios("cached.feature")
+
+
+@given(parsers.parse("I have {{number:d}}"), target_fixture="number")
+def have(number):
+    return number
+
+
+@then(parsers.parse("I have {{expected:d}}"))
+def check(number, expected):
+    assert number {operator} expected
+"""
+
+CONFTEST = """
+import result_cache
+
+
+def pytest_addoption(parser):
+    parser.addoption("--max-cache-age", type=float, default=60)
+    parser.addoption("--result-cache-path", default="results.json")
+    parser.addoption("--deploy-version", default=None)
+
+
+def pytest_configure(config):
+    config.pluginmanager.register(result_cache.ResultCachePlugin(config), "result_cache")
+"""
+
+
+def write_project(directory, expected=1, operator="=="):
+    (directory / "cached.feature").write_text(FEATURE.format(expected=expected))
+    (directory / "test_cached.py").write_text(STEPS.format(operator=operator))
+    (directory / "conftest.py").write_text(CONFTEST)
+
+
+def run(directory, *args):
+    tests_dir = os.path.dirname(os.path.abspath(__file__))
+    environment = dict(os.environ, PYTHONPATH=tests_dir)
+    completed = subprocess.run(
+        [sys.executable, "-m", "pytest", "-q", "-p", "no:cacheprovider", "-rs", *args],
+        cwd=directory, env=environment, capture_output=True, text=True)
+    return completed.stdout
+
+
+def test_unchanged_scenarios_are_skipped_until_something_changes(tmp_path):
+    write_project(tmp_path)
+    assert "1 passed" in run(tmp_path)
+
+    output = run(tmp_path)
+    assert "1 skipped" in output and "cached: passed" in output
+    assert "1 skipped" in run(tmp_path, "--deploy-version", "")
+
+    # A new deploy, an edited feature file and an edited step each run it again
+    assert "1 passed" in run(tmp_path, "--deploy-version", "2.0")
+    assert "1 skipped" in run(tmp_path, "--deploy-version", "2.0")
+    write_project(tmp_path, expected=2)
+    assert "1 failed" in run(tmp_path, "--deploy-version", "2.0")
+    # A failure is never cached
+    assert "1 failed" in run(tmp_path, "--deploy-version", "2.0")
+    write_project(tmp_path, expected=2, operator="<=")
+    assert "1 passed" in run(tmp_path, "--deploy-version", "2.0")
+    assert "1 passed" in run(tmp_path, "--deploy-version", "2.0", "--max-cache-age", "0")
+
+
+def test_the_cache_is_kept_under_xdist(tmp_path):
+    pytest.importorskip("xdist")
+    write_project(tmp_path)
+    assert "1 passed" in run(tmp_path, "-n", "2")
+
+    output = run(tmp_path, "-n", "2")
+    assert "1 skipped" in output and "cached: passed" in output
+    assert "1 scenarios skipped as cached" in run(tmp_path, "-n", "2", "-rN")
+
+
+def plugin(tmp_path, entries, max_age=60):
+    path = tmp_path / "results.json"
+    config = SimpleNamespace(getoption={
+        "result_cache_path": str(path), "max_cache_age": max_age, "deploy_version": "1"}.get)
+    plugin = ResultCachePlugin(config)
+    plugin.entries = entries
+    return plugin
+
+
+def test_only_recent_passes_with_the_same_fingerprint_are_skipped(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_cache, "fingerprint",
+                        lambda item, version: None if item.nodeid == "plain" else f"{version}-abc")
+    now = time.time()
+    entries = {
+        "fresh": dict(fingerprint="1-abc", outcome="passed", ran_at=now - 10),
+        "stale": dict(fingerprint="1-abc", outcome="passed", ran_at=now - 120),
+        "failed": dict(fingerprint="1-abc", outcome="failed", ran_at=now - 10),
+        "changed": dict(fingerprint="0-abc", outcome="passed", ran_at=now - 10),
+    }
+    items = [SimpleNamespace(nodeid=nodeid, markers=[]) for nodeid in [*entries, "new", "plain"]]
+    for item in items:
+        item.add_marker = item.markers.append
+    cache = plugin(tmp_path, entries)
+
+    cache.pytest_collection_modifyitems(items)
+
+    assert cache.skipped == {"fresh"}
+    assert [item.nodeid for item in items if item.markers] == ["fresh"]
+    assert "plain" not in cache.fingerprints
@@ -0,0 +1,116 @@
+from types import SimpleNamespace
+
+import pytest
+
+from sharding import DurationStore, ShardingPlugin, junit_key, parse_shard, split_into_shards
+
+pytestmark = pytest.mark.offline
+
+JUNIT = """<?xml version="1.0" encoding="utf-8"?>
+<testsuites><testsuite name="pytest" tests="3">
+<testcase classname="src.tests.test_homepage_login" name="test_login_with_email_password_caseid_1" time="{fast}" />
+<testcase classname="src.tests.test_homepage_login" name="test_login_with_phone_verification_code_caseid_12" time="190.0" />
+<testcase classname="src.tests.test_homepage_login" name="test_login_with_sso_line_caseid_10" time="40.0" />
+</testsuite></testsuites>
+"""
+
+
+def items(*nodeids):
+    return [SimpleNamespace(nodeid=nodeid) for nodeid in nodeids]
+
+
+def test_durations_are_learned_once_per_junit_file(tmp_path):
+    store_path = str(tmp_path / "durations.json")
+    junit = tmp_path / "results.xml"
+    junit.write_text(JUNIT.format(fast="10.0"))
+    store = DurationStore(store_path)
+
+    assert store.ingest(str(junit)) == 3
+    assert store.ingest(str(junit)) == 0
+    assert store.ingest(str(tmp_path / "missing.xml")) == 0
+    junit.write_text(JUNIT.format(fast="20.0"))
+    store.ingest(str(junit))
+    store.save()
+
+    reloaded = DurationStore(store_path)
+    nodeid = "src/tests/test_homepage_login.py::test_login_with_email_password_caseid_1"
+    assert junit_key(nodeid) == (
+        "src.tests.test_homepage_login::test_login_with_email_password_caseid_1")
+    assert reloaded.estimate(nodeid, None) == pytest.approx(13.0)
+    assert reloaded.estimate("src/tests/test_new.py::test_new", 5.0) == 5.0
+    assert len(reloaded.sources) == 2
+
+
+def test_shards_are_balanced_and_longest_first():
+    durations = {"a": 300, "b": 240, "c": 200, "d": 120, "e": 90, "f": 60, "g": 30, "h": 10}
+
+    shards = split_into_shards(items(*durations), durations, 3)
+
+    totals = [total for total, _ in shards]
+    assert sum(totals) == sum(durations.values())
+    assert max(totals) - min(totals) <= 60
+    assert max(totals) <= sum(durations.values()) / 3 + 60
+    for _, tests in shards:
+        assert [durations[item.nodeid] for item in tests] == sorted(
+            (durations[item.nodeid] for item in tests), reverse=True)
+    assert sorted(item.nodeid for _, tests in shards for item in tests) == sorted(durations)
+
+
+def test_shard_option_is_validated():
+    assert parse_shard("2/4") == (2, 4)
+    for value in ("0/4", "5/4", "2-4"):
+        with pytest.raises(pytest.UsageError):
+            parse_shard(value)
+
+
+def node_config(store_path, shard, xml_path=None, digest=None):
+    options = {"shard": shard, "durations_store": store_path, "durations_from": [],
+               "durations_digest": digest}
+    return SimpleNamespace(getoption=options.get, option=SimpleNamespace(xmlpath=xml_path),
+                           hook=SimpleNamespace(pytest_deselected=lambda items: None))
+
+
+def run_shard(config, nodeids):
+    selected = items(*nodeids)
+    ShardingPlugin(config).pytest_collection_modifyitems(config, selected)
+    return [item.nodeid for item in selected]
+
+
+def test_nodes_plan_from_the_shared_store_not_their_own_results(tmp_path):
+    nodeids = [f"src/tests/test_homepage_login.py::{name}" for name in (
+        "test_login_with_email_password_caseid_1", "test_login_with_phone_verification_code_caseid_12",
+        "test_login_with_sso_line_caseid_10", "test_other")]
+    shared = tmp_path / "durations.json"
+    store = DurationStore(str(shared))
+    junit = tmp_path / "shared.xml"
+    junit.write_text(JUNIT.format(fast="10.0"))
+    store.ingest(str(junit))
+    store.save()
+    # Each node's JUnit XML of its previous run says something else
+    local = []
+    for node, fast in enumerate(("500.0", "1.0")):
+        path = tmp_path / f"node{node}.xml"
+        path.write_text(JUNIT.format(fast=fast))
+        local.append(str(path))
+
+    first = run_shard(node_config(str(shared), "1/2", local[0]), nodeids)
+    second = run_shard(node_config(str(shared), "2/2", local[1]), nodeids)
+
+    assert not set(first) & set(second)
+    assert sorted(first + second) == sorted(nodeids)
+
+
+def test_a_node_with_other_durations_refuses_to_shard(tmp_path):
+    stores = []
+    for node, fast in enumerate(("10.0", "500.0")):
+        junit = tmp_path / f"node{node}.xml"
+        junit.write_text(JUNIT.format(fast=fast))
+        store = DurationStore(str(tmp_path / f"durations{node}.json"))
+        store.ingest(str(junit))
+        store.save()
+        stores.append(store)
+    expected = stores[0].digest()
+
+    ShardingPlugin(node_config(stores[0].path, "1/2", digest=expected))
+    with pytest.raises(pytest.UsageError, match=expected):
+        ShardingPlugin(node_config(stores[1].path, "2/2", digest=expected))
@@ -0,0 +1,125 @@
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import time
+
+import pytest
+
+pytestmark = pytest.mark.offline
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(TESTS_DIR, "..", "..")
+BASELINE = os.path.join(TESTS_DIR, "startup_baseline.json")
+RUNS = 3
+
+# Loaded only when an OTP scenario or a recording needs them
+LAZY_MODULES = ("requests", "urllib3", "twilio", "twilio_sms", "mailtm_waiter", "recording")
+# Imported by pytest and its plugins before conftest.py, so not conftest's cost
+PRELOADED = "import pytest, pytest_bdd, playwright.sync_api"
+
+
+def import_times(code):
+    """
+    Run `code` in the tests directory under -X importtime and return the
+    cumulative import time of every module in seconds. Bytecode is written,
+    so after a first run the times do not include compiling edited modules.
+    """
+    env = {name: value for name, value in os.environ.items()
+           if name != "PYTHONDONTWRITEBYTECODE"}
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                            cwd=TESTS_DIR, env=env, capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \| +(\S+)$", line)
+        if match:
+            times[match.group(2)] = int(match.group(1)) / 1e6
+    return times
+
+
+def collect_seconds(*args):
+    started = time.monotonic()
+    subprocess.run([sys.executable, "-m", "pytest", "--collect-only", "-q", "-p", "no:cacheprovider",
+                    "-o", "addopts=", *args, os.path.join("src", "tests", "test_step_timing.py")],
+                   cwd=ROOT, capture_output=True, check=True)
+    return time.monotonic() - started
+
+
+def check_baseline(path, name, value, slack):
+    """
+    Fail when `value` exceeds the baseline recorded in `path` by more than
+    `slack`. A value without a baseline is recorded in `path`.
+    """
+    baseline = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            baseline = json.load(f)
+    print(f"{name}: {value:.3f} (baseline {baseline.get(name, 'none')})")
+    if os.environ.get("UPDATE_STARTUP_BASELINE") or name not in baseline:
+        baseline[name] = round(value, 3)
+        with open(path, "w") as f:
+            json.dump(baseline, f, indent=4, sort_keys=True)
+        return
+    assert value <= baseline[name] + slack, (
+        f"{name} regressed to {value:.3f} from {baseline[name]:.3f}; "
+        f"run with UPDATE_STARTUP_BASELINE=1 if the slowdown is intended")
+
+
+def baseline_path(tmp_path):
+    """
+    The baseline file to check against. A normal run works on a copy in
+    tmp_path; only UPDATE_STARTUP_BASELINE=1 writes the tracked file.
+    """
+    if os.environ.get("UPDATE_STARTUP_BASELINE"):
+        return BASELINE
+    path = tmp_path / "startup_baseline.json"
+    if os.path.exists(BASELINE):
+        shutil.copy(BASELINE, path)
+    return path
+
+
+@pytest.fixture
+def baseline(tmp_path):
+    return baseline_path(tmp_path)
+
+
+def test_a_normal_run_does_not_write_the_baseline(tmp_path, monkeypatch):
+    monkeypatch.delenv("UPDATE_STARTUP_BASELINE", raising=False)
+    baseline = baseline_path(tmp_path)
+    with open(BASELINE) as f:
+        tracked = f.read()
+
+    check_baseline(baseline, "new_measurement", 1.0, slack=0.1)
+    with pytest.raises(AssertionError, match="regressed"):
+        check_baseline(baseline, "new_measurement", 1.2, slack=0.1)
+
+    with open(BASELINE) as f:
+        assert f.read() == tracked
+
+
+def test_conftest_does_not_import_the_otp_integrations():
+    imported = import_times(f"{PRELOADED}; import conftest")
+
+    assert "conftest" in imported
+    assert not [module for module in LAZY_MODULES if module in imported]
+
+
+def test_conftest_import_time_against_baseline(baseline):
+    # Relative to importing pytest, so the check holds on slower machines
+    import_times(f"{PRELOADED}; import conftest")
+    ratios = []
+    for _ in range(RUNS):
+        times = import_times(f"{PRELOADED}; import conftest")
+        ratios.append(times["conftest"] / times["pytest"])
+
+    check_baseline(baseline, "conftest_import_vs_pytest", min(ratios), slack=0.1)
+
+
+def test_collection_time_against_baseline(baseline):
+    with_conftest = min(collect_seconds() for _ in range(RUNS))
+    without_conftest = min(collect_seconds("--noconftest") for _ in range(RUNS))
+    print(f"collect-only: {with_conftest:.2f}s, {without_conftest:.2f}s without conftest.py")
+
+    check_baseline(baseline, "collect_with_vs_without_conftest", with_conftest / without_conftest, slack=0.1)
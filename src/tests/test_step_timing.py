@@ -0,0 +1,91 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from step_timing import TIMELINE_FILE, find_regressions, summarize
+
+pytestmark = pytest.mark.offline
+
+
+def record(step, wall, test="test_login"):
+    return dict(test=test, type="when", step=step, wall=wall)
+
+
+def test_summary_has_p50_and_p95_per_step():
+    records = [record("I go to page", wall) for wall in (1.0, 2.0, 3.0, 4.0, 10.0)]
+
+    stats = summarize(records)["test_login :: when I go to page"]
+
+    assert stats["p50"] == 3.0
+    assert stats["p95"] == 10.0
+    assert stats["samples"] == 5
+
+
+def test_only_slower_steps_beyond_the_threshold_are_flagged():
+    baseline = [record("I go to page", 2.0), record("I fill the password", 1.0)]
+    current = [record("I go to page", 2.2), record("I fill the password", 3.0)]
+
+    regressions = find_regressions(current, baseline, threshold=0.2)
+
+    assert {r["step"] for r in regressions} == {"test_login :: when I fill the password"}
+    assert {r["stat"] for r in regressions} == {"p50", "p95"}
+
+
+def test_steps_missing_from_the_baseline_are_not_flagged():
+    assert find_regressions([record("I logout", 5.0)], [record("I go to page", 1.0)]) == []
+
+
+FEATURE = """
+Feature: Timed
+    Scenario: First
+        Given I wait
+
+    Scenario: Second
+        Given I wait
+"""
+
+STEPS = """
+from pytest_bdd import given, scenarios
+
+scenarios("timed.feature")
+
+
+@given("I wait")
+def wait():
+    pass
+"""
+
+CONFTEST = """
+from step_timing import StepTimingPlugin
+
+
+def pytest_addoption(parser):
+    parser.addoption("--timing-dir", default="results")
+    parser.addoption("--timing-baseline", default=None)
+    parser.addoption("--timing-threshold", type=float, default=0.2)
+    parser.addoption("--timing-fail-on-regression", action="store_true")
+
+
+def pytest_configure(config):
+    config.pluginmanager.register(StepTimingPlugin(config), "step_timing")
+"""
+
+
+def test_the_controller_writes_the_steps_of_every_worker(tmp_path):
+    pytest.importorskip("xdist")
+    (tmp_path / "timed.feature").write_text(FEATURE)
+    (tmp_path / "test_timed.py").write_text(STEPS)
+    (tmp_path / "conftest.py").write_text(CONFTEST)
+    environment = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+
+    subprocess.run([sys.executable, "-m", "pytest", "-q", "-p", "no:cacheprovider", "-n", "2"],
+                   cwd=tmp_path, env=environment, capture_output=True, check=True)
+
+    with open(tmp_path / "results" / TIMELINE_FILE) as f:
+        steps = json.load(f)["steps"]
+    assert sorted(step["test"].split("::")[-1] for step in steps) == [
+        "test_first", "test_second"]
+    assert all(step["worker"].startswith("gw") and "other" in step for step in steps)
@@ -0,0 +1,193 @@
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from fake_testrail import FakeTestRail
+from testrail_reporter import BackgroundUploader, TestRailReporter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "scripts"))
+import testrail  # noqa: E402
+
+pytestmark = pytest.mark.offline
+
+
+def write_junit(path, passed=0, failed=0):
+    cases = [f'<testcase classname="t" name="test_login_caseid_{i}[user{i}@example.com]"/>'
+             for i in range(passed)]
+    cases += [f'<testcase classname="t" name="test_login_caseid_{1000 + i}">'
+              f'<failure message="boom">AssertionError {i}</failure></testcase>'
+              for i in range(failed)]
+    path.write_text(f'<testsuites><testsuite name="pytest">{"".join(cases)}'
+                    f'<testcase classname="t" name="test_without_case"/></testsuite></testsuites>')
+    return str(path)
+
+
+@pytest.fixture
+def fake_testrail(monkeypatch):
+    with FakeTestRail() as server:
+        monkeypatch.setenv("TESTRAIL_URL", server.base_url)
+        monkeypatch.setenv("TESTRAIL_ACCOUNT", "qa@example.com")
+        monkeypatch.setenv("TESTRAIL_TOKEN", "token")
+        yield server
+
+
+def test_results_keep_the_comment_format(tmp_path):
+    results = list(testrail.collect_results(write_junit(tmp_path / "results.xml", 1, 1)))
+
+    assert results[0]["comment"] == "Test passed successfully.\nLogin Info: user0@example.com"
+    assert results[1]["status_id"] == 5
+    assert results[1]["comment"] == "Test failed. AssertionError 0\nLogin Info: No additional info"
+
+
+def test_bulk_upload_sends_concurrent_chunks(tmp_path, fake_testrail):
+    results = testrail.collect_results(write_junit(tmp_path / "results.xml", 230, 20))
+
+    failed = testrail.upload_results_in_bulk(7, results, chunk_size=50, workers=3)
+
+    assert failed == []
+    assert len(fake_testrail.results) == 250
+    assert fake_testrail.count_requests("POST", r"/add_results_for_cases/7") == 5
+    assert 1 < fake_testrail.max_in_flight <= 3
+
+
+def test_bulk_upload_waits_for_retry_after(tmp_path, fake_testrail):
+    fake_testrail.scripted_responses.append(
+        (429, {"error": "API Rate Limit Exceeded"}, {"Retry-After": "0.2"}))
+    results = testrail.collect_results(write_junit(tmp_path / "results.xml", 10))
+
+    failed = testrail.upload_results_in_bulk(7, results, chunk_size=10)
+
+    assert failed == []
+    assert len(fake_testrail.results) == 10
+
+
+def test_rejected_chunks_are_reported(tmp_path, fake_testrail):
+    fake_testrail.scripted_responses.append((400, {"error": "Field :results cannot be empty"}))
+    results = testrail.collect_results(write_junit(tmp_path / "results.xml", 20))
+
+    failed = testrail.upload_results_in_bulk(7, results, chunk_size=10, workers=1)
+
+    assert [len(chunk) for chunk in failed] == [10]
+    assert len(fake_testrail.results) == 10
+
+
+def test_dry_run_sends_nothing(tmp_path, fake_testrail, capsys):
+    results = testrail.collect_results(write_junit(tmp_path / "results.xml", 3))
+
+    assert testrail.upload_results_in_bulk(7, results, dry_run=True) == []
+    assert fake_testrail.requests_log == []
+    assert "add_results_for_cases/7" in capsys.readouterr().out
+
+
+def test_interrupted_sync_resumes_from_the_ledger(tmp_path, fake_testrail):
+    xml_file = write_junit(tmp_path / "results.xml", 30)
+    ledger = testrail.UploadLedger(str(tmp_path / "ledger.jsonl"))
+    fake_testrail.scripted_responses.append((400, {"error": "Field :results cannot be empty"}))
+
+    failed = testrail.upload_results_in_bulk(
+        7, testrail.collect_results(xml_file), chunk_size=10, workers=1, ledger=ledger)
+    assert len(failed) == 1
+
+    resumed = testrail.UploadLedger(str(tmp_path / "ledger.jsonl"))
+    failed = testrail.upload_results_in_bulk(
+        7, testrail.collect_results(xml_file), chunk_size=10, workers=1, ledger=resumed)
+
+    assert failed == []
+    assert len(fake_testrail.results) == 30
+    assert sorted(result["case_id"] for _, result in fake_testrail.results) == list(range(30))
+
+
+def test_changed_results_are_uploaded_again(tmp_path, fake_testrail):
+    ledger = testrail.UploadLedger(str(tmp_path / "ledger.jsonl"))
+    testrail.parse_pytest_results(write_junit(tmp_path / "first.xml", 2), 7, ledger)
+    testrail.parse_pytest_results(write_junit(tmp_path / "second.xml", 2, 1), 7, ledger)
+
+    assert [result["case_id"] for _, result in fake_testrail.results] == [0, 1, 1000]
+
+
+def test_background_uploader_flushes_while_tests_run(fake_testrail):
+    uploader = BackgroundUploader(7, chunk_size=2, flush_interval=0.2)
+    uploader.put(testrail.build_result("test_login_caseid_1[a]"))
+    time.sleep(0.5)
+
+    assert len(fake_testrail.results) == 1
+
+    for index in range(3):
+        uploader.put(testrail.build_result(f"test_login_caseid_2[{index}]", "boom", True))
+    uploader.close()
+
+    assert uploader.uploaded == 4
+    assert fake_testrail.count_requests("POST", r"/add_results_for_cases/7") == 3
+    assert fake_testrail.results[-1][1]["comment"] == "Test failed. boom\nLogin Info: 2"
+
+
+def report(nodeid, when, outcome="passed", case_id=None, longrepr=None):
+    return SimpleNamespace(nodeid=nodeid, when=when, failed=outcome == "failed",
+                           longrepr=longrepr,
+                           user_properties=[("case_id", case_id)] if case_id else [])
+
+
+def run_test(reporter, nodeid, case_id=None, failure=None):
+    reporter.pytest_runtest_logreport(report(nodeid, "setup", case_id=case_id))
+    reporter.pytest_runtest_logreport(report(nodeid, "call", "failed" if failure else "passed",
+                                             case_id, failure))
+    reporter.pytest_runtest_logreport(report(nodeid, "teardown", case_id=case_id))
+
+
+def terminal_lines(reporter):
+    lines = []
+    reporter.pytest_terminal_summary(SimpleNamespace(
+        section=lambda title: lines.append(f"== {title}"),
+        write_line=lambda line, **markup: lines.append(line)))
+    return lines
+
+
+def test_reporter_maps_outcomes_and_flushes_on_finish(fake_testrail):
+    reporter = TestRailReporter(7, flush_interval=60)
+
+    run_test(reporter, "test_login.py::test_login[member@dogcat.test]", case_id=11)
+    run_test(reporter, "test_login.py::test_logout", case_id=12, failure="AssertionError: boom")
+    run_test(reporter, "test_login.py::test_without_case")
+    # Nothing is sent before the flush interval, until the session finishes
+    assert fake_testrail.results == []
+    reporter.pytest_sessionfinish(session=None)
+
+    assert fake_testrail.count_requests("POST", r"/add_results_for_cases/7") == 1
+    assert [result for _, result in fake_testrail.results] == [
+        {"case_id": 11, "status_id": 1,
+         "comment": "Test passed successfully.\nLogin Info: member@dogcat.test"},
+        {"case_id": 12, "status_id": 5,
+         "comment": "Test failed. AssertionError: boom\nLogin Info: No additional info"},
+    ]
+    assert terminal_lines(reporter) == ["== TestRail", "2 results uploaded to run_id 7"]
+
+
+def test_reporter_uploads_in_chunks(fake_testrail):
+    reporter = TestRailReporter(7, chunk_size=2, flush_interval=60)
+
+    for case_id in range(5):
+        run_test(reporter, f"test_login.py::test_case_{case_id}", case_id=case_id + 1)
+    reporter.pytest_sessionfinish(session=None)
+
+    assert fake_testrail.count_requests("POST", r"/add_results_for_cases/7") == 3
+    assert sorted(result["case_id"] for _, result in fake_testrail.results) == [1, 2, 3, 4, 5]
+
+
+def test_reporter_skips_uploaded_results_and_reports_rejected_ones(tmp_path, fake_testrail):
+    ledger = testrail.UploadLedger(str(tmp_path / "ledger.jsonl"))
+    ledger.record(7, [testrail.build_result("test_logout", case_id=12)])
+    fake_testrail.scripted_responses.append((400, {"error": "Field :results cannot be empty"}))
+    reporter = TestRailReporter(7, flush_interval=60, ledger=ledger)
+
+    run_test(reporter, "test_login.py::test_logout", case_id=12)
+    run_test(reporter, "test_login.py::test_login", case_id=11)
+    reporter.pytest_sessionfinish(session=None)
+
+    assert fake_testrail.count_requests("POST", r"/add_results_for_cases/7") == 1
+    assert [result["case_id"] for result in reporter.uploader.failed] == [11]
+    lines = terminal_lines(reporter)
+    assert "0 results uploaded to run_id 7" in lines
+    assert "python scripts/testrail.py -run_id=7 -bulk" in lines[-1]
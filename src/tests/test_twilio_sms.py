@@ -0,0 +1,70 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from fake_twilio import ACCOUNT_SID, FakeTwilio
+from twilio_sms import make_twilio_client, wait_for_sms_code
+
+pytestmark = pytest.mark.offline
+
+PHONE_INFO = {"region_code": "+886", "phone_number": "912345678"}
+TO = "+886912345678"
+
+
+@pytest.fixture
+def fake_twilio():
+    with FakeTwilio() as server:
+        yield server
+
+
+@pytest.fixture
+def client(fake_twilio):
+    return make_twilio_client(ACCOUNT_SID, "token", fake_twilio.base_url)
+
+
+def wait(client, **kwargs):
+    kwargs.setdefault("timeout", 5)
+    kwargs.setdefault("poll_interval", 0.1)
+    kwargs.setdefault("consumed", set())
+    return wait_for_sms_code(PHONE_INFO, client=client, **kwargs)
+
+
+def test_waits_for_an_sms_that_arrives_later(fake_twilio, client):
+    delivered = {}
+    threading.Timer(0.5, lambda: delivered.update(
+        fake_twilio.send_sms(TO, "[汪喵星球] 您的驗證碼為 135790"))).start()
+
+    code = wait(client, requested_at=datetime.now(timezone.utc))
+
+    latency = time.monotonic() - delivered["deliveredAt"]
+    print(f"Latency to first SMS code: {latency * 1000:.1f} ms")
+    assert code == "135790"
+    assert latency < 1
+
+
+def test_messages_sent_before_the_request_are_stale(fake_twilio, client):
+    requested_at = datetime.now(timezone.utc)
+    fake_twilio.send_sms(TO, "您的驗證碼為 111111", sent_at=requested_at - timedelta(minutes=2))
+    fake_twilio.send_sms(TO, "您的驗證碼為 222222", sent_at=requested_at + timedelta(seconds=1))
+
+    assert wait(client, requested_at=requested_at) == "222222"
+
+
+def test_a_consumed_code_is_not_returned_twice(fake_twilio, client):
+    requested_at = datetime.now(timezone.utc)
+    fake_twilio.send_sms(TO, "您的驗證碼為 333333", sent_at=requested_at)
+    consumed = set()
+
+    assert wait(client, requested_at=requested_at, consumed=consumed) == "333333"
+    with pytest.raises(ValueError, match="No verification code"):
+        wait(client, requested_at=requested_at, consumed=consumed, timeout=0.3)
+
+
+def test_polling_backs_off(fake_twilio, client):
+    with pytest.raises(ValueError):
+        wait(client, timeout=1, poll_interval=0.1, max_poll_interval=0.4)
+
+    assert 3 <= fake_twilio.count_requests(
+        "GET", r"/2010-04-01/Accounts/[^/]+/Messages\.json") <= 7
@@ -0,0 +1,127 @@
+from contextlib import contextmanager
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import pytest
+from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
+
+import waits
+from web_perf import is_login_api
+
+pytestmark = pytest.mark.offline
+
+
+def timing_out(*args, **kwargs):
+    raise PlaywrightTimeoutError("Timeout 10000ms exceeded.")
+
+
+def test_waits_are_recorded_per_step_and_kind(sleep_budget):
+    page = MagicMock()
+    locator = MagicMock()
+
+    waits.set_current_step("I click login icon")
+    waits.wait_for_locator(locator, "hidden", timeout=500)
+    waits.set_current_step("I wait for 3 seconds")
+    waits.sleep(page, 3000)
+
+    locator.wait_for.assert_called_once_with(state="hidden", timeout=500)
+    page.wait_for_timeout.assert_called_once_with(3000)
+    assert [(record["step"], record["kind"]) for record in sleep_budget.records] == [
+        ("I click login icon", "locator:hidden"), ("I wait for 3 seconds", "sleep")]
+    assert set(sleep_budget.by_step()) == {"I click login icon", "I wait for 3 seconds"}
+
+
+def test_a_locator_not_shown_in_time_is_reported_not_raised(sleep_budget):
+    locator = MagicMock()
+    locator.wait_for.side_effect = timing_out
+
+    assert not waits.is_shown_within(locator, timeout=100)
+    assert sleep_budget.records[0]["timed_out"]
+
+
+def test_dom_settled_waits_for_the_quiet_period():
+    page = MagicMock()
+
+    assert waits.wait_for_dom_settled(page, quiet_ms=200, timeout=1000)
+    page.evaluate.assert_called_once_with(waits.OBSERVE_MUTATIONS_JS)
+    page.wait_for_function.assert_called_once_with(waits.DOM_QUIET_JS, arg=200, timeout=1000)
+
+
+def test_a_dom_that_never_settles_gives_up_on_the_timeout(sleep_budget):
+    page = MagicMock()
+    page.wait_for_function.side_effect = timing_out
+
+    assert not waits.wait_for_dom_settled(page, timeout=1000)
+    assert sleep_budget.records[0]["kind"] == "dom" and sleep_budget.records[0]["timed_out"]
+
+
+def test_other_timeouts_still_fail_the_step(sleep_budget):
+    page = MagicMock()
+    page.wait_for_url.side_effect = timing_out
+
+    with pytest.raises(PlaywrightTimeoutError):
+        waits.wait_for_url_change(page, "https://example.com/")
+    assert sleep_budget.records[0]["timed_out"]
+
+
+class ResponsePage:
+    """
+    A page whose expect_response() answers with the first of `responses`
+    matching the predicate, once the action ran.
+    """
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.actions = []
+
+    @contextmanager
+    def expect_response(self, predicate, timeout):
+        info = SimpleNamespace()
+        yield info
+        assert self.actions, "the response was awaited before the action ran"
+        matching = [response for response in self.responses if predicate(response)]
+        if not matching:
+            raise PlaywrightTimeoutError(f"Timeout {timeout}ms exceeded.")
+        info.value = matching[0]
+
+
+def response(url, resource_type="xhr"):
+    return SimpleNamespace(url=url, request=SimpleNamespace(url=url, resource_type=resource_type))
+
+
+def test_the_login_api_response_is_awaited_around_the_click(sleep_budget):
+    login = response("https://www.dogcatstar.com/wp-json/member/login")
+    page = ResponsePage([response("https://www.dogcatstar.com/logo.png", "image"), login])
+
+    waited = waits.wait_for_response(page, lambda r: is_login_api(r.request),
+                                     lambda: page.actions.append("click"))
+
+    assert waited is login
+    assert sleep_budget.records[0]["kind"] == "response"
+
+
+def test_a_login_api_that_never_answers_fails_the_step(sleep_budget):
+    page = ResponsePage([response("https://www.dogcatstar.com/logo.png", "image")])
+
+    with pytest.raises(PlaywrightTimeoutError):
+        waits.wait_for_response(page, lambda r: is_login_api(r.request),
+                                lambda: page.actions.append("click"), timeout=100)
+    assert sleep_budget.records[0]["timed_out"]
+
+
+def test_the_waits_of_a_step_share_its_deadline(sleep_budget, monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(waits.time, "monotonic", lambda: now[0])
+    locator = MagicMock()
+
+    waits.set_current_step("I fill the password", timeout=10000)
+    now[0] += 4
+    waits.wait_for_locator(locator)
+    now[0] += 5
+    waits.wait_for_locator(locator, timeout=5000)
+    now[0] += 2
+    waits.wait_for_locator(locator)
+
+    assert [call.kwargs["timeout"] for call in locator.wait_for.call_args_list] == [6000, 1000, 1]
+    waits.set_current_step(None)
+    assert waits.step_timeout() == waits.STEP_TIMEOUT
@@ -0,0 +1,56 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from web_perf import WebPerfCollector, check_budget, request_duration
+
+pytestmark = pytest.mark.offline
+
+
+def finished_request(url, resource_type="fetch", response_end=420.5, method="POST"):
+    return SimpleNamespace(url=url, resource_type=resource_type, method=method,
+                           timing={"startTime": 1700000000000, "responseEnd": response_end})
+
+
+def test_only_login_api_requests_are_recorded():
+    collector = WebPerfCollector()
+    collector.record_request(finished_request("https://www.dogcatstar.com/wp-json/otp/send"))
+    collector.record_request(finished_request("https://www.dogcatstar.com/api/login", response_end=95))
+    collector.record_request(finished_request("https://www.dogcatstar.com/app.js", "script"))
+    collector.record_request(finished_request("https://www.dogcatstar.com/wp-json/x",
+                                              response_end=-1))
+
+    assert [request["duration"] for request in collector.api_requests] == [420.5, 95]
+    assert collector.slowest_api_request()["url"].endswith("/wp-json/otp/send")
+    assert request_duration({"responseEnd": -1}) is None
+
+
+def test_budgets_fail_with_the_measured_value():
+    check_budget("LCP (ms)", 1800, 2500)
+    with pytest.raises(AssertionError, match=r"LCP \(ms\) is 2712, over the budget of 2500"):
+        check_budget("LCP (ms)", 2712.4, 2500)
+    with pytest.raises(AssertionError, match="layout shift score is 0.131"):
+        check_budget("layout shift score", 0.131, 0.1)
+    with pytest.raises(AssertionError, match="No INP"):
+        check_budget("INP", None, 200)
+
+
+def test_metrics_measurements_and_junit_properties():
+    collector = WebPerfCollector()
+    collector.update({"url": "https://www.dogcatstar.com/", "ttfb": 180.2, "lcp": 1320.0,
+                      "cls": 0.02, "inp": None, "long_tasks": 2, "tbt": 130})
+    with collector.measure("login modal"):
+        time.sleep(0.05)
+    collector.record_request(finished_request("https://www.dogcatstar.com/api/login"))
+
+    assert collector.metric("LCP") == 1320.0
+    assert collector.metric("Time to first byte") == 180.2
+    with pytest.raises(ValueError, match="Unknown web performance metric: FID"):
+        collector.metric("FID")
+    assert collector.measurements["login modal"] >= 50
+    properties = dict(collector.properties())
+    assert properties["web_perf_lcp"] == 1320.0
+    assert "web_perf_inp" not in properties and "web_perf_url" not in properties
+    assert properties["web_perf_login_modal_ms"] >= 50
+    assert properties["web_perf_slowest_api_ms"] == 420
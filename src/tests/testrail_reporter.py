@@ -0,0 +1,125 @@
+import os
+import queue
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), "..", "..", "scripts"))
+import testrail  # noqa: E402
+
+
+class BackgroundUploader:
+    """
+    Upload TestRail results from a background thread while the tests keep running.
+
+    Results are batched into add_results_for_cases requests of up to
+    `chunk_size`, flushed at least every `flush_interval` seconds. Uploaded
+    results go into the ledger, so a later `testrail.py` sync skips them.
+    """
+
+    def __init__(self, run_id, chunk_size=50, flush_interval=5.0, ledger=None):
+        self.run_id = run_id
+        self.chunk_size = chunk_size
+        self.flush_interval = flush_interval
+        self.ledger = ledger
+        self.uploaded = 0
+        self.failed = []
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(
+            target=self._run, name="testrail-uploader", daemon=True)
+        self._thread.start()
+
+    def put(self, result):
+        self._queue.put(result)
+
+    def close(self, timeout=120):
+        """
+        Flush what is queued and stop the thread.
+        """
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _run(self):
+        batch = []
+        flush_at = None
+        stopping = False
+        while not stopping:
+            wait = None if flush_at is None else max(0, flush_at - time.monotonic())
+            try:
+                result = self._queue.get(timeout=wait)
+            except queue.Empty:
+                result = False
+            if result is None:
+                stopping = True
+            elif result:
+                batch.append(result)
+                if flush_at is None:
+                    flush_at = time.monotonic() + self.flush_interval
+            if batch and (stopping or len(batch) >= self.chunk_size
+                          or time.monotonic() >= flush_at):
+                self._upload(batch)
+                batch = []
+                flush_at = None
+
+    def _upload(self, batch):
+        try:
+            accepted = testrail.add_results_for_cases(self.run_id, batch)
+        except Exception as e:
+            print(f"Failed to upload results to TestRail: {e}")
+            accepted = False
+        if not accepted:
+            self.failed.extend(batch)
+            return
+        self.uploaded += len(batch)
+        if self.ledger is not None:
+            self.ledger.record(self.run_id, batch)
+
+
+class TestRailReporter:
+    """
+    Report each test with a case_id marker to TestRail as soon as it finishes.
+
+    The status and comment match what `testrail.parse_pytest_results` builds
+    from results.xml: a failure in the test call marks it failed with the
+    failure text, anything else reports it passed, and the param id is the
+    "Login Info".
+    """
+
+    __test__ = False
+
+    def __init__(self, run_id, chunk_size=50, flush_interval=5.0, ledger=None):
+        self.uploader = BackgroundUploader(run_id, chunk_size, flush_interval, ledger)
+        self.failures = {}
+
+    def pytest_runtest_logreport(self, report):
+        # conftest copies the case_id marker into user_properties, which also
+        # reach the controller from pytest-xdist workers
+        case_id = dict(report.user_properties).get("case_id")
+        if case_id is None:
+            return
+        if report.when == "call" and report.failed:
+            self.failures[report.nodeid] = str(report.longrepr)
+        if report.when != "teardown":
+            return
+        test_name = report.nodeid.split("::")[-1]
+        failure_text = self.failures.pop(report.nodeid, None)
+        ledger = self.uploader.ledger
+        result = testrail.build_result(
+            test_name, failure_text, failure_text is not None, int(case_id))
+        if ledger is not None and (self.uploader.run_id, result) in ledger:
+            return
+        self.uploader.put(result)
+
+    def pytest_sessionfinish(self, session):
+        self.uploader.close()
+
+    def pytest_terminal_summary(self, terminalreporter):
+        terminalreporter.section("TestRail")
+        terminalreporter.write_line(
+            f"{self.uploader.uploaded} results uploaded to run_id {self.uploader.run_id}")
+        if self.uploader.failed:
+            terminalreporter.write_line(
+                f"{len(self.uploader.failed)} results were not uploaded; "
+                f"run `python scripts/testrail.py -run_id={self.uploader.run_id} -bulk` "
+                f"to retry them", red=True)
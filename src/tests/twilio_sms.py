@@ -0,0 +1,103 @@
+import os
+import re
+import time
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+
+from twilio.http import HttpClient
+from twilio.http.response import Response
+from twilio.rest import Client
+
+import http_client
+
+CODE_PATTERN = re.compile(r'\b\d{6}\b')
+# Twilio's date_sent has second precision and the clocks of this machine and Twilio may differ
+CLOCK_SKEW = http_client.CLOCK_SKEW
+
+# SIDs of messages whose code was already used in this process
+consumed_sids = set()
+
+
+class PooledTwilioHttpClient(HttpClient):
+    """
+    Twilio SDK transport that sends requests through the shared http_client,
+    so Twilio calls get a keep-alive session, retries and latency metrics.
+    """
+
+    def __init__(self, timeout=30):
+        super().__init__(None, False, timeout)
+
+    def request(self, method, url, params=None, data=None, headers=None, auth=None,
+                timeout=None, allow_redirects=False):
+        response = http_client.request(
+            method, url, params=params, data=data, headers=headers, auth=auth,
+            timeout=timeout or self.timeout, allow_redirects=allow_redirects)
+        return Response(response.status_code, response.text, response.headers)
+
+
+def make_twilio_client(account_sid, auth_token, base_url=None):
+    client = Client(account_sid, auth_token, http_client=PooledTwilioHttpClient())
+    if base_url:
+        client.api.base_url = base_url
+    return client
+
+
+@lru_cache(maxsize=None)
+def get_twilio_client():
+    """
+    The Twilio client for the configured account, created once per process.
+    TWILIO_API_BASE_URL points it at another API host, e.g. a local fake.
+    """
+    twilio_account_sid = os.getenv("TWILIO_ACCOUNT_SID")
+    twilio_auth_token = os.getenv("TWILIO_AUTH_TOKEN")
+
+    if not twilio_account_sid or not twilio_auth_token:
+        raise ValueError("Twilio credentials are not configured correctly.")
+    return make_twilio_client(twilio_account_sid, twilio_auth_token,
+                              os.getenv("TWILIO_API_BASE_URL"))
+
+
+def wait_for_sms_code(phone_info, requested_at=None, timeout=300, client=None,
+                      poll_interval=1.0, max_poll_interval=8.0, consumed=consumed_sids):
+    """
+    Poll Twilio until an SMS sent after `requested_at` carries a verification code and return it.
+
+    Messages whose code was already returned (tracked by SID in `consumed`)
+    are skipped, so a scenario never reuses an earlier scenario's code. The
+    oldest fresh message wins. Raises ValueError once `timeout` seconds pass.
+    """
+    client = client or get_twilio_client()
+    deadline = time.monotonic() + timeout
+    requested_at = requested_at or datetime.now(timezone.utc) - timedelta(minutes=5)
+    fresh_after = requested_at - CLOCK_SKEW
+
+    print(f"Phone info received: {phone_info}")
+    region_code = phone_info.get("region_code", "")
+    phone_number = phone_info.get("phone_number", "")
+
+    interval = poll_interval
+    while True:
+        messages = client.messages.list(
+            to=f"{region_code}{phone_number}",
+            date_sent_after=fresh_after,
+            limit=20
+        )
+        fresh = sorted(
+            (message for message in messages
+             if message.sid not in consumed
+             and message.date_sent and message.date_sent >= fresh_after),
+            key=lambda message: message.date_sent)
+        for message in fresh:
+            print(f"Message received: {message.body}")
+            match = CODE_PATTERN.search(message.body or "")
+            if match:
+                consumed.add(message.sid)
+                print(f"Verification code extracted: {match.group(0)}")
+                return match.group(0)
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise ValueError(
+                f"No verification code found in messages within {timeout} seconds.")
+        time.sleep(min(interval, remaining))
+        interval = min(interval * 1.5, max_poll_interval)
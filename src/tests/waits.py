@@ -0,0 +1,183 @@
+import time
+from contextlib import contextmanager
+
+from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
+
+# Milliseconds all the waits of one step may take together, matching the
+# context's default timeout
+STEP_TIMEOUT = 10000
+DOM_QUIET_MS = 300
+
+# Page scripts for wait_for_dom_settled: record the time of the last DOM
+# mutation, then check that none happened for `quietMs`
+OBSERVE_MUTATIONS_JS = """() => {
+    if (window.__dogcatMutationObserver) return;
+    window.__dogcatLastMutation = performance.now();
+    window.__dogcatMutationObserver = new MutationObserver(() => {
+        window.__dogcatLastMutation = performance.now();
+    });
+    window.__dogcatMutationObserver.observe(document, {
+        subtree: true, childList: true, attributes: true, characterData: true
+    });
+}"""
+DOM_QUIET_JS = "quietMs => performance.now() - window.__dogcatLastMutation >= quietMs"
+
+_current = None
+_finished = []
+# time.monotonic() by which the current step's waits must be done, None outside a step
+_step_deadline = None
+
+
+class SleepBudget:
+    """
+    Time one scenario spent waiting, broken down by step and kind of wait.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.step = None
+        self.records = []
+        self.started_at = time.monotonic()
+        self.finished_at = None
+
+    def record(self, kind, seconds, timed_out=False):
+        self.records.append(
+            dict(step=self.step, kind=kind, seconds=seconds, timed_out=timed_out))
+
+    @property
+    def total(self):
+        return sum(record["seconds"] for record in self.records)
+
+    @property
+    def wall(self):
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    def by_step(self):
+        steps = {}
+        for record in self.records:
+            steps[record["step"]] = steps.get(record["step"], 0) + record["seconds"]
+        return steps
+
+
+def start_budget(name):
+    global _current
+    _current = SleepBudget(name)
+    return _current
+
+
+def finish_budget():
+    global _current
+    budget = _current
+    _current = None
+    if budget:
+        budget.finished_at = time.monotonic()
+        _finished.append(budget)
+    return budget
+
+
+def set_current_step(name, timeout=STEP_TIMEOUT):
+    """
+    Start step `name`, whose waits share a deadline `timeout` milliseconds
+    away. None ends the step.
+    """
+    global _step_deadline
+    _step_deadline = None if name is None else time.monotonic() + timeout / 1000
+    if _current:
+        _current.step = name
+
+
+def step_timeout(timeout=None):
+    """
+    Milliseconds a wait may take: what is left of the current step's
+    deadline, capped at `timeout` when given. Outside a step, `timeout` or
+    STEP_TIMEOUT.
+    """
+    if _step_deadline is None:
+        return STEP_TIMEOUT if timeout is None else timeout
+    # At least 1 ms: Playwright reads a timeout of 0 as no timeout at all
+    left = max(1, round((_step_deadline - time.monotonic()) * 1000))
+    return left if timeout is None else min(timeout, left)
+
+
+def finished_budgets():
+    return list(_finished)
+
+
+@contextmanager
+def _timed(kind):
+    started = time.monotonic()
+    timed_out = False
+    try:
+        yield
+    except PlaywrightTimeoutError:
+        timed_out = True
+        raise
+    finally:
+        if _current:
+            _current.record(kind, time.monotonic() - started, timed_out)
+
+
+def wait_for_locator(locator, state="visible", timeout=None):
+    """
+    Wait until the locator reaches `state` ("attached", "detached", "visible" or "hidden").
+    """
+    with _timed(f"locator:{state}"):
+        locator.wait_for(state=state, timeout=step_timeout(timeout))
+    return locator
+
+
+def is_shown_within(locator, timeout=None):
+    """
+    True when the locator becomes visible before the deadline, False otherwise.
+    """
+    try:
+        wait_for_locator(locator, "visible", timeout)
+        return True
+    except PlaywrightTimeoutError:
+        return False
+
+
+def wait_for_url_change(page, previous_url, timeout=None):
+    with _timed("url"):
+        page.wait_for_url(lambda url: url != previous_url, timeout=step_timeout(timeout))
+
+
+def wait_for_response(page, url_or_predicate, action, timeout=None):
+    """
+    Run `action` and wait for the network response it triggers. Returns the response.
+    """
+    with _timed("response"):
+        with page.expect_response(url_or_predicate,
+                                  timeout=step_timeout(timeout)) as response_info:
+            action()
+        return response_info.value
+
+
+def wait_for_load(page, state="domcontentloaded", timeout=None):
+    with _timed(f"load:{state}"):
+        page.wait_for_load_state(state, timeout=step_timeout(timeout))
+
+
+def wait_for_dom_settled(page, quiet_ms=DOM_QUIET_MS, timeout=None):
+    """
+    Wait until the DOM has had no mutations for `quiet_ms`, e.g. after a modal animates in.
+
+    Best effort: a page that never stops mutating (a carousel, a spinner) is
+    given up on when the step's time runs out, recorded as timed out in the sleep budget.
+    Returns whether the DOM settled.
+    """
+    try:
+        with _timed("dom"):
+            page.evaluate(OBSERVE_MUTATIONS_JS)
+            page.wait_for_function(DOM_QUIET_JS, arg=quiet_ms, timeout=step_timeout(timeout))
+        return True
+    except PlaywrightTimeoutError:
+        return False
+
+
+def sleep(page, milliseconds):
+    """
+    A deliberate fixed wait, e.g. to let a session expire. Counted in the sleep budget.
+    """
+    with _timed("sleep"):
+        page.wait_for_timeout(milliseconds)
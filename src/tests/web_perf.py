@@ -0,0 +1,161 @@
+import re
+import time
+from contextlib import contextmanager
+
+# Buffered observers, so entries from before the script ran are delivered too.
+# Installed as an init script and again before collecting, which is a no-op
+# when they are already running. INP is the longest interaction, which is what
+# the metric reports for pages with fewer than 50 interactions.
+OBSERVE_JS = """
+() => {
+    if (window.__dogcatPerf) return;
+    const perf = window.__dogcatPerf = {lcp: null, cls: 0, inp: null, longTasks: []};
+    const observe = (type, callback, options = {}) => {
+        try {
+            new PerformanceObserver(list => list.getEntries().forEach(callback))
+                .observe({type, buffered: true, ...options});
+        } catch (e) {}
+    };
+    observe('largest-contentful-paint', entry => { perf.lcp = entry.startTime; });
+    observe('layout-shift', entry => { if (!entry.hadRecentInput) perf.cls += entry.value; });
+    observe('event', entry => {
+        if (entry.interactionId) perf.inp = Math.max(perf.inp || 0, entry.duration);
+    }, {durationThreshold: 16});
+    observe('longtask', entry => {
+        perf.longTasks.push({start: entry.startTime, duration: entry.duration});
+    });
+}
+"""
+
+# Navigation Timing and the observed metrics, in milliseconds from navigation start
+COLLECT_JS = """
+async () => {
+    await new Promise(resolve => setTimeout(resolve, 50));
+    const perf = window.__dogcatPerf || {};
+    const navigation = performance.getEntriesByType('navigation')[0];
+    return {
+        url: location.href,
+        ttfb: navigation ? navigation.responseStart : null,
+        dom_content_loaded: navigation ? navigation.domContentLoadedEventEnd : null,
+        load: navigation && navigation.loadEventEnd ? navigation.loadEventEnd : null,
+        lcp: perf.lcp ?? null,
+        cls: perf.cls ?? null,
+        inp: perf.inp ?? null,
+        long_tasks: (perf.longTasks || []).length,
+        tbt: (perf.longTasks || []).reduce((total, task) => total + Math.max(0, task.duration - 50), 0),
+    };
+}
+"""
+
+# The site's own API calls made while logging in (XHR/fetch only)
+LOGIN_API_PATTERN = re.compile(r"/(wp-json|api|graphql)/|/(login|otp|verify|token)\b")
+
+# Names feature files use for the metrics of COLLECT_JS
+METRIC_NAMES = {
+    "ttfb": "ttfb",
+    "time to first byte": "ttfb",
+    "domcontentloaded": "dom_content_loaded",
+    "load": "load",
+    "lcp": "lcp",
+    "largest contentful paint": "lcp",
+    "inp": "inp",
+    "interaction to next paint": "inp",
+    "tbt": "tbt",
+    "total blocking time": "tbt",
+}
+
+
+def request_duration(timing):
+    """
+    Milliseconds from the start of a request to the end of its response, from Playwright's
+    `request.timing` (-1 marks phases that did not happen).
+    """
+    if timing.get("responseEnd", -1) < 0:
+        return None
+    return timing["responseEnd"]
+
+
+def check_budget(name, value, budget):
+    """
+    Fail the step when `value` (milliseconds or a score) is over `budget`.
+    """
+    assert value is not None, f"No {name} was measured on this page."
+    assert value <= budget, f"{name} is {value:.4g}, over the budget of {budget:g}"
+
+
+def is_login_api(request, api_pattern=LOGIN_API_PATTERN):
+    """
+    Whether `request` is one of the site's login API calls.
+    """
+    return request.resource_type in ("xhr", "fetch") and bool(api_pattern.search(request.url))
+
+
+class WebPerfCollector:
+    """
+    Web performance of the scenario's page: Navigation Timing, LCP, CLS, INP
+    and long tasks from the page's PerformanceObservers, the durations of the
+    login API requests, and timings measured by the steps themselves.
+
+    The page is sampled with `collect()`; the latest sample is in `metrics`.
+    """
+
+    def __init__(self, api_pattern=LOGIN_API_PATTERN):
+        self.api_pattern = api_pattern
+        self.metrics = {}
+        self.measurements = {}
+        self.api_requests = []
+
+    def record_request(self, request):
+        if not is_login_api(request, self.api_pattern):
+            return
+        duration = request_duration(request.timing)
+        if duration is not None:
+            self.api_requests.append(dict(method=request.method, url=request.url,
+                                          duration=duration))
+
+    def metric(self, name):
+        """
+        The metric of COLLECT_JS a feature file calls `name`, e.g. "LCP".
+        """
+        try:
+            return self.metrics[METRIC_NAMES[name.lower()]]
+        except KeyError:
+            raise ValueError(f"Unknown web performance metric: {name}") from None
+
+    def install(self, page):
+        page.add_init_script(f"({OBSERVE_JS})()")
+        page.on("requestfinished", self.record_request)
+
+    def collect(self, page):
+        page.evaluate(OBSERVE_JS)
+        self.update(page.evaluate(COLLECT_JS))
+        return self.metrics
+
+    def update(self, sample):
+        self.metrics = sample
+
+    @contextmanager
+    def measure(self, name):
+        """
+        Record how many milliseconds the block took under `name`.
+        """
+        started = time.monotonic()
+        yield
+        self.measurements[name] = (time.monotonic() - started) * 1000
+
+    def slowest_api_request(self):
+        return max(self.api_requests, key=lambda request: request["duration"], default=None)
+
+    def properties(self):
+        """
+        JUnit properties of what was collected.
+        """
+        properties = [(f"web_perf_{name}", round(value, 3)) for name, value in self.metrics.items()
+                      if isinstance(value, (int, float)) and not isinstance(value, bool)]
+        properties += [(f"web_perf_{name.replace(' ', '_')}_ms", round(value))
+                       for name, value in self.measurements.items()]
+        slowest = self.slowest_api_request()
+        if slowest:
+            properties.append(("web_perf_api_requests", len(self.api_requests)))
+            properties.append(("web_perf_slowest_api_ms", round(slowest["duration"])))
+        return properties